@@ -8,108 +8,22 @@
 
 from datetime import datetime
 import functions as fns
+import rolling
+import alignment
+import price_cache
+import regime
+import kalman
+import sessions
+import mean_reversion
+import instrumentation
+from signals import find_special_points
 import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 # render plotly in browser
 import plotly.io as pio
 pio.renderers.default = 'browser'
 
-def find_special_points(
-        distances, 
-        regressionThreshold, 
-        distanceThreshold,
-        forwardCounts=5,
-        ):
-    """
-    Find the data points where there is a significant deviation from the regression line. 
-    Then find out if the next data point is closer to zero or crosses the zero line or move further away
-    from the regression line.
-
-    Find data points that meet the specified conditions:
-    1. Data point is outside the threshold range.
-    2. The next data point is closer to zero or crosses the zero line.
-
-    Parameters:
-        data (np.ndarray): Input signal array.
-        threshold (float): Threshold value for detecting out-of-bound points.
-
-    Returns:
-        list of tuple: Indices of points and their values that meet the conditions.
-    """
-    winPoints = []
-    lossPoints = []
-    winTrades = 0
-    lossTrades = 0
-    inTrade = [False] * len(distances)
-
-    def compare(next_dist, factor, mode):
-        if mode=='TP':
-            return next_dist < current_dist * (1-factor) if current_dist > 0 else next_dist > current_dist * (1-factor)
-        elif mode=='SL':
-            return next_dist > current_dist * (1+factor) if current_dist > 0 else next_dist < current_dist * (1+factor)
-    
-    for i in range(len(distances) - forwardCounts):
-        # Condition 1: Check if the data point is outside the threshold area
-        if (distances[i] > regressionThreshold or distances[i] < -regressionThreshold) and not inTrade[i]:
-            inTrade[i] = True
-            
-            # Condition 2: Check if the next data point is closer to zero or crosses the zero line
-            current_dist = distances[i]
-            next_dists = [distances[i+j] for j in range(1, forwardCounts)]
-
-            # Calculate conditions for Take Profit (TP) and Stop Loss (SL)
-            conds_tp = [compare(next_dist, distanceThreshold, 'TP') for next_dist in next_dists]
-            conds_sl = [compare(next_dist, distanceThreshold, 'SL') for next_dist in next_dists]
-
-            # find the first True value in condTP and condSL
-            i_TP = next((i for i, x in enumerate(conds_tp) if x), None)
-            i_SL = next((i for i, x in enumerate(conds_sl) if x), None)
-
-
-            condTP = False
-            condSL = False
-            if i_TP is None and i_SL is None:
-                continue
-            elif i_SL is None:
-                condTP = True
-            elif i_TP is None:
-                condSL = True
-            else:
-                condTP = True if i_TP < i_SL else False
-                condSL = True if i_SL < i_TP else False
-
-            if condTP:
-                winPoints.append((i, distances[i], distances[i + 1]))  # (index, current value, next value)
-                inTrade[i:i + i_TP + 1] = [True] * (i_TP + 1)
-
-                if distances[i] > 0:
-                    # buy the first asset and sell the second asset
-                    if data['close_0'].iloc[i+1] > data['close_0'].iloc[i]:
-                        winTrades += 1
-                    else:
-                        lossTrades += 1 
-                    if data['close_1'].iloc[i+1] < data['close_1'].iloc[i]:
-                        winTrades += 1
-                    else:
-                        lossTrades += 1
-                
-                if distances[i] < 0:
-                    # sell the first asset and buy the second asset
-                    if data['close_0'].iloc[i+1] < data['close_0'].iloc[i]:
-                        winTrades += 1
-                    else:
-                        lossTrades += 1 
-                    if data['close_1'].iloc[i+1] > data['close_1'].iloc[i]:
-                        winTrades += 1
-                    else:
-                        lossTrades += 1
-
-            elif condSL:
-                lossPoints.append((i, distances[i], distances[i + 1]))
-                inTrade[i:i + i_SL + 1] = [True] * (i_SL + 1)
-
-    return winPoints, lossPoints, winTrades, lossTrades
-
 #%% CONSTANTS
 symbol = ['EURUSD', 'GBPUSD']
 timeframe = "D1"
@@ -123,79 +37,159 @@ endTime = datetime(        # in LONDON time
 )
 Nbars = 1000
 LoopbackBars = 20
+source = 'MT5'          # 'MT5', 'yfinance', 'file' (local CSV/Parquet in data/) or 'synthetic'
 
-regressionThreshold = 0.005
+regressionThreshold = 0.005    # in units of the distance mode (e.g. ~2 for zscore)
 distanceThreshold = 0.9
+distanceMode = 'perpendicular'  # 'perpendicular', 'vertical' or 'zscore' (see rolling.rolling_distances)
 
 fitReturns = True       # if True, the linear regression is calculated on the closing prices, otherwise on the returns
+hedgeModel = 'ols'      # 'ols' (rolling regression over LoopbackBars) or 'kalman' (dynamic hedge ratio, see kalman.py)
+kalmanDelta = 1e-4      # adaptation speed of the Kalman hedge ratio
+stableRegression = False    # if True, use the Welford-style rolling regression (for long M1 histories)
+alignPolicy = 'drop'    # 'drop' or 'ffill': how bars missing in one of the symbols are handled
+compactColumns = False  # if True, keep only time/OHLC as float32/int64 arrays (long M1 histories) and report the memory
+useCache = True         # if True, the bars are loaded from the local price cache (only missing bars are downloaded)
+
+useRegimes = False      # if True, fit an HMM on the pair features and only enter in the allowed regimes
+regimeStates = 3        # number of HMM regimes (sorted by volatility: 0 is the calmest)
+allowedRegimes = [0]    # regimes in which new trades are opened
+
+tradingSessions = None  # e.g. ['London', 'NewYork'] (see sessions.SESSIONS, server hours as in the EA), None: all sessions
+excludedWeekdays = []   # e.g. ['Fri']: no new trades on these days (server time)
+
+statsWindow = 200       # window of the rolling mean-reversion statistics (zero-crossing rate, half-life, Hurst)
+maxHalfLife = None      # e.g. 50: only enter when the rolling half-life of the distance is below it (bars)
+minZeroCrossingRate = None  # e.g. 0.3: only enter when the rolling zero-crossing rate of the distance is above it
+
+metricsFile = None      # e.g. 'metrics.jsonl' (or '.prom' for a Prometheus text file): stage timings and counters
 
 figRegression = False
 showDistancesOnCorrelationPlot = False
 figCandles = True
+plotMaxPoints = 4000    # pixel budget of the charts: longer histories are downsampled (None: plot every bar)
+
+#%% INSTRUMENTATION
+if metricsFile is not None:
+    instrumentation.enable(
+        instrumentation.PrometheusExporter(metricsFile) if metricsFile.endswith('.prom')
+        else instrumentation.JsonLinesExporter(metricsFile)
+        )
 
 #%% GET PRICE DATA
-data0_raw = fns.GetPriceData(symbol[0], endTime, timeframe, Nbars+LoopbackBars)
-data1_raw = fns.GetPriceData(symbol[1], endTime, timeframe, Nbars+LoopbackBars)
-# only copy the time and log return columns to data0
-data0 = data0_raw[['time', 'log_return', 'open', 'high', 'low', 'close']]
-data1 = data1_raw[['time', 'log_return', 'open', 'high', 'low', 'close']]
-
-# remove two last columns
-# data0 = data0.drop(data0.columns[-3:], axis=1)
-data0.columns = [f"{col}_0" for col in data0.columns]
-
-# remove two last columns
-# data1 = data1.drop(data1.columns[-3:], axis=1)
-data1.columns = [f"{col}_1" for col in data1.columns]
-
-data = data0.join(data1)
-# remove the time1 column
-data = data.drop('time_1', axis=1)
-# rename the time0 column to time
-data = data.rename(columns={'time_0': 'time'})
+getPriceData = price_cache.GetPriceDataCached if useCache else fns.GetPriceData
+data0_raw = getPriceData(symbol[0], endTime, timeframe, Nbars+LoopbackBars, source=source, compact=compactColumns)
+data1_raw = getPriceData(symbol[1], endTime, timeframe, Nbars+LoopbackBars, source=source, compact=compactColumns)
+# dtype of the price and derived columns
+floatType = np.float32 if compactColumns else np.float64
+
+# align the two series on their timestamps: bars missing in one of them are dropped
+# (alignPolicy = 'drop') or forward-filled from the previous bar (alignPolicy = 'ffill')
+data = pd.DataFrame(alignment.align_series(
+    [data0_raw, data1_raw], 
+    columns=['open', 'high', 'low', 'close'], 
+    policy=alignPolicy,
+    dtype=floatType,
+    ), copy=False)
+# log returns of the aligned closes, computed in float64 (a float32 ratio of two close prices
+# loses most of the digits of a small return) and stored as floatType
+for k in range(2):
+    logClose = np.log(data[f'close_{k}'].to_numpy(dtype=np.float64))
+    data[f'log_return_{k}'] = np.concatenate(([np.nan], np.diff(logClose))).astype(floatType, copy=False)
+
+# candles of each symbol (for plotting)
+data0 = data[['time', 'open_0', 'high_0', 'low_0', 'close_0']].rename(columns=lambda col: col.removesuffix('_0'))
+data1 = data[['time', 'open_1', 'high_1', 'low_1', 'close_1']].rename(columns=lambda col: col.removesuffix('_1'))
+
 # drop nan values
 data = data.dropna()
 
 #%% LINEAR REGRESSION
 
-# calculate the linear regression and the R2 value
-line = [np.polyfit(data['log_return_0'][i:i+LoopbackBars], data['log_return_1'][i:i+LoopbackBars], 1) for i in range(1,Nbars)]
-# populate the slope and intercept columns of the data
-
-# create data['slope'] and data['intercept'] columns and populate the values
-slope = np.array([l[0] for l in line])
-intercept = np.array([l[1] for l in line])
-r2 = [np.corrcoef(data['log_return_0'][i:i+LoopbackBars], data['log_return_1'][i:i+LoopbackBars])[0, 1] ** 2 for i in range(1,Nbars)]
-
-data['slope'] = np.zeros_like(data['log_return_0'])*np.nan
-data['intercept'] = np.zeros_like(data['log_return_0'])*np.nan
-data['r2'] = np.zeros_like(data['log_return_0'])*np.nan
-data['slope'][LoopbackBars:] = slope
-data['intercept'][LoopbackBars:] = intercept
-data['r2'][LoopbackBars:] = r2
+# calculate the linear regression, the R2 value and the distances of all the modes
+# for every window in one pass (the modes share the same window sums)
+stats = rolling.rolling_distances(
+    data['log_return_0'].to_numpy(), 
+    data['log_return_1'].to_numpy(), 
+    LoopbackBars,
+    spread=(data['close_0'] - data['close_1']).to_numpy(),
+    stable=stableRegression,
+    )
+if hedgeModel == 'kalman':
+    # slope and intercept from the Kalman filter (O(1) per bar, reacts faster than the window);
+    # the z-score mode still uses the rolling close spread
+    hedge = kalman.kalman_hedge(data['log_return_0'].to_numpy(), data['log_return_1'].to_numpy(), delta=kalmanDelta)
+    stats['slope'], stats['intercept'] = hedge['slope'], hedge['intercept']
+    stats['perpendicular'] = rolling.perpendicular_distance(
+        data['log_return_0'].to_numpy(), data['log_return_1'].to_numpy(), hedge['slope'], hedge['intercept'])
+    stats['vertical'] = hedge['spread']
+# the first window starts at bar 1, so the first LoopbackBars bars have no regression
+for values in stats.values():
+    values[:LoopbackBars] = np.nan
+
+data['slope'] = stats['slope'].astype(floatType, copy=False)
+data['intercept'] = stats['intercept'].astype(floatType, copy=False)
+data['r2'] = stats['r2'].astype(floatType, copy=False)
+for mode in rolling.DISTANCE_MODES:
+    data[f'distance_{mode}'] = stats[mode].astype(floatType, copy=False)
 
 # drop na values
 data = data.dropna()
 
-
-# calculate the distances of the data points from the regression line
-data['distance'] = np.zeros_like(data['log_return_0']) * np.nan
-# Calculate the distances of the data points from the regression line without using a loop
-x = data['log_return_0']
-y = data['log_return_1']
-a = data['slope']
-b = data['intercept']
-
-distances = -(a * x - y + b) / np.sqrt(a**2 + 1)
-# distances = np.where(y > a * x + b, distances, -distances)
-
-data['distance'][LoopbackBars+1:] = distances[LoopbackBars+1:]
+# distance of the selected mode; perpendicular distance of the data points from the regression line:
+# distance = -(a * x - y + b) / np.sqrt(a**2 + 1)
+distances = data[f'distance_{distanceMode}'].to_numpy().copy()
+distances[:LoopbackBars+1] = np.nan
+data['distance'] = distances
 
 # if distance is positive, then the first asset is undervalued (or the second is overvalued), which means:
 # Buy the first asset and sell the second asset
 # if distance is negative, then the first asset is overvalued (or the second is undervalued), which means: 
 # Sell the first asset and buy the second asset
 
+#%% REGIMES
+# per-bar regime labels of an HMM on (distance, volatility, r2); the fitted models are cached on
+# disk and refined from the previous model when new bars are added
+entryMask = None
+if useRegimes:
+    features = regime.regime_features(data, LoopbackBars)
+    regimeModel = regime.fit_regimes(
+        features, 
+        data['time'], 
+        name=f'{symbol[0]}_{symbol[1]}_{timeframe}', 
+        n_states=regimeStates,
+        feature_settings={'distanceMode': distanceMode, 'hedgeModel': hedgeModel, 'LoopbackBars': LoopbackBars},
+        )
+    # Viterbi path for the plots; the entries are gated by the causal (forward filtered) labels
+    data['hidden_state'] = regimeModel.labels(features)
+    entryMask = np.isin(regimeModel.filtered_labels(features), allowedRegimes)[LoopbackBars+1:]
+    data0['hidden_state'] = data['hidden_state'].reindex(data0.index, fill_value=-1)
+
+#%% SESSIONS
+# bit-packed session/weekday masks of the aligned bars, combined into the entry gate
+if tradingSessions is not None or excludedWeekdays:
+    sessionMasks = sessions.session_masks(data['time'])
+    sessionMask = sessions.combine_masks(sessionMasks, tradingSessions, excludedWeekdays)[LoopbackBars+1:]
+    entryMask = sessionMask if entryMask is None else entryMask & sessionMask
+
+#%% MEAN-REVERSION STATISTICS
+# rolling zero-crossing rate and half-life of the distance, only computed for the entry filters
+if maxHalfLife is not None or minZeroCrossingRate is not None:
+    meanReversionStats = mean_reversion.mean_reversion_stats(
+        data['distance'].to_numpy(dtype=np.float64), 
+        statsWindow, 
+        )
+    for name, values in meanReversionStats.items():
+        data[name] = values.astype(floatType)
+    # comparisons with NaN (warm-up, windows with a NaN distance, not reverting) are False: no entry
+    statsMask = np.ones(len(data), dtype=bool)
+    if maxHalfLife is not None:
+        statsMask &= meanReversionStats['half_life'] < maxHalfLife
+    if minZeroCrossingRate is not None:
+        statsMask &= meanReversionStats['zero_crossing_rate'] > minZeroCrossingRate
+    statsMask = statsMask[LoopbackBars+1:]
+    entryMask = statsMask if entryMask is None else entryMask & statsMask
+
 # calculate zero-crossing rate of the distances
 zero_crossings = np.sum(np.diff(np.sign(data['distance'][LoopbackBars+1:])) != 0)
 zcr = zero_crossings / (sum(~np.isnan(data['distance'])) - 1)  # Normalized by the number of intervals
@@ -204,6 +198,8 @@ zcr = zero_crossings / (sum(~np.isnan(data['distance'])) - 1)  # Normalized by t
 # print(f"slope: {slope:.5f}, intercept: {intercept:.5f}")
 # print(f"R2: {r2:.1%}")
 print(f"Zero-crossing rate: {zcr:.1%}")
+print(f"Memory: raw bars {(fns.memory_footprint(data0_raw) + fns.memory_footprint(data1_raw)) / 2**20:.1f} MB, "
+      f"pair data {fns.memory_footprint(data) / 2**20:.1f} MB")
 
 #%% PLOTTING THE RESULTS
 # if figRegression:
@@ -274,7 +270,15 @@ print(f"Zero-crossing rate: {zcr:.1%}")
 if figCandles:
     distances = np.array(data['distance'][LoopbackBars+1:])
     # if distances outside the threshold area and the next distances is closer to zero than the previous one, then mark the point
-    winPoints, lossPoints, winTrades, lossTrades = find_special_points(distances, regressionThreshold, distanceThreshold)
+    # the closes are sliced like the distances: the legs are scored from the entry bar to the next one
+    winPoints, lossPoints, winTrades, lossTrades = find_special_points(
+        distances, 
+        data['close_0'].to_numpy()[LoopbackBars+1:], 
+        data['close_1'].to_numpy()[LoopbackBars+1:], 
+        regressionThreshold, 
+        distanceThreshold,
+        entryMask=entryMask,
+        )
     winPoints = np.array(winPoints)
     lossPoints = np.array(lossPoints)
 
@@ -288,12 +292,10 @@ if figCandles:
     indicesLossNeg = indicesLoss[distances[indicesLoss] < 0] if len(lossPoints) > 0 else []
 
     # plot the candlesticks
-    data0.columns = [f"{col[:-2]}" for col in data0.columns]
-    data1.columns = [f"{col[:-2]}" for col in data1.columns]
-    figCandles = fns.plot_candlesticks(data0[LoopbackBars:],data1[LoopbackBars:], titles=symbol)
+    figCandles = fns.plot_candlesticks(data0[LoopbackBars:],data1[LoopbackBars:], titles=symbol, show_states=useRegimes, max_points=plotMaxPoints)
     
     # add win and loss points
-    figCandles.add_trace(go.Scatter(
+    figCandles.add_trace(go.Scattergl(
         x = data['time'][LoopbackBars+1:].iloc[indicesWinPos],
         y = data['low_0'][LoopbackBars+1:].iloc[indicesWinPos],
         mode = 'markers',
@@ -302,7 +304,7 @@ if figCandles:
         name = 'Buy Points',
         showlegend=False,
     ), row=1, col=1)
-    figCandles.add_trace(go.Scatter(
+    figCandles.add_trace(go.Scattergl(
         x = data['time'][LoopbackBars+1:].iloc[indicesWinNeg],
         y = data['high_0'][LoopbackBars+1:].iloc[indicesWinNeg],
         mode = 'markers',
@@ -310,7 +312,7 @@ if figCandles:
         name = 'Sell Points',
         showlegend=False,
     ), row=1, col=1)
-    figCandles.add_trace(go.Scatter(
+    figCandles.add_trace(go.Scattergl(
         x = data['time'][LoopbackBars+1:].iloc[indicesWinPos],
         y = data['high_1'][LoopbackBars+1:].iloc[indicesWinPos],
         mode = 'markers',
@@ -318,7 +320,7 @@ if figCandles:
         name = 'Sell Points',
         showlegend=False,
     ), row=2, col=1)
-    figCandles.add_trace(go.Scatter(
+    figCandles.add_trace(go.Scattergl(
         x = data['time'][LoopbackBars+1:].iloc[indicesWinNeg],
         y = data['low_1'][LoopbackBars+1:].iloc[indicesWinNeg],
         mode = 'markers',
@@ -327,20 +329,21 @@ if figCandles:
         showlegend=False,
     ), row=2, col=1)
 
-    # Distance plot
-    figCandles.add_trace(go.Scatter(
-        x = data['time'][LoopbackBars+1:],
-        y = distances,
+    # Distance plot (min/max downsampled to the pixel budget)
+    plotted = fns.downsample_minmax(distances, plotMaxPoints)
+    figCandles.add_trace(go.Scattergl(
+        x = data['time'][LoopbackBars+1:].iloc[plotted],
+        y = distances[plotted],
         mode = 'lines',
         name = 'Distances',
         # set the color of the line
         line = dict(color='black', width=1),
     ), row=3, col=1)
 
-    # add zero line
-    figCandles.add_trace(go.Scatter(
-        x = data['time'][LoopbackBars:],
-        y = np.zeros_like(distances),
+    # add zero line (its two ends are enough)
+    figCandles.add_trace(go.Scattergl(
+        x = data['time'][LoopbackBars:].iloc[[0, -1]],
+        y = [0, 0],
         mode = 'lines',
         name = 'Zero Line',
         line = dict(color='red', width=1, dash='dash'),
@@ -361,14 +364,14 @@ if figCandles:
         row=3, col=1
     )
 
-    figCandles.add_trace(go.Scatter(
+    figCandles.add_trace(go.Scattergl(
         x = data['time'][LoopbackBars+1:].iloc[indicesWin],
         y = distances[indicesWin],
         mode = 'markers',
         marker = dict(size=5, color='green'),
         name = 'Arbitrage Points (positive)',
     ), row=3, col=1)
-    figCandles.add_trace(go.Scatter(
+    figCandles.add_trace(go.Scattergl(
         x = data['time'][LoopbackBars+1:].iloc[indicesLoss],
         y = distances[indicesLoss],
         mode = 'markers',
@@ -390,3 +393,5 @@ if figCandles:
     )
     # figCandles.show()
     figCandles.write_html('candles.html', auto_open=True)
+
+instrumentation.disable()
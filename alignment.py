@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import instrumentation
+
+ALIGN_POLICIES = ('drop', 'ffill')
+
+
+def _time_values(series):
+    """Bar times of a DataFrame/dict as int64 nanoseconds (a view, no copy, for datetime64[ns])."""
+    time = series['time']
+    if isinstance(time, pd.Series):
+        if time.dt.tz is not None:
+            time = time.dt.tz_localize(None)
+        time = time.to_numpy(dtype='datetime64[ns]')
+    time = np.asarray(time)
+    if time.dtype.kind == 'M':
+        time = time.astype('datetime64[ns]', copy=False).view(np.int64)
+    return time
+
+
+def _column_values(series, column):
+    values = series[column]
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    return np.asarray(values)
+
+
+def _sorted_unique(time):
+    """Positions that sort `time` and drop duplicated bars (the last one is kept), or None if
+    the times are already strictly increasing."""
+    if len(time) < 2 or (time[1:] > time[:-1]).all():
+        return None
+    order = np.argsort(time, kind='stable')
+    keep = np.append(time[order][1:] != time[order][:-1], True)
+    return order[keep]
+
+
+def _union_sorted(a, b):
+    """Union of two strictly increasing arrays. Only the values of b missing in a are appended,
+    and the stable sort (timsort) merges the two sorted runs in linear time."""
+    if len(a) == 0:
+        return b
+    pos = np.searchsorted(a, b)
+    pos[pos == len(a)] = len(a) - 1
+    new = b[a[pos] != b]
+    return np.sort(np.concatenate((a, new)), kind='stable')
+
+
+@instrumentation.instrumented('align')
+def align_series(
+        series,
+        columns = ['open', 'high', 'low', 'close'],
+        policy = 'drop',
+        dtype = np.float64,
+        ):
+    """
+    Align two (or more) price series on their timestamps with a sorted-array merge.
+
+    policy='drop' keeps only the bars that exist in every series (inner join), policy='ffill'
+    keeps the bars of any series and forward-fills the missing bars of the others from their
+    previous bar (the bars before every series has started are dropped).
+    Only the requested columns are gathered, each directly into its output array.
+
+    Parameters:
+        series (list): DataFrames (or dicts of arrays) with a `time` column, e.g. GetPriceData outputs.
+        columns (list of str): Columns taken from every series.
+        policy (str): 'drop' or 'ffill'.
+        dtype: Dtype of the output columns (np.float32 for the compact mode).
+
+    Returns:
+        dict of np.ndarray: 'time' (datetime64[ns]) and `<column>_<k>` for the k-th series,
+        as contiguous arrays of `dtype`.
+    """
+    if policy not in ALIGN_POLICIES:
+        raise ValueError(f"Unknown alignment policy: {policy} (available: {ALIGN_POLICIES})")
+
+    times = []
+    orders = []
+    for s in series:
+        time = _time_values(s)
+        order = _sorted_unique(time)
+        times.append(time if order is None else time[order])
+        orders.append(order)
+
+    if policy == 'drop':
+        # bars of the first series that exist in all the others
+        time = times[0]
+        keep = np.ones(len(time), dtype=bool)
+        positions = [np.arange(len(time))]
+        for t in times[1:]:
+            pos = np.searchsorted(t, time)
+            pos[pos == len(t)] = len(t) - 1 if len(t) else 0
+            if len(t):
+                keep &= t[pos] == time
+            else:
+                keep[:] = False
+            positions.append(pos)
+        time = time[keep]
+        positions = [pos[keep] for pos in positions]
+    else:
+        time = times[0]
+        for t in times[1:]:
+            time = _union_sorted(time, t)
+        # last bar at or before every time
+        positions = [np.searchsorted(t, time, side='right') - 1 for t in times]
+        started = np.ones(len(time), dtype=bool)
+        for pos in positions:
+            started &= pos >= 0
+        time = time[started]
+        positions = [pos[started] for pos in positions]
+
+    instrumentation.count('bars_aligned', len(time))
+    aligned = {'time': time.view('datetime64[ns]')}
+    for k, (s, order, pos) in enumerate(zip(series, orders, positions)):
+        if order is not None:
+            pos = order[pos]
+        for column in columns:
+            aligned[f'{column}_{k}'] = np.ascontiguousarray(_column_values(s, column)[pos], dtype=dtype)
+    return aligned
@@ -0,0 +1,269 @@
+import numpy as np
+
+RISK_OPTIONS = ('Constant', 'ATR', 'Regression')
+
+# exit reasons of the ledger
+EXIT_TP = 1
+EXIT_SL = -1
+EXIT_TIME = 0       # maxBars reached or end of the data
+
+
+def _column(data, name):
+    return np.ascontiguousarray(data[name], dtype=np.float64)
+
+
+def _pair(value):
+    """Per-symbol parameter: a scalar (same for both legs) or a (leg0, leg1) pair."""
+    if np.ndim(value) == 0:
+        return (value, value)
+    return tuple(value)
+
+
+def _first_exit(side, start, stop, sl, tp, open_, high, low, spread):
+    """
+    First bar in [start, stop) where the SL or TP of a position is hit (SL first if both are hit
+    in the same bar) and the fill price. Longs exit at the bid, shorts at the ask (bid + spread).
+    The bars are scanned in growing windows, so short trades only touch a few bars.
+
+    Returns:
+        (bar, price, reason), or (None, None, None) if neither is hit.
+    """
+    size = 64
+    while start < stop:
+        end = min(start + size, stop)
+        if side > 0:
+            hit_sl = low[start:end] <= sl
+            hit_tp = high[start:end] >= tp
+        else:
+            hit_sl = high[start:end] + spread[start:end] >= sl
+            hit_tp = low[start:end] + spread[start:end] <= tp
+        hit = hit_sl | hit_tp
+        if hit.any():
+            k = int(np.argmax(hit))
+            bar = start + k
+            # a gap through the level is filled at the open
+            price_open = open_[bar] + (spread[bar] if side < 0 else 0)
+            if hit_sl[k]:
+                price = min(sl, price_open) if side > 0 else max(sl, price_open)
+                return bar, price, EXIT_SL
+            price = max(tp, price_open) if side > 0 else min(tp, price_open)
+            return bar, price, EXIT_TP
+        start = end
+        size *= 2
+    return None, None, None
+
+
+def position_units(balance, riskPercentage, sl_dist, entry, slope, hedge=True):
+    """
+    Units of both legs: each leg risks half of riskPercentage of the balance at its SL distance,
+    or with hedge=True the first leg's notional is |slope| times the notional of the second leg.
+    """
+    units = balance * riskPercentage / 100 / 2 / np.asarray(sl_dist, dtype=np.float64)
+    if hedge:
+        units[0] = abs(slope) * units[1] * entry[1] / entry[0]
+    return units
+
+
+def backtest(
+        data,
+        regressionThreshold,
+        riskOption = 'Constant',
+        riskPercentage = 1.0,
+        rewardToRisk = 2.0,
+        SLpoints = 100,
+        ATRMultiplier = 1.5,
+        RegressionMultiplier = 1.0,
+        point = 1e-5,
+        spread = 0.0,
+        commission = 0.0,
+        balance = 10000.0,
+        hedge = True,
+        maxBars = None,
+        entrySign = 1,
+        legSelection = None,
+        ):
+    """
+    Bar-level backtest of the pair strategy with position sizing, costs and SL/TP, following
+    MeanReversion [Revised].mq5: when |distance| > regressionThreshold at the close of a bar and
+    no position is open, both legs are opened at the open of the next bar, each with its own
+    SL and TP (TP = rewardToRisk * SL distance). Each leg is closed independently.
+
+    With entrySign=1 a positive distance buys the first asset and sells the second one (the
+    convention of LinearRegression.py), entrySign=-1 reverses it (the convention of the EA).
+
+    Sizing: the risk of a trade is riskPercentage of the balance. Without hedge, each leg risks
+    half of it at its SL (as the EA). With hedge=True, the second leg risks half of it and the
+    first leg's notional is |slope| times the notional of the second leg (rolling hedge ratio).
+
+    SL distance (in price) per riskOption:
+        'Constant':   SLpoints * point
+        'ATR':        ATRMultiplier * ATR of the entry signal bar (columns ATR_0/ATR_1); the EA
+                      reads iATR of the bar it opens on (CopyBuffer shift 0), still forming at
+                      the entry, whose full-bar ATR would be look-ahead here
+        'Regression': RegressionMultiplier * |distance| * entry price (the distance is in
+                      log-return units here, unlike the points of the EA)
+
+    Parameters:
+        data (DataFrame or dict): Aligned bars with the columns distance, slope and
+            open_k/high_k/low_k/close_k for k = 0, 1 (bid prices), e.g. `data` of LinearRegression.py.
+        point (float or pair): Point size of each symbol.
+        spread (float or pair): Spread of each symbol in price, or the name of per-bar spread
+            columns in points (e.g. 'spread' reads spread_0 and spread_1).
+        commission (float): Commission per side as a fraction of the traded notional.
+        balance (float): Initial balance.
+        maxBars (int): Close the legs at the close of the bar maxBars bars after entry.
+        legSelection (np.ndarray): Optional leg to trade on every signal bar: 0 or 1 opens only
+            that leg (sized as without hedge), -1 both (e.g. leg_selection.select_legs).
+
+    Returns:
+        dict of np.ndarray:
+            'equity', 'drawdown' (per bar, marked to market at the close),
+            'trades' (ledger: dict of per-trade arrays, leg values have shape (trades, 2)),
+            'max_drawdown', 'net_profit'.
+    """
+    if riskOption not in RISK_OPTIONS:
+        raise ValueError(f"Unknown risk option: {riskOption} (available: {RISK_OPTIONS})")
+
+    distance = _column(data, 'distance')
+    slope = _column(data, 'slope')
+    open_ = [_column(data, f'open_{k}') for k in range(2)]
+    high = [_column(data, f'high_{k}') for k in range(2)]
+    low = [_column(data, f'low_{k}') for k in range(2)]
+    close = [_column(data, f'close_{k}') for k in range(2)]
+    N = len(distance)
+    point = _pair(point)
+    if isinstance(spread, str):
+        spread = [_column(data, f'{spread}_{k}') * point[k] for k in range(2)]
+    else:
+        spread = [np.full(N, float(s)) for s in _pair(spread)]
+    if riskOption == 'ATR':
+        atr = [_column(data, f'ATR_{k}') for k in range(2)]
+
+    signal = np.zeros(N, dtype=np.int64)
+    signal[distance > regressionThreshold] = entrySign
+    signal[distance < -regressionThreshold] = -entrySign
+    # the entry is at the open of the next bar
+    signal[-1] = 0
+    candidates = np.flatnonzero(signal)
+
+    ledger = {name: [] for name in ['signal_bar', 'entry_bar', 'exit_bar', 'direction', 'units',
+                                    'entry_price', 'exit_price', 'exit_reason', 'pnl', 'commission']}
+    realized = balance
+    next_free = 0
+    pos = 0
+    while realized > 0:
+        pos += int(np.searchsorted(candidates[pos:], next_free))
+        if pos >= len(candidates):
+            break
+        i = candidates[pos]
+        b = i + 1
+        direction = signal[i]
+        sides = (direction, -direction)
+        stop = N if maxBars is None else min(N, b + maxBars + 1)
+
+        # SL distance and units of each leg
+        sl_dist = np.empty(2)
+        entry = np.empty(2)
+        for k in range(2):
+            entry[k] = open_[k][b] + (spread[k][b] if sides[k] > 0 else 0)
+            if riskOption == 'Constant':
+                sl_dist[k] = SLpoints * point[k]
+            elif riskOption == 'ATR':
+                # ATR of the signal bar: the one of the entry bar is only known at its close
+                sl_dist[k] = ATRMultiplier * atr[k][i]
+            else:
+                sl_dist[k] = RegressionMultiplier * abs(distance[i]) * entry[k]
+        if not np.all(sl_dist > 0) or not np.isfinite(slope[i]):
+            next_free = i + 1
+            continue
+        legs = (0, 1) if legSelection is None or legSelection[i] < 0 else (int(legSelection[i]),)
+        units = position_units(realized, riskPercentage, sl_dist, entry, slope[i], hedge and len(legs) == 2)
+
+        exit_bar = np.empty(2, dtype=np.int64)
+        exit_price = np.empty(2)
+        exit_reason = np.empty(2, dtype=np.int64)
+        for k in range(2):
+            if k not in legs:
+                # leg not traded: no units, closed on entry
+                units[k] = 0
+                exit_bar[k], exit_price[k], exit_reason[k] = b, entry[k], EXIT_TIME
+                continue
+            s = sides[k]
+            sl = entry[k] - s * sl_dist[k]
+            tp = entry[k] + s * rewardToRisk * sl_dist[k]
+            bar, price, reason = _first_exit(s, b, stop, sl, tp, open_[k], high[k], low[k], spread[k])
+            if bar is None:
+                # closed at the close of the last bar (bid for longs, ask for shorts)
+                bar = stop - 1
+                price = close[k][bar] + (spread[k][bar] if s < 0 else 0)
+                reason = EXIT_TIME
+            exit_bar[k], exit_price[k], exit_reason[k] = bar, price, reason
+
+        pnl = np.array(sides) * units * (exit_price - entry)
+        fees = commission * units * (entry + exit_price)
+        realized += pnl.sum() - fees.sum()
+
+        ledger['signal_bar'].append(i)
+        ledger['entry_bar'].append(b)
+        ledger['exit_bar'].append(exit_bar)
+        ledger['direction'].append(direction)
+        ledger['units'].append(units)
+        ledger['entry_price'].append(entry)
+        ledger['exit_price'].append(exit_price)
+        ledger['exit_reason'].append(exit_reason)
+        ledger['pnl'].append(pnl)
+        ledger['commission'].append(fees)
+        # a new position can be opened once both legs are closed
+        next_free = exit_bar.max()
+
+    trades = {}
+    for name, values in ledger.items():
+        if name in ('signal_bar', 'entry_bar', 'direction'):
+            trades[name] = np.array(values, dtype=np.int64)
+        elif name in ('exit_bar', 'exit_reason'):
+            trades[name] = np.array(values, dtype=np.int64).reshape(-1, 2)
+        else:
+            trades[name] = np.array(values, dtype=np.float64).reshape(-1, 2)
+
+    equity = balance + _mark_to_market(trades, close, N)
+    drawdown = equity - np.maximum.accumulate(equity)
+    return {
+        'equity':       equity,
+        'drawdown':     drawdown,
+        'trades':       trades,
+        'max_drawdown': drawdown.min() if N else 0.0,
+        'net_profit':   equity[-1] - balance if N else 0.0,
+    }
+
+
+def _mark_to_market(trades, close, N):
+    """Cumulative PnL per bar of all the legs, marked at the bar closes (vectorized over trades)."""
+    pnl = np.zeros(N)
+    if len(trades['entry_bar']) == 0:
+        return pnl
+    for k in range(2):
+        b = trades['entry_bar']
+        x = trades['exit_bar'][:, k]
+        side = np.where(k == 0, trades['direction'], -trades['direction'])
+        u = side * trades['units'][:, k]
+        entry = trades['entry_price'][:, k]
+        exit_price = trades['exit_price'][:, k]
+        c = close[k]
+
+        # close-to-close changes while the leg is held (bars b+1 .. x-1)
+        held = np.zeros(N + 1)
+        inside = x > b + 1
+        np.add.at(held, b[inside] + 1, u[inside])
+        np.add.at(held, x[inside], -u[inside])
+        held = np.cumsum(held[:N])
+        delta = np.diff(c, prepend=c[0])
+        pnl += held * delta
+
+        # entry bar (entry price to close) and exit bar (previous close to exit price)
+        same = x == b
+        np.add.at(pnl, b[same], u[same] * (exit_price[same] - entry[same]))
+        other = ~same
+        np.add.at(pnl, b[other], u[other] * (c[b[other]] - entry[other]))
+        np.add.at(pnl, x[other], u[other] * (exit_price[other] - c[x[other] - 1]))
+        np.add.at(pnl, x, -trades['commission'][:, k])
+    return np.cumsum(pnl)
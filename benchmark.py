@@ -0,0 +1,206 @@
+"""
+Benchmark of the pair pipeline stages on synthetic correlated random walks (fully offline).
+
+Every stage of LinearRegression.py is timed (best of --repeat runs) and its peak memory is
+measured with tracemalloc in a separate run. The results are appended to a JSONL file with
+the git commit, so each run is compared with the last stored run of the same stage and size.
+
+    python benchmark.py --sizes 1000 100000 1000000 10000000
+    python benchmark.py --sizes 100000 --stages rolling signals --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import functions as fns
+import rolling
+import alignment
+import backtester
+from signals import simulate_trades
+
+SIZES = [1_000, 100_000, 1_000_000, 10_000_000]
+RESULTS_FILE = os.path.join('.benchmarks', 'results.jsonl')
+# a stage is reported as a regression when it is this much slower than the last stored run
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_SECONDS = 0.01     # shorter stages are too noisy to compare
+
+LoopbackBars = 20
+regressionThreshold = 0.002
+distanceThreshold = 0.5
+endTime = datetime(2024, 10, 9, 10)
+
+
+def stage_load(state):
+    # GetPriceData with the synthetic source: raw bars and the post-processing (add_features)
+    state['raw'] = [fns.GetPriceData(symbol, endTime, 'M1', state['Nbars'], source='synthetic')
+                    for symbol in ('EURUSD', 'GBPUSD')]
+
+
+def stage_align(state):
+    data = pd.DataFrame(alignment.align_series(state['raw']))
+    for k in range(2):
+        data[f'log_return_{k}'] = np.log(data[f'close_{k}'] / data[f'close_{k}'].shift(1))
+    state['data'] = data.dropna().reset_index(drop=True)
+
+
+def stage_rolling(state):
+    data = state['data']
+    state['stats'] = rolling.rolling_distances(
+        data['log_return_0'].to_numpy(),
+        data['log_return_1'].to_numpy(),
+        LoopbackBars,
+        spread=(data['close_0'] - data['close_1']).to_numpy(),
+        )
+
+
+def stage_distance(state):
+    data, stats = state['data'], state['stats']
+    for name in ('slope', 'intercept', 'r2'):
+        data[name] = stats[name]
+    data['distance'] = stats['perpendicular']
+    state['zcr'] = rolling.zero_crossing_rate(stats['perpendicular'][LoopbackBars:])
+
+
+def stage_signals(state):
+    data = state['data']
+    state['trades'] = simulate_trades(
+        data['distance'].to_numpy()[LoopbackBars:],
+        data['close_0'].to_numpy()[LoopbackBars:],
+        data['close_1'].to_numpy()[LoopbackBars:],
+        regressionThreshold,
+        distanceThreshold,
+        )
+
+
+def stage_backtest(state):
+    state['backtest'] = backtester.backtest(state['data'], regressionThreshold, maxBars=50)
+
+
+def stage_plot(state):
+    import plotly.graph_objects as go
+    data = state['data']
+    candles = [data[['time'] + [f'{c}_{k}' for c in ('open', 'high', 'low', 'close')]]
+               .rename(columns=lambda col: col.removesuffix(f'_{k}')) for k in range(2)]
+    fig = fns.plot_candlesticks(candles[0], candles[1], max_points=4000)
+    plotted = fns.downsample_minmax(data['distance'].to_numpy(), 4000)
+    fig.add_trace(go.Scattergl(x=data['time'].iloc[plotted], y=data['distance'].iloc[plotted]), row=3, col=1)
+    state['html_bytes'] = len(fig.to_html())
+
+
+STAGES = {
+    'load':     stage_load,
+    'align':    stage_align,
+    'rolling':  stage_rolling,
+    'distance': stage_distance,
+    'signals':  stage_signals,
+    'backtest': stage_backtest,
+    'plot':     stage_plot,
+}
+
+
+def run_pipeline(Nbars, stages, trace_memory=False):
+    """Run all the stages in order (the later stages need the earlier ones), returning the
+    duration (ns) and, with trace_memory, the peak traced memory (bytes) of the selected stages."""
+    state = {'Nbars': Nbars}
+    results = {}
+    for name, stage in STAGES.items():
+        if trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter_ns()
+        stage(state)
+        elapsed = time.perf_counter_ns() - start
+        if name in stages:
+            results[name] = {'ns': elapsed}
+            if trace_memory:
+                results[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1] - before
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _last_results(path):
+    """Last stored result of every (stage, bars)."""
+    last = {}
+    if not os.path.exists(path):
+        return last
+    with open(path) as f:
+        for line in f:
+            row = json.loads(line)
+            last[(row['stage'], row['bars'])] = row
+    return last
+
+
+def benchmark(sizes=SIZES, stages=list(STAGES), repeat=3, output=RESULTS_FILE):
+    """
+    Time every stage at every size and store the results.
+
+    Returns:
+        pd.DataFrame: One row per (bars, stage) with the best time, the peak memory and the
+        ratio to the last stored run.
+    """
+    previous = _last_results(output) if output else {}
+    run = {
+        'commit':   _git_commit(),
+        'date':     datetime.now().isoformat(timespec='seconds'),
+        'python':   platform.python_version(),
+        'numpy':    np.__version__,
+        'pandas':   pd.__version__,
+        'machine':  platform.machine(),
+    }
+    rows = []
+    for Nbars in sizes:
+        timings = [run_pipeline(Nbars, stages) for _ in range(repeat)]
+        tracemalloc.start()
+        try:
+            memory = run_pipeline(Nbars, stages, trace_memory=True)
+        finally:
+            tracemalloc.stop()
+        for name in timings[0]:
+            best = min(timing[name]['ns'] for timing in timings)
+            last = previous.get((name, Nbars))
+            rows.append(dict(run,
+                stage=name,
+                bars=Nbars,
+                seconds=best / 1e9,
+                peak_mb=memory[name]['peak_bytes'] / 2**20,
+                ratio=best / 1e9 / last['seconds'] if last else np.nan,
+                ))
+            print(f"{Nbars:>10} bars  {name:<9} {best / 1e9:10.4f} s  {rows[-1]['peak_mb']:9.1f} MB", flush=True)
+
+    if output:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'a') as f:
+            for row in rows:
+                f.write(json.dumps({k: (None if isinstance(v, float) and np.isnan(v) else v)
+                                    for k, v in row.items()}) + '\n')
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=RESULTS_FILE, help='JSONL file of the results ("" to not store them)')
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.stages, args.repeat, args.output)
+    slower = results[(results['ratio'] > REGRESSION_RATIO) & (results['seconds'] > REGRESSION_MIN_SECONDS)]
+    if len(slower):
+        print(f"\nSlower than the last stored run (> {REGRESSION_RATIO:.0%}):")
+        print(slower[['bars', 'stage', 'seconds', 'ratio']].to_string(index=False))
+        sys.exit(1)
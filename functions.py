@@ -1,24 +1,30 @@
-from tqdm import tqdm
-# from pomegranate import HiddenMarkovModel, State, NormalDistribution
+# heavy dependencies (MetaTrader5, pandas_ta, plotly, tqdm, yfinance) are imported
+# lazily, only when the data source or the function that needs them is used
 from datetime import datetime
-import matplotlib.pyplot as plt
-from hmmlearn.hmm import GaussianHMM, GMMHMM, MultinomialHMM
 import pandas as pd
-import pandas_ta as ta
-from pandas.plotting import register_matplotlib_converters
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
-# render plotly in browser
-import plotly.io as pio
-import MetaTrader5 as mt5
 import warnings
-register_matplotlib_converters()
-pio.renderers.default = 'vscode'
-mt5.initialize()
+import threading
+import instrumentation
 # disable all the warnings
 warnings.filterwarnings('ignore')
 
+_mt5 = None
+# the terminal connection is shared, the MT5 calls of concurrent downloads are serialized
+_mt5_lock = threading.Lock()
+
+def get_mt5():
+    """Import and initialize the MetaTrader5 terminal connection on first use."""
+    global _mt5
+    with _mt5_lock:
+        if _mt5 is None:
+            import MetaTrader5 as mt5
+            if not mt5.initialize():
+                raise RuntimeError(f"MetaTrader5 initialize() failed: {mt5.last_error()}")
+            _mt5 = mt5
+    return _mt5
+
+@instrumentation.instrumented('fetch')
 def GetPriceData(
         symbol, 
         endTime = datetime.now(),
@@ -31,87 +37,18 @@ def GetPriceData(
             'RSI':      False,
         },
         MA_period = 20,
+        compact = False,
+        **source_kwargs,
         ):
-    
-    if source=='MT5':
-        # move the hour forward by 2 hours 
-        endTime = endTime + pd.DateOffset(hours=2)
-
-        # if Nbars is larger than 99999, get the data in chunks
-        rates = pd.DataFrame()  # Initialize an empty DataFrame
-        while Nbars > 0:
-            Nbars_chunk = min(Nbars, 200000)
-            Nbars -= Nbars_chunk
-
-            rates_chunk = mt5.copy_rates_from(
-                symbol, 
-                ConvertTimeFrametoMT5(timeframe), 
-                endTime,
-                Nbars_chunk,
-            )
-
-            # convert to pandas DataFrame
-            rates_chunk = pd.DataFrame(rates_chunk)
-
-            # Add the retrieved chunk to the overall list
-            rates = pd.concat([rates, rates_chunk], ignore_index=True)
-
-            # Update endTime to the last time of the retrieved data
-            endTime = rates_chunk['time'][0]  # Assuming the data is sorted in reverse chronological order
-            
-            # convert the endTime from int64 to datetime
-            endTime = pd.to_datetime(endTime, unit='s')
-            
-        # convert times to UTC+1
-        rates['time']=pd.to_datetime(rates['time'], unit='s')
-        rates['time'] = rates['time'] + pd.DateOffset(hours=-2)
-
-        rates['hour'] = rates['time'].dt.hour
-
-        # rates['MA_close'] = rates['close'].rolling(MA_period).mean()
-        # rates['EMA_close'] = rates['close'].ewm(span=MA_period, adjust=False).mean()
-
-        # remove nans
-        rates = rates.dropna()
-        rates.rename(columns={'tick_volume': 'volume'}, inplace=True)
-        # rates['MA_volume'] = rates['volume'].rolling(MA_period).mean()
-        # rates['EMA_volume'] = rates['volume'].ewm(span=MA_period, adjust=False).mean()
-        
-        # rates['log_volume'] = np.log(rates['volume'])
-        # rates['MA_log_volume'] = rates['log_volume'].rolling(MA_period).mean()
-        # rates['EMA_log_volume'] = rates['log_volume'].ewm(span=MA_period, adjust=False).mean()
-        
-        rates['log_return'] = np.log(rates['close'] / rates['close'].shift(1))
-        # rates['MA_log_return'] = rates['log_return'].rolling(MA_period).mean()       
-        # rates['EMA_log_return'] = rates['log_return'].ewm(span=MA_period, adjust=False).mean()
-        
-        # rates['volatility'] = rates['log_return'].rolling(MA_period).std()
-        # rates['MA_volatility'] = rates['volatility'].rolling(MA_period).std()   
-        # rates['EMA_volatility'] = rates['volatility'].ewm(span=MA_period, adjust=False).std()
-        
-        # rates['log_volatility'] = np.log(rates['volatility'])
-        # rates['MA_log_volatility'] = rates['log_volatility'].rolling(MA_period).mean()
-        # rates['EMA_log_volatility'] = rates['log_volatility'].ewm(span=MA_period, adjust=False).mean()
-        
-        # rates['MA_volume'] = rates['volume'].rolling(MA_period).mean()
-        # rates['EMA_volume'] = rates['volume'].ewm(span=MA_period, adjust=False).mean()
-        
-        # rates['upward'] = (rates['log_return'] > 0).astype(int)
-            
-
-        if indicators_dict['ATR']:
-            rates['ATR'] = ta.atr(rates['high'], rates['low'], rates['close'], length=MA_period)
-            
-        if indicators_dict['ADX']:
-            ADX = ta.adx(rates['high'], rates['low'], rates['close'], length=MA_period)
-            rates['ADX'] = ADX[f'ADX_{MA_period}']
-
-        if indicators_dict['RSI']:
-            rates['RSI'] = ta.rsi(rates['close'], length=MA_period)
-      
-        return rates
-    
-    elif source=='yfinance':
+    """
+    Get the OHLC bars of a symbol from one of the data sources:
+    'MT5' (MetaTrader5 terminal), 'yfinance', 'file' (local CSV/Parquet files, see
+    GetPriceData_File) or 'synthetic' (random walks for tests). Other sources can be
+    added with register_data_source. Extra keyword arguments are passed to the source.
+    With compact=True, only the time (int64 ns) and OHLC columns are returned, as contiguous
+    float32 arrays (see to_compact).
+    """
+    if source=='yfinance':
         startTime = get_start_time(endTime, timeframe, Nbars)
         # convert the symbol to the format required by yfinance
         # AVAILABLE ASSETS
@@ -131,7 +68,126 @@ def GetPriceData(
         rates = rates.rename(columns={'Close':'close', 'Open':'open', 'High':'high', 'Low':'low'})
         # change keys name from Date to time
         rates['time'] = rates.index
-        return rates
+        return to_compact(rates) if compact else rates
+
+    if source not in DATA_SOURCES:
+        raise ValueError(f"Unknown data source: {source} (available: yfinance, {', '.join(DATA_SOURCES)})")
+    rates = DATA_SOURCES[source](symbol, endTime, timeframe, Nbars, **source_kwargs)
+    rates = add_features(rates, indicators_dict, MA_period)
+    instrumentation.count('bars_fetched', len(rates), symbol=symbol, source=source)
+    return to_compact(rates) if compact else rates
+
+# columns kept by the compact mode
+COMPACT_COLUMNS = ['open', 'high', 'low', 'close']
+
+def to_compact(
+        rates,
+        columns = COMPACT_COLUMNS,
+        dtype = np.float32,
+        ):
+    """
+    Compact copy of bars for long histories: a dict with 'time' as int64 nanoseconds (no timezone)
+    and only the requested columns as contiguous arrays of `dtype`. float32 keeps about 7
+    significant digits, enough for the prices; the rolling computations upcast to float64.
+    """
+    import alignment
+    compact = {'time': np.ascontiguousarray(alignment._time_values(rates), dtype=np.int64)}
+    for column in columns:
+        compact[column] = np.ascontiguousarray(alignment._column_values(rates, column), dtype=dtype)
+    return compact
+
+def memory_footprint(data):
+    """Memory used by a DataFrame (deep), a dict of arrays/Series or an array, in bytes."""
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(deep=True).sum())
+    if isinstance(data, pd.Series):
+        return int(data.memory_usage(deep=True))
+    if isinstance(data, dict):
+        return sum(memory_footprint(values) for values in data.values())
+    return int(np.asarray(data).nbytes)
+
+def GetPriceDataMulti(
+        symbols, 
+        endTime = datetime.now(),
+        timeframe = 'M5',
+        Nbars = 1000,
+        source = 'MT5',
+        max_workers = None,
+        **kwargs,
+        ):
+    """
+    GetPriceData for several symbols at once, in a thread pool. The MT5 requests themselves are
+    serialized (one terminal connection), the conversion and feature computation of the symbols
+    overlap, and file/yfinance downloads run fully in parallel.
+
+    Returns:
+        dict: symbol -> DataFrame, in the order of `symbols`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(GetPriceData, symbol, endTime, timeframe, Nbars, source, **kwargs) for symbol in symbols]
+        return {symbol: future.result() for symbol, future in zip(symbols, futures)}
+
+def add_features(
+        rates,
+        indicators_dict = {
+            'ATR':      False,
+            'ADX':      False,
+            'RSI':      False,
+        },
+        MA_period = 20,
+        ):
+    """
+    Add the derived columns (hour, log_return and the optional indicators) to raw OHLC bars.
+    `rates` must have a datetime `time` column and the raw MT5 columns.
+    """
+    rates['hour'] = rates['time'].dt.hour
+
+    # rates['MA_close'] = rates['close'].rolling(MA_period).mean()
+    # rates['EMA_close'] = rates['close'].ewm(span=MA_period, adjust=False).mean()
+
+    # remove nans
+    rates = rates.dropna()
+    rates.rename(columns={'tick_volume': 'volume'}, inplace=True)
+    # rates['MA_volume'] = rates['volume'].rolling(MA_period).mean()
+    # rates['EMA_volume'] = rates['volume'].ewm(span=MA_period, adjust=False).mean()
+    
+    # rates['log_volume'] = np.log(rates['volume'])
+    # rates['MA_log_volume'] = rates['log_volume'].rolling(MA_period).mean()
+    # rates['EMA_log_volume'] = rates['log_volume'].ewm(span=MA_period, adjust=False).mean()
+    
+    rates['log_return'] = np.log(rates['close'] / rates['close'].shift(1))
+    # rates['MA_log_return'] = rates['log_return'].rolling(MA_period).mean()       
+    # rates['EMA_log_return'] = rates['log_return'].ewm(span=MA_period, adjust=False).mean()
+    
+    # rates['volatility'] = rates['log_return'].rolling(MA_period).std()
+    # rates['MA_volatility'] = rates['volatility'].rolling(MA_period).std()   
+    # rates['EMA_volatility'] = rates['volatility'].ewm(span=MA_period, adjust=False).std()
+    
+    # rates['log_volatility'] = np.log(rates['volatility'])
+    # rates['MA_log_volatility'] = rates['log_volatility'].rolling(MA_period).mean()
+    # rates['EMA_log_volatility'] = rates['log_volatility'].ewm(span=MA_period, adjust=False).mean()
+    
+    # rates['MA_volume'] = rates['volume'].rolling(MA_period).mean()
+    # rates['EMA_volume'] = rates['volume'].ewm(span=MA_period, adjust=False).mean()
+    
+    # rates['upward'] = (rates['log_return'] > 0).astype(int)
+        
+
+    if any(indicators_dict.values()):
+        import pandas_ta as ta
+
+    if indicators_dict['ATR']:
+        rates['ATR'] = ta.atr(rates['high'], rates['low'], rates['close'], length=MA_period)
+        
+    if indicators_dict['ADX']:
+        ADX = ta.adx(rates['high'], rates['low'], rates['close'], length=MA_period)
+        rates['ADX'] = ADX[f'ADX_{MA_period}']
+
+    if indicators_dict['RSI']:
+        rates['RSI'] = ta.rsi(rates['close'], length=MA_period)
+
+    return rates
 
 def ConvertTimeFrametoYfinance(timeframe):
     timeframes = {
@@ -148,6 +204,7 @@ def ConvertTimeFrametoYfinance(timeframe):
     return timeframes.get(timeframe, 'Invalid timeframe')
 
 def ConvertTimeFrametoMT5(timeframe):
+    mt5 = get_mt5()
     timeframes = {
         'M1': mt5.TIMEFRAME_M1,
         'M2': mt5.TIMEFRAME_M2,
@@ -189,6 +246,139 @@ def GetPriceData_Yfinance(
             )
     return OHLC
 
+def GetPriceData_MT5(
+        symbol, 
+        endTime, 
+        timeframe, 
+        Nbars,
+        ):
+    """
+    Raw bars from the MetaTrader5 terminal (times converted to London time).
+    Long histories are downloaded in chunks of 200k bars (newest first) into a preallocated
+    buffer of the raw structured arrays, which is sorted and converted to a DataFrame once.
+    """
+    mt5 = get_mt5()
+    tf = ConvertTimeFrametoMT5(timeframe)
+    # move the hour forward by 2 hours 
+    date = endTime + pd.DateOffset(hours=2)
+
+    chunk_size = 200000
+    buffer = None
+    end = 0
+    while Nbars > 0:
+        Nbars_chunk = min(Nbars, chunk_size)
+        with _mt5_lock:
+            rates_chunk = mt5.copy_rates_from(symbol, tf, date, Nbars_chunk)
+        if rates_chunk is None:
+            raise RuntimeError(f"MetaTrader5 copy_rates_from({symbol}, {timeframe}) failed: {mt5.last_error()}")
+        if len(rates_chunk) == 0:
+            # start of the history on the terminal
+            break
+        if buffer is None:
+            # the chunks are written from the end of the buffer backwards
+            buffer = np.empty(Nbars, dtype=rates_chunk.dtype)
+            end = Nbars
+        buffer[end - len(rates_chunk):end] = rates_chunk
+        end -= len(rates_chunk)
+        Nbars -= len(rates_chunk)
+        if len(rates_chunk) < Nbars_chunk:
+            # no more history on the terminal
+            break
+        # the next chunk ends one second before the oldest bar of this one
+        date = int(rates_chunk['time'][0]) - 1
+
+    if buffer is None:
+        rates = pd.DataFrame(columns=['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread', 'real_volume'])
+    else:
+        buffer = buffer[end:]
+        # sort and remove duplicated bars once
+        _, first = np.unique(buffer['time'], return_index=True)
+        rates = pd.DataFrame(buffer[first])
+
+    # convert times to UTC+1
+    rates['time'] = pd.to_datetime(rates['time'], unit='s')
+    rates['time'] = rates['time'] + pd.DateOffset(hours=-2)
+
+    return rates
+
+def GetPriceData_File(
+        symbol, 
+        endTime, 
+        timeframe, 
+        Nbars,
+        data_dir = 'data',
+        ):
+    """
+    Raw bars from a local file `<data_dir>/<symbol>_<timeframe>.parquet` (or `.csv`).
+    The file needs a `time` column (London time) and the open/high/low/close columns,
+    the other MT5 columns (tick_volume, spread, real_volume) are optional.
+    """
+    import os
+    path = os.path.join(data_dir, f'{symbol}_{timeframe}')
+    if os.path.exists(path + '.parquet'):
+        rates = pd.read_parquet(path + '.parquet')
+    elif os.path.exists(path + '.csv'):
+        rates = pd.read_csv(path + '.csv')
+    else:
+        raise FileNotFoundError(f"No price file for {symbol} {timeframe} in {data_dir}")
+    rates['time'] = pd.to_datetime(rates['time'])
+
+    # last Nbars bars up to endTime (the file is assumed to be sorted by time)
+    end = np.searchsorted(rates['time'].to_numpy(), np.datetime64(pd.Timestamp(endTime)), side='right')
+    rates = rates.iloc[max(end - Nbars, 0):end].reset_index(drop=True)
+    return rates
+
+def GetPriceData_Synthetic(
+        symbol, 
+        endTime, 
+        timeframe, 
+        Nbars,
+        seed = 0,
+        correlation = 0.8,
+        volatility = 1e-3,
+        ):
+    """
+    Synthetic bars for tests: correlated geometric random walks. All symbols requested with
+    the same seed/endTime/Nbars share a common factor, so the log returns of any two of them
+    have the given correlation.
+    """
+    import zlib
+    Nbars = int(Nbars)
+    common = np.random.default_rng(seed).normal(0, volatility, Nbars)
+    own = np.random.default_rng([seed, zlib.crc32(symbol.encode())])
+    loading = np.sqrt(correlation)
+    returns = loading * common + np.sqrt(1 - correlation) * own.normal(0, volatility, Nbars)
+
+    close = (1 + own.random()) * np.exp(np.cumsum(returns))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    wick = np.abs(own.normal(0, volatility / 2, (2, Nbars)))
+    bar = endTime - get_start_time(endTime, timeframe, 1)
+    time = pd.date_range(end=pd.Timestamp(endTime).floor(bar), periods=Nbars, freq=bar)
+
+    rates = pd.DataFrame({
+        'time':         time,
+        'open':         open_,
+        'high':         np.maximum(open_, close) * (1 + wick[0]),
+        'low':          np.minimum(open_, close) * (1 - wick[1]),
+        'close':        close,
+        'tick_volume':  own.integers(1, 1000, Nbars),
+        'spread':       own.integers(0, 20, Nbars),
+        'real_volume':  np.zeros(Nbars, dtype=np.int64),
+    })
+    return rates
+
+# raw bar sources used by GetPriceData: function(symbol, endTime, timeframe, Nbars, **kwargs)
+# returning a DataFrame with a datetime `time` column and the raw OHLC columns
+DATA_SOURCES = {
+    'MT5':          GetPriceData_MT5,
+    'file':         GetPriceData_File,
+    'synthetic':    GetPriceData_Synthetic,
+}
+
+def register_data_source(name, fetch):
+    """Add a raw bar source to GetPriceData (see DATA_SOURCES for the expected signature)."""
+    DATA_SOURCES[name] = fetch
+
 def get_start_time(
         endTime, 
         timeframe, 
@@ -226,6 +416,47 @@ def get_start_time(
 
     return startTime
 
+def downsample_minmax(y, max_points):
+    """
+    Indices of a min/max downsampling of a line to about max_points points: the series is cut in
+    max_points/2 buckets and the minimum and maximum of every bucket are kept (in order), so the
+    peaks stay visible at any zoom level of the pixel budget. NaN values are never selected
+    unless a bucket only holds NaN.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    size = int(np.ceil(n / (max_points // 2)))
+    buckets = int(np.ceil(n / size))
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lowest = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1) + offsets
+    highest = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1) + offsets
+    indices = np.unique(np.concatenate((lowest, highest)))
+    return indices[indices < n]
+
+def downsample_candles(rates, max_bars):
+    """
+    Merge consecutive bars into at most max_bars candles (first open, highest high, lowest low,
+    last close, time of the first bar), so the candle shapes of a long history are kept.
+    """
+    n = len(rates)
+    if max_bars is None or n <= max_bars:
+        return rates
+    starts = np.arange(0, n, int(np.ceil(n / max_bars)))
+    ends = np.append(starts[1:], n) - 1
+    return pd.DataFrame({
+        'time':     rates['time'].to_numpy()[starts],
+        'open':     rates['open'].to_numpy()[starts],
+        'high':     np.maximum.reduceat(rates['high'].to_numpy(), starts),
+        'low':      np.minimum.reduceat(rates['low'].to_numpy(), starts),
+        'close':    rates['close'].to_numpy()[ends],
+    })
+
+@instrumentation.instrumented('plot')
 def plot_candlesticks(
         symbol1, 
         symbol2=None,
@@ -233,7 +464,17 @@ def plot_candlesticks(
         show_states=False,
         begin=0,        # from 0 to 1
         fraction=1,     # from 0 to 1
+        max_points=None,    # pixel budget: longer histories are downsampled (None: all the bars)
         ):
+    """
+    Candlestick chart of one or two symbols (the third row is left for the distance plot).
+    With max_points, the bars are merged into at most max_points candles (downsample_candles)
+    and the close-only series are drawn with WebGL (Scattergl), so charts of a million bars
+    stay small. The hidden states (show_states) are drawn as one rectangle per state run,
+    added to the layout in a single batch.
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     
     # if OHL data is not provided, use Scatter plot instead of Candlestick
     if symbol1['open'].isnull().all():
@@ -245,31 +486,39 @@ def plot_candlesticks(
     symbol1 = symbol1.iloc[int(begin*len(symbol1)):int(begin*len(symbol1))+int(fraction*len(symbol1))]
     if symbol2 is not None:
         symbol2 = symbol2.iloc[int(begin*len(symbol2)):int(begin*len(symbol2))+int(fraction*len(symbol2))]
+    # the states are taken from the full resolution bars
+    states_rates = symbol1
+    symbol1 = downsample_candles(symbol1, max_points)
+    if symbol2 is not None:
+        symbol2 = downsample_candles(symbol2, max_points)
 
     # if pair2 is not None, create a subplot with linked x-axis
     # use plotly
     fig = make_subplots(
         rows=3 if symbol2 is not None else 1, 
         cols=1)
-    fig.add_trace(go.Candlestick(
-        x    = symbol1['time'],
-        open = symbol1['open'],
-        high = symbol1['high'],
-        low  = symbol1['low'],
-        close= symbol1['close'],
-        name = titles[0],
-        hoverinfo=None,
-    ), row=1, col=1)
-    if symbol2 is not None:
-        fig.add_trace(go.Candlestick(
-            x     = symbol2['time'],
-            open  = symbol2['open'],
-            high  = symbol2['high'],
-            low   = symbol2['low'],
-            close = symbol2['close'],
-            name  = titles[1],
+    def price_trace(rates, title):
+        if flagScatter:
+            return go.Scattergl(
+                x    = rates['time'],
+                y    = rates['close'],
+                mode = 'lines',
+                name = title,
+                line = dict(color='rgb(8,153,129)', width=1),
+            )
+        return go.Candlestick(
+            x    = rates['time'],
+            open = rates['open'],
+            high = rates['high'],
+            low  = rates['low'],
+            close= rates['close'],
+            name = title,
             hoverinfo=None,
-        ), row=2, col=1)
+        )
+
+    fig.add_trace(price_trace(symbol1, titles[0]), row=1, col=1)
+    if symbol2 is not None:
+        fig.add_trace(price_trace(symbol2, titles[1]), row=2, col=1)
         fig.update_layout(
             xaxis2_title='Time',
             yaxis2_title=titles[1],
@@ -280,6 +529,7 @@ def plot_candlesticks(
         yaxis_title=titles[0],
     )
     fig.update_traces(
+        selector=dict(type='candlestick'),
         increasing_line_color='rgb(8,153,129)',
         decreasing_line_color='rgb(242,54,69)',
         increasing_fillcolor='rgb(8,153,129)',
@@ -291,24 +541,30 @@ def plot_candlesticks(
         matches='x',
         )
     
-    # add states to the chart
+    # add states to the chart: one rectangle per run of the same state, all added at once
     if show_states:
-        states = np.array(symbol1['hidden_state'])
+        states = np.asarray(states_rates['hidden_state'])
+        time = states_rates['time'].to_numpy()
         # use alternating colors the same size as len(np.unique(states))
         colors = ['blue', 'red', 'green']
-        for i in tqdm(range(len(states))):
-            if i == 0:
-                start = symbol1['time'].iloc[i]
-            elif states[i] != states[i-1]:
-                end = symbol1['time'].iloc[i]
-                fig.add_vrect(
-                    x0=start, 
-                    x1=end, 
-                    fillcolor=colors[states[i]], 
-                    opacity=0.2, 
-                    layer='below', 
-                    line_width=0,
-                    )
-                start = symbol1['time'].iloc[i]
+        starts = np.flatnonzero(np.diff(states, prepend=np.nan) != 0)
+        ends = np.append(starts[1:], len(states) - 1)
+        fig.update_layout(shapes=list(fig.layout.shapes) + [
+            dict(
+                type='rect',
+                xref='x',
+                yref='paper',
+                x0=time[start],
+                x1=time[end],
+                y0=0,
+                y1=1,
+                fillcolor=colors[states[start]],
+                opacity=0.2,
+                layer='below',
+                line_width=0,
+                )
+            # bars without a state (-1) are not highlighted
+            for start, end in zip(starts, ends) if states[start] >= 0
+        ])
     
     return fig
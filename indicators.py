@@ -0,0 +1,223 @@
+import os
+import numpy as np
+import pandas as pd
+import rolling
+import price_cache
+
+# indicators of the store, computed with Wilder's smoothing (the TA-Lib / pandas_ta convention).
+# This is not the MT5 smoothing: iATR is a simple average of the true range and iADX smooths with
+# an exponential average (alpha = 2/(period+1)), so ATR/ADX differ from the terminal's (and from
+# the ATR risk mode of the EA); only RSI uses the same smoothing as iRSI
+INDICATORS = ('ATR', 'ADX', 'RSI', 'volatility')
+
+
+def _rma(values, period, start, last=None):
+    """
+    Wilder's moving average (alpha = 1/period) of values[start:]: seeded with the mean of the
+    first `period` values, or continued from `last` (the previous smoothed value).
+    The recursion runs in pandas' ewm (compiled), one call per period.
+    """
+    out = np.full(len(values), np.nan)
+    if last is None:
+        seed = start + period - 1
+        if seed >= len(values):
+            return out
+        chain = np.concatenate(([values[start:seed+1].mean()], values[seed+1:]))
+        out[seed:] = pd.Series(chain).ewm(alpha=1/period, adjust=False).mean().to_numpy()
+    else:
+        chain = np.concatenate(([last], values))
+        out[:] = pd.Series(chain).ewm(alpha=1/period, adjust=False).mean().to_numpy()[1:]
+    return out
+
+
+def warmup_bars(periods):
+    """Number of bars before all the indicators are defined (the ADX needs 2 * period bars)."""
+    return 2 * max(periods) if len(periods) else 0
+
+
+def _bar_changes(high, low, close, prev):
+    """True range, directional moves and close changes of every bar (prev: last bar before)."""
+    if prev is None:
+        prev_close = np.concatenate(([np.nan], close[:-1]))
+        prev_high = np.concatenate(([np.nan], high[:-1]))
+        prev_low = np.concatenate(([np.nan], low[:-1]))
+    else:
+        prev_close = np.concatenate(([prev['close']], close[:-1]))
+        prev_high = np.concatenate(([prev['high']], high[:-1]))
+        prev_low = np.concatenate(([prev['low']], low[:-1]))
+    with np.errstate(invalid='ignore'):
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        up, down = high - prev_high, prev_low - low
+        dm_plus = np.where((up > down) & (up > 0), up, 0.0)
+        dm_minus = np.where((down > up) & (down > 0), down, 0.0)
+        change = close - prev_close
+        log_return = np.log(close / prev_close)
+    return tr, dm_plus, dm_minus, change, log_return
+
+
+def compute_indicators(
+        high,
+        low,
+        close,
+        periods,
+        indicators = INDICATORS,
+        state = None,
+        ):
+    """
+    ATR, ADX, RSI and rolling volatility for several periods in one pass: the true range,
+    directional moves and returns are computed once and shared by all the periods.
+
+    With `state` (returned by a previous call), the bars are the continuation of the previous
+    bars and the smoothing continues from where it stopped, so extending the indicators with
+    new bars gives the same values as computing them on the whole history.
+
+    Parameters:
+        high, low, close (np.ndarray): Bars (without NaN).
+        periods (iterable of int): Periods of the indicators.
+        indicators (tuple of str): Subset of INDICATORS.
+        state (dict): State returned for the previous bars (which must be at least
+            warmup_bars(periods) bars, so that all the indicators are seeded).
+
+    Returns:
+        columns (dict of np.ndarray): f'{indicator}_{period}' (NaN during the warm-up).
+        state (dict): State at the last bar, for the next call.
+    """
+    unknown = set(indicators) - set(INDICATORS)
+    if unknown:
+        raise ValueError(f"Unknown indicators: {unknown} (available: {INDICATORS})")
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    N = len(close)
+    periods = [int(period) for period in periods]
+    if state is not None and state['bars'] < warmup_bars(periods):
+        raise ValueError("The state must come from at least warmup_bars(periods) bars")
+    if N == 0:
+        return {f'{name}_{period}': np.empty(0) for period in periods for name in indicators}, state
+    prev = None if state is None else state['bar']
+    tr, dm_plus, dm_minus, change, log_return = _bar_changes(high, low, close, prev)
+    gain, loss = np.maximum(change, 0), np.maximum(-change, 0)
+
+    columns = {}
+    new_state = {
+        'bars': N + (0 if state is None else state['bars']),
+        'bar':  {'high': float(high[-1]), 'low': float(low[-1]), 'close': float(close[-1])},
+    }
+    for period in periods:
+        last = None if state is None else state[str(period)]
+        s = {}
+        # without a state the first bar has no previous bar, the changes start at bar 1
+        if 'ATR' in indicators:
+            atr = _rma(tr, period, 0, None if last is None else last['atr'])
+            columns[f'ATR_{period}'] = atr
+            s['atr'] = float(atr[-1])
+        if 'RSI' in indicators:
+            avg_gain = _rma(gain, period, 1, None if last is None else last['gain'])
+            avg_loss = _rma(loss, period, 1, None if last is None else last['loss'])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+            columns[f'RSI_{period}'] = np.where(np.isnan(avg_gain), np.nan, rsi)
+            s['gain'] = float(avg_gain[-1])
+            s['loss'] = float(avg_loss[-1])
+        if 'ADX' in indicators:
+            smooth_tr = _rma(tr, period, 1, None if last is None else last['tr'])
+            smooth_plus = _rma(dm_plus, period, 1, None if last is None else last['dm_plus'])
+            smooth_minus = _rma(dm_minus, period, 1, None if last is None else last['dm_minus'])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                di_plus = 100 * smooth_plus / smooth_tr
+                di_minus = 100 * smooth_minus / smooth_tr
+                dx = np.where(di_plus + di_minus > 0,
+                              100 * np.abs(di_plus - di_minus) / (di_plus + di_minus), 0.0)
+            dx[np.isnan(smooth_tr)] = np.nan
+            # the first DX is at bar `period`, the ADX is seeded with the mean of `period` DX
+            adx = _rma(dx, period, period, None if last is None else last['adx'])
+            columns[f'ADX_{period}'] = adx
+            s['tr'] = float(smooth_tr[-1])
+            s['dm_plus'] = float(smooth_plus[-1])
+            s['dm_minus'] = float(smooth_minus[-1])
+            s['adx'] = float(adx[-1])
+        if 'volatility' in indicators:
+            # population standard deviation of the log returns over the last `period` bars
+            previous = np.asarray(last['returns'] if last is not None else [], dtype=np.float64)
+            returns = np.concatenate((previous, log_return))
+            first = 0 if last is not None else 1
+            volatility = np.full(len(returns), np.nan)
+            if len(returns) - first >= period:
+                _, _, sxx, _, _ = rolling.rolling_moments(returns[first:], returns[first:], period)
+                volatility[first:] = np.sqrt(np.maximum(sxx, 0) / period)
+            columns[f'volatility_{period}'] = volatility[len(previous):]
+            s['returns'] = returns[-period:].tolist()
+        new_state[str(period)] = s
+    return columns, new_state
+
+
+def _store_key(timeframe, period):
+    # the indicators are stored next to the cached bars: <cache>/<source>/<symbol>/<timeframe>/indicators/<period>
+    return os.path.join(timeframe, 'indicators', str(period))
+
+
+def _compute_to_last(high, low, close, period, indicators, state=None):
+    """compute_indicators, returning the state before the last bar: the last bar may still be
+    forming (fetched again later), so the next extension starts again from it."""
+    values, before_last = compute_indicators(high[:-1], low[:-1], close[:-1], [period], indicators, state)
+    if before_last['bars'] < warmup_bars([period]):
+        # too few bars to continue from a state: the period is computed again on the next call
+        values, _ = compute_indicators(high, low, close, [period], indicators, state)
+        return values, None
+    last, _ = compute_indicators(high[-1:], low[-1:], close[-1:], [period], indicators, before_last)
+    return {name: np.append(values[name], last[name]) for name in values}, before_last
+
+
+def cached_indicators(
+        columns,
+        source,
+        symbol,
+        timeframe,
+        periods,
+        indicators = INDICATORS,
+        cache_dir = price_cache.CACHE_DIR,
+        ):
+    """
+    Indicators of several periods on a history of bars, kept in the price cache (one .npy
+    file per column, keyed by source/symbol/timeframe/period). When the bars extend the cached
+    history, only the new bars are computed, continuing from the stored smoothing state;
+    otherwise (first call, bars added before the cached range) the period is computed again
+    on all the bars.
+
+    Parameters:
+        columns (dict of np.ndarray): 'time' (int64 ns, increasing) and 'high', 'low', 'close',
+            e.g. the whole cached history of price_cache.load_cache.
+        source, symbol, timeframe (str): Key of the cache (source is the folder of price_cache.source_key).
+        periods (iterable of int): Periods of the indicators.
+        indicators (tuple of str): Subset of INDICATORS.
+        cache_dir (str): Root folder of the price cache.
+
+    Returns:
+        dict of np.ndarray: f'{indicator}_{period}' aligned with columns['time'].
+    """
+    time = np.asarray(columns['time'])
+    high, low, close = (np.asarray(columns[name], dtype=np.float64) for name in ('high', 'low', 'close'))
+    N = len(time)
+    out = {}
+    for period in periods:
+        period = int(period)
+        if N == 0:
+            out.update({f'{name}_{period}': np.empty(0) for name in indicators})
+            continue
+        key = _store_key(timeframe, period)
+        cached, meta = price_cache.load_cache(cache_dir, source, symbol, key)
+        n = meta.get('bars', 0)
+        if cached is not None and meta['state'] is not None and meta['indicators'] == list(indicators) \
+                and n <= N and time[0] == cached['time'][0] and time[n-1] == cached['time'][-1]:
+            # the cached bars are a prefix of the bars: compute from the last cached bar on
+            new, state = _compute_to_last(high[n-1:], low[n-1:], close[n-1:], period, indicators, meta['state'])
+            values = {name: np.concatenate((cached[name][:-1], new[name])) for name in new}
+            if n == N:
+                out.update(values)
+                continue
+        else:
+            values, state = _compute_to_last(high, low, close, period, indicators)
+        price_cache.save_cache(cache_dir, source, symbol, key, dict(values, time=time),
+                               {'bars': N, 'indicators': list(indicators), 'state': state})
+        out.update(values)
+    return out
@@ -0,0 +1,211 @@
+"""
+Optional timing/memory instrumentation of the pipeline stages.
+
+Nothing is recorded until `enable` is called with one or more exporters; while disabled, the
+spans and counters of the instrumented functions cost a single flag check.
+
+    import instrumentation
+    instrumentation.enable(
+        instrumentation.JsonLinesExporter('metrics.jsonl'),
+        instrumentation.PrometheusExporter('metrics.prom'),
+        )
+    with instrumentation.span('my_stage', symbol='EURUSD'):
+        ...
+    instrumentation.count('bars_processed', 1000)
+"""
+import os
+import json
+import time
+import functools
+import threading
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    # not available on Windows: the peak RSS is not reported
+    resource = None
+
+_enabled = False
+_exporters = []
+
+
+def _maxrss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'labels', 'start', 'memory')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter_ns() - self.start
+        event = {
+            'type':         'span',
+            'name':         self.name,
+            'labels':       self.labels,
+            'time_ns':      time.time_ns(),
+            'duration_ns':  duration,
+            'maxrss_kb':    _maxrss_kb(),
+            'error':        exc_type.__name__ if exc_type is not None else None,
+        }
+        if self.memory is not None:
+            event['memory_bytes'] = tracemalloc.get_traced_memory()[0] - self.memory
+        _emit(event)
+        return False
+
+
+def _emit(event):
+    for exporter in _exporters:
+        exporter.export(event)
+
+
+def enable(*exporters):
+    """Start recording the spans and counters to the given exporters."""
+    global _enabled
+    _exporters[:] = exporters
+    _enabled = bool(exporters)
+
+
+def disable():
+    """Stop recording, flush and close the exporters."""
+    global _enabled
+    _enabled = False
+    for exporter in _exporters:
+        exporter.close()
+    _exporters.clear()
+
+
+def enabled():
+    return _enabled
+
+
+def span(name, **labels):
+    """Context manager timing a block (nanoseconds) and reporting the peak RSS of the process and,
+    when tracemalloc is tracing, the memory allocated in the block."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def count(name, value=1, **labels):
+    """Add `value` to a counter (e.g. bars processed, signals emitted)."""
+    if _enabled:
+        _emit({'type': 'counter', 'name': name, 'labels': labels, 'time_ns': time.time_ns(), 'value': value})
+
+
+def instrumented(name):
+    """Decorator recording every call of a function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class JsonLinesExporter:
+    """Append every event as one JSON line to `path` (line buffered, so a crashed run keeps its events)."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', buffering=1)
+        self._lock = threading.Lock()
+
+    def export(self, event):
+        line = json.dumps(event)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusExporter:
+    """
+    Aggregate the events and write them as a Prometheus text file (e.g. for the node_exporter
+    textfile collector): one summary (count/sum) and max per span and one total per counter,
+    labelled by their labels. The file is rewritten atomically at most every `interval` seconds
+    and on close.
+    """
+
+    def __init__(self, path, prefix='pair', interval=10.0):
+        self.path = path
+        self.prefix = prefix
+        self.interval = interval
+        self._spans = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._written = 0.0
+
+    @staticmethod
+    def _key(event):
+        return (event['name'], tuple(sorted((k, str(v)) for k, v in event['labels'].items())))
+
+    def export(self, event):
+        key = self._key(event)
+        with self._lock:
+            if event['type'] == 'span':
+                seconds = event['duration_ns'] / 1e9
+                n, total, peak = self._spans.get(key, (0, 0.0, 0.0))
+                self._spans[key] = (n + 1, total + seconds, max(peak, seconds))
+            else:
+                self._counters[key] = self._counters.get(key, 0) + event['value']
+        if time.monotonic() - self._written >= self.interval:
+            self.flush()
+
+    @staticmethod
+    def _labels(stage, labels):
+        pairs = ([('stage', stage)] if stage is not None else []) + list(labels)
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+    def flush(self):
+        with self._lock:
+            self._written = time.monotonic()
+            name = f'{self.prefix}_stage_duration_seconds'
+            spans = sorted(self._spans.items())
+            lines = [f'# TYPE {name} summary']
+            for (stage, labels), (n, total, _) in spans:
+                lines.append(f'{name}_count{self._labels(stage, labels)} {n}')
+                lines.append(f'{name}_sum{self._labels(stage, labels)} {total:.9f}')
+            lines.append(f'# TYPE {name}_max gauge')
+            for (stage, labels), (_, _, peak) in spans:
+                lines.append(f'{name}_max{self._labels(stage, labels)} {peak:.9f}')
+            for counter in sorted({counter for counter, _ in self._counters}):
+                metric = f'{self.prefix}_{counter}_total'
+                lines.append(f'# TYPE {metric} counter')
+                for (other, labels), value in sorted(self._counters.items()):
+                    if other == counter:
+                        lines.append(f'{metric}{self._labels(None, labels)} {value}')
+            maxrss = _maxrss_kb()
+            if maxrss is not None:
+                lines.append(f'# TYPE {self.prefix}_process_max_rss_bytes gauge')
+                lines.append(f'{self.prefix}_process_max_rss_bytes {maxrss * 1024}')
+            # write to a temporary file first so the collector never reads a partial file
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp, self.path)
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,150 @@
+import numpy as np
+import instrumentation
+import rolling
+from rolling import _jit
+
+# critical values of the Dickey-Fuller t-statistic with a constant (large samples), and of the
+# Engle-Granger test on the residuals of a two-variable cointegration regression (MacKinnon)
+ADF_CRITICAL = {'1%': -3.43, '5%': -2.86, '10%': -2.57}
+EG_CRITICAL = {'1%': -3.90, '5%': -3.34, '10%': -3.04}
+
+
+@_jit
+def _kalman_filter(x, y, q0, q1, r, slope0, intercept0, p0, p1):
+    N = len(x)
+    slope = np.full(N, np.nan)
+    intercept = np.full(N, np.nan)
+    spread = np.full(N, np.nan)
+    spread_var = np.full(N, np.nan)
+
+    # state (slope, intercept) and its 2x2 covariance
+    b, a = slope0, intercept0
+    p00, p01, p11 = p0, 0.0, p1
+    for t in range(N):
+        # random walk of the state
+        p00 += q0
+        p11 += q1
+        xt, yt = x[t], y[t]
+        if np.isnan(xt) or np.isnan(yt):
+            continue
+        slope[t], intercept[t] = b, a
+
+        # prediction error of y and its variance with the prior state (no look-ahead)
+        e = yt - (b * xt + a)
+        ph0 = p00 * xt + p01
+        ph1 = p01 * xt + p11
+        s = xt * ph0 + ph1 + r
+        spread[t] = e
+        spread_var[t] = s
+
+        # update with the Kalman gain
+        k0, k1 = ph0 / s, ph1 / s
+        b += k0 * e
+        a += k1 * e
+        p00 -= k0 * ph0
+        p01 -= k0 * ph1
+        p11 -= k1 * ph1
+    return slope, intercept, spread, spread_var
+
+
+def _warmup_variances(x, y, warmup=500):
+    """Variance of x and residual variance of an OLS fit on the first warmup valid bars, and the
+    end of these bars."""
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))[:warmup]
+    end = valid[-1] + 1 if len(valid) == warmup else len(x)
+    xs, ys = x[valid], y[valid]
+    if len(xs) < 3 or xs.var() == 0:
+        return 1.0, 1.0, end
+    residuals = ys - np.polyval(np.polyfit(xs, ys, 1), xs)
+    return xs.var(), max(residuals.var(), 1e-300), end
+
+
+@instrumentation.instrumented('kalman')
+def kalman_hedge(
+        x,
+        y,
+        delta = 1e-4,
+        obs_var = None,
+        slope0 = 0.0,
+        intercept0 = 0.0,
+        warmup = 500,
+        ):
+    """
+    Dynamic hedge ratio: Kalman filter of y = slope * x + intercept where slope and intercept
+    follow a random walk. Each bar is a constant time update of the 2x2 state, instead of
+    refitting a window of bars as the rolling OLS does.
+
+    The slope and intercept of bar t are the estimates before bar t is seen, so the spread of
+    bar t (its prediction error) has no look-ahead. They can be used as the rolling regression,
+    e.g. rolling.perpendicular_distance(x, y, slope, intercept). NaN bars are skipped.
+    The noise variances are estimated on the first warmup valid bars (burn-in): the outputs of
+    these bars would use later bars, so they are NaN.
+
+    Parameters:
+        x, y (np.ndarray): Series of the regression (log returns, or log prices for a price spread).
+        delta (float): Adaptation speed. The state noise per bar is delta / (1 - delta) times the
+            variance of an estimate from one bar (obs_var for the intercept, obs_var / var(x)
+            for the slope), so delta does not depend on the scale of the series.
+        obs_var (float): Variance of the observation noise (default: residual variance of an
+            OLS fit on the burn-in bars).
+        slope0, intercept0 (float): Initial state (its initial variance is large).
+        warmup (int): Number of valid burn-in bars (at least 3).
+
+    Returns:
+        dict of np.ndarray: 'slope', 'intercept', 'spread' (prediction error),
+        'spread_var' (its variance) and 'zscore' (spread / sqrt(spread_var)).
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    if len(x) != len(y):
+        raise ValueError("x and y must have the same length")
+    if warmup < 3:
+        raise ValueError("warmup must be at least 3 bars")
+    var_x, resid_var, burn_in = _warmup_variances(x, y, warmup)
+    if obs_var is None:
+        obs_var = resid_var
+    q = delta / (1 - delta)
+    slope, intercept, spread, spread_var = _kalman_filter(
+        x, y, q * obs_var / var_x, q * obs_var, obs_var, slope0, intercept0,
+        # uninformative initial state: as uncertain as a single bar estimate
+        obs_var / var_x, obs_var,
+        )
+    for values in (slope, intercept, spread, spread_var):
+        values[:burn_in] = np.nan
+    with np.errstate(invalid='ignore'):
+        zscore = spread / np.sqrt(spread_var)
+    return {
+        'slope':        slope,
+        'intercept':    intercept,
+        'spread':       spread,
+        'spread_var':   spread_var,
+        'zscore':       zscore,
+    }
+
+
+@instrumentation.instrumented('adf')
+def rolling_adf(spread, window):
+    """
+    Rolling Dickey-Fuller test of a spread: t-statistic of gamma in
+    diff(spread)[t] = alpha + gamma * spread[t-1] over every window, from the rolling sums of
+    rolling.py (O(1) per bar). Values below ADF_CRITICAL indicate a stationary spread; on the
+    residuals of a hedge regression (Engle-Granger) compare with EG_CRITICAL instead.
+    No lagged differences are included (the augmented test needs a multivariate regression).
+
+    Parameters:
+        spread (np.ndarray): Spread series (without NaN), e.g. kalman_hedge(...)['spread'].
+        window (int): Number of differences in each window.
+
+    Returns:
+        np.ndarray: t-statistic at every bar (NaN for the first `window` bars).
+    """
+    spread = np.asarray(spread, dtype=np.float64)
+    tstat = np.full(len(spread), np.nan)
+    if len(spread) <= window:
+        return tstat
+    lagged, change = spread[:-1], np.diff(spread)
+    mx, my, sxx, syy, sxy = rolling.rolling_moments(lagged, change, window)
+    gamma, _, _, resid_std = rolling.regression_from_moments(mx, my, sxx, syy, sxy, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tstat[1:] = gamma / (resid_std / np.sqrt(sxx))
+    return tstat
@@ -0,0 +1,160 @@
+import numpy as np
+import rolling
+
+# scikit-learn is imported lazily, only when a model is trained
+INDICATORS = ['ATR', 'ADX', 'RSI']
+LEG_MODELS = ('logistic', 'gbm')
+
+# labels of the reverting leg
+LEG_0 = 0
+LEG_1 = 1
+BOTH_LEGS = -1
+
+
+def leg_features(
+        data,
+        indices,
+        LoopbackBars = 20,
+        returnLags = (0, 1, 2, 4),
+        distanceLags = (1, 2, 4),
+        ):
+    """
+    Feature matrix of the signals at `indices`, gathered column by column with fancy indexing
+    (no per-signal lookups). The rolling sums of the returns are computed once for all the bars.
+
+    Features (k = 0, 1 is the leg):
+        return_k_lag<l>:     log return of leg k, l bars before the signal
+        momentum_k:          sum of the log returns of leg k over the last LoopbackBars bars
+        volatility_k:        rolling standard deviation of the log returns of leg k
+        slope, r2, distance: rolling regression and distance at the signal
+        distance_change<l>:  distance at the signal minus the distance l bars before
+        ATR_k (divided by the close), ADX_k, RSI_k: if the columns exist (indicators_dict of GetPriceData)
+
+    Parameters:
+        data (pd.DataFrame or dict): Pair data without NaN, with the columns log_return_k, close_k,
+            slope, r2 and distance (e.g. `data` of LinearRegression.py).
+        indices (np.ndarray): Positions (rows of data) of the signals, e.g. simulate_trades indices
+            shifted to the rows of data.
+        LoopbackBars (int): Window of the momentum and volatility.
+        returnLags, distanceLags (tuple of int): Lags of the return and distance features.
+
+    Returns:
+        X (np.ndarray): Features, shape (len(indices), features), NaN where a lag is out of range.
+        names (list of str): Column names.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    N = len(data['distance'])
+    columns = {}
+
+    def gather(values, lag=0):
+        pos = indices - lag
+        out = np.full(len(indices), np.nan)
+        ok = (pos >= 0) & (pos < N)
+        out[ok] = np.asarray(values, dtype=np.float64)[pos[ok]]
+        return out
+
+    for k in range(2):
+        returns = np.asarray(data[f'log_return_{k}'], dtype=np.float64)
+        for lag in returnLags:
+            columns[f'return_{k}_lag{lag}'] = gather(returns, lag)
+        s = rolling._window_sums(returns, LoopbackBars)
+        ss = rolling._window_sums(returns * returns, LoopbackBars)
+        columns[f'momentum_{k}'] = gather(s)
+        columns[f'volatility_{k}'] = np.sqrt(np.maximum(gather(ss) - gather(s)**2 / LoopbackBars, 0) / LoopbackBars)
+
+    distance = np.asarray(data['distance'], dtype=np.float64)
+    columns['slope'] = gather(data['slope'])
+    columns['r2'] = gather(data['r2'])
+    columns['distance'] = gather(distance)
+    for lag in distanceLags:
+        columns[f'distance_change{lag}'] = columns['distance'] - gather(distance, lag)
+
+    for k in range(2):
+        for indicator in INDICATORS:
+            if f'{indicator}_{k}' not in data:
+                continue
+            values = gather(data[f'{indicator}_{k}'])
+            if indicator == 'ATR':
+                values = values / gather(data[f'close_{k}'])
+            columns[f'{indicator}_{k}'] = values
+
+    names = list(columns)
+    return np.column_stack([columns[name] for name in names]), names
+
+
+def leg_labels(trades):
+    """
+    Reverting leg of every trade of signals.simulate_trades: LEG_0 if only the first leg won,
+    LEG_1 if only the second leg won, BOTH_LEGS otherwise (not used for training).
+    """
+    labels = np.full(len(trades['index']), BOTH_LEGS, dtype=np.int64)
+    labels[trades['leg0_win'] & ~trades['leg1_win']] = LEG_0
+    labels[trades['leg1_win'] & ~trades['leg0_win']] = LEG_1
+    return labels
+
+
+def train_leg_selector(X, labels, model='logistic', seed=0):
+    """
+    Train a classifier of the reverting leg on the signals with a single winning leg.
+    'logistic' is a standardized logistic regression, 'gbm' a histogram gradient boosting
+    (which handles the NaN features natively; the logistic model imputes them with the mean).
+
+    Returns:
+        Fitted scikit-learn model (predict_proba gives the probabilities of model.classes_,
+        see predict_leg).
+    """
+    if model not in LEG_MODELS:
+        raise ValueError(f"Unknown leg model: {model} (available: {LEG_MODELS})")
+    from sklearn.pipeline import make_pipeline
+    keep = labels != BOTH_LEGS
+    if model == 'logistic':
+        from sklearn.impute import SimpleImputer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+        classifier = make_pipeline(SimpleImputer(), StandardScaler(), LogisticRegression(max_iter=1000))
+    else:
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        classifier = make_pipeline(HistGradientBoostingClassifier(max_iter=200, random_state=seed))
+    return classifier.fit(X[keep], labels[keep])
+
+
+def predict_leg(model, X, batch_size=65536):
+    """Probability that the first leg is the reverting one, predicted in batches of rows
+    (0 if the model was trained without any LEG_0 label)."""
+    proba = np.zeros(len(X))
+    classes = list(model.classes_)
+    if LEG_0 not in classes:
+        return proba
+    column = classes.index(LEG_0)
+    for start in range(0, len(X), batch_size):
+        proba[start:start+batch_size] = model.predict_proba(X[start:start+batch_size])[:, column]
+    return proba
+
+
+def select_legs(
+        model,
+        data,
+        regressionThreshold,
+        margin = 0.1,
+        LoopbackBars = 20,
+        batch_size = 65536,
+        **feature_kwargs,
+        ):
+    """
+    Per-bar leg selection for backtester.backtest (legSelection): on every bar with
+    |distance| > regressionThreshold the reverting leg is predicted (all the signal bars in
+    batches), LEG_0 or LEG_1 when its probability exceeds 0.5 + margin, BOTH_LEGS otherwise.
+
+    Returns:
+        np.ndarray: Selection of every row of data (BOTH_LEGS on the bars without a signal).
+    """
+    distance = np.asarray(data['distance'], dtype=np.float64)
+    signals = np.flatnonzero(np.abs(distance) > regressionThreshold)
+    selection = np.full(len(distance), BOTH_LEGS, dtype=np.int64)
+    if len(signals) == 0:
+        return selection
+    X, _ = leg_features(data, signals, LoopbackBars, **feature_kwargs)
+    proba = predict_leg(model, X, batch_size)
+    selection[signals[proba > 0.5 + margin]] = LEG_0
+    selection[signals[proba < 0.5 - margin]] = LEG_1
+    return selection
@@ -0,0 +1,184 @@
+import numpy as np
+import instrumentation
+import rolling
+
+# lags of the Hurst exponent (variance of the lagged differences)
+HURST_LAGS = (1, 2, 4, 8, 16)
+
+
+def _valid_tail(values):
+    """
+    Skip the warm-up NaN of a rolling signal (e.g. the distance) and forward fill the later ones
+    (e.g. the distance of a zero-variance window) so they don't spoil the window sums.
+
+    Returns:
+        first (int): First row without NaN (in every column of a 2-D array).
+        values (np.ndarray): The series from `first` on, NaN replaced by the previous value.
+        gaps (np.ndarray): Mask of the replaced values; the kernels set the windows holding one
+            of them to NaN (see _mask_gaps).
+    """
+    gaps = np.isnan(values)
+    rows = gaps.any(axis=1) if gaps.ndim > 1 else gaps
+    valid = np.flatnonzero(~rows)
+    first = valid[0] if len(valid) else len(values)
+    values, gaps = values[first:], gaps[first:]
+    if gaps.any():
+        index = np.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1))
+        index = np.maximum.accumulate(np.where(gaps, 0, index), axis=0)
+        values = np.take_along_axis(values, index, axis=0)
+    return first, values, gaps
+
+
+def _mask_gaps(out, gaps, span):
+    """Set to NaN the values of `out` (aligned with the gaps) whose last `span` rows hold a gap."""
+    if gaps.any():
+        with np.errstate(invalid='ignore'):
+            out[rolling._window_sums(gaps.astype(np.float64), span) > 0] = np.nan
+
+
+def _half_life_from_beta(beta):
+    # beta <= -1 overshoots the mean within one bar: half-life 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(beta < 0, -np.log(2) / np.log1p(np.maximum(beta, -1)), np.nan)
+
+
+def _centred_sums(x, y, window):
+    """Rolling centred sums Sxx and Sxy of two series (columns for 2-D arrays) from the
+    re-centred window sums of rolling._centred_window_sums (a spread is a price level)."""
+    columns = x.shape[1] if x.ndim > 1 else 1
+    values = np.concatenate((x.reshape(len(x), -1), y.reshape(len(y), -1)), axis=1)
+    pairs = [(c, c) for c in range(columns)] + [(c, columns + c) for c in range(columns)]
+    _, products = rolling._centred_window_sums(values, window, pairs)
+    sxx, sxy = products[:, :columns], products[:, columns:]
+    return (sxx, sxy) if x.ndim > 1 else (sxx[:, 0], sxy[:, 0])
+
+
+def rolling_zero_crossing_rate(values, window):
+    """
+    Fraction of the window-1 consecutive pairs of the last `window` values that change sign
+    (rolling version of rolling.zero_crossing_rate), O(1) per bar from the window sums of the
+    crossings.
+
+    Parameters:
+        values (np.ndarray): Series (or columns of a 2-D array).
+        window (int): Number of values in each window.
+
+    Returns:
+        np.ndarray: Rate at every bar (NaN until the window is full and for the windows
+        holding a NaN).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    first, values, gaps = _valid_tail(values)
+    crossings = (np.diff(np.sign(values), axis=0) != 0).astype(np.float64)
+    if window < 2 or len(crossings) < window - 1:
+        return out
+    out[first+1:] = rolling._window_sums(crossings, window - 1) / (window - 1)
+    _mask_gaps(out[first:], gaps, window)
+    return out
+
+
+def rolling_half_life(spread, window):
+    """
+    Ornstein-Uhlenbeck half-life (in bars) of a spread over every window: fit of the AR(1) model
+    diff(spread)[t] = alpha + beta * spread[t-1] on the last `window` differences, from the
+    window sums (O(1) per bar instead of one regression per window), and
+    half_life = -ln(2) / ln(1 + beta). NaN when the window does not revert (beta >= 0).
+
+    Parameters:
+        spread (np.ndarray): Spread or distance series (or columns of a 2-D array).
+        window (int): Number of differences in each window.
+
+    Returns:
+        np.ndarray: Half-life at every bar (NaN for the first `window` bars and for the windows
+        holding a NaN).
+    """
+    spread = np.asarray(spread, dtype=np.float64)
+    out = np.full(spread.shape, np.nan)
+    first, values, gaps = _valid_tail(spread)
+    if len(values) <= window:
+        return out
+    sxx, sxy = _centred_sums(values[:-1], np.diff(values, axis=0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[first+1:] = _half_life_from_beta(sxy / sxx)
+    _mask_gaps(out[first:], gaps, window + 1)
+    return out
+
+
+def half_life(spread):
+    """Ornstein-Uhlenbeck half-life (in bars) of a whole series (or of every column), NaN if it
+    does not revert. The differences next to a NaN are left out of the fit."""
+    spread = np.asarray(spread, dtype=np.float64)
+    lagged, change = spread[:-1], np.diff(spread, axis=0)
+    valid = ~(np.isnan(lagged) | np.isnan(change))
+    n = valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mx = np.where(valid, lagged, 0).sum(axis=0) / n
+        my = np.where(valid, change, 0).sum(axis=0) / n
+        sxx = np.where(valid, (lagged - mx)**2, 0).sum(axis=0)
+        sxy = np.where(valid, (lagged - mx) * (change - my), 0).sum(axis=0)
+        beta = np.where(n >= 2, sxy / sxx, np.nan)
+    out = _half_life_from_beta(beta)
+    return out if out.ndim else float(out)
+
+
+def rolling_hurst(values, window, lags=HURST_LAGS):
+    """
+    Rolling Hurst exponent from the scaling of the variance of the lagged differences,
+    Var(x[t] - x[t-lag]) ~ lag^(2H), over the last `window` values: one set of window sums per
+    lag (O(len(lags)) per bar) and a fixed least-squares fit of log variance on log lag.
+    H < 0.5 indicates a mean-reverting series, 0.5 a random walk, H > 0.5 a trending one.
+    Apply it to a level series (a price spread), not to returns.
+
+    Parameters:
+        values (np.ndarray): Series (or columns of a 2-D array).
+        window (int): Number of values in each window (larger than the largest lag + 1).
+        lags (tuple of int): Lags of the differences.
+
+    Returns:
+        np.ndarray: Hurst exponent at every bar (NaN until the window is full and for the
+        windows holding a NaN).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if window <= max(lags) + 1:
+        raise ValueError("window must be larger than the largest lag + 1")
+    out = np.full(values.shape, np.nan)
+    first, series, gaps = _valid_tail(values)
+    if len(series) < window:
+        return out
+
+    log_lags = np.log(np.asarray(lags, dtype=np.float64))
+    weights = (log_lags - log_lags.mean()) / np.sum((log_lags - log_lags.mean())**2)
+    slope = np.zeros(series[window-1:].shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for lag, weight in zip(lags, weights):
+            # the window-lag differences of the last `window` values
+            n = window - lag
+            change = series[lag:] - series[:-lag]
+            change = change - change[0]
+            s = rolling._window_sums(change, n)
+            ss = rolling._window_sums(change * change, n)
+            variance = np.maximum(ss - s * s / n, 0) / n
+            slope += weight * np.log(variance[window-1-lag:])
+    out[first+window-1:] = slope / 2
+    _mask_gaps(out[first:], gaps, window)
+    return out
+
+
+@instrumentation.instrumented('mean_reversion')
+def mean_reversion_stats(distance, window, spread=None):
+    """
+    Rolling mean-reversion statistics of a pair: zero-crossing rate and half-life of the distance
+    and, with the price spread, its Hurst exponent. Usable as entry filters (e.g.
+    half_life < maxHalfLife) or summarised for pair ranking.
+
+    Returns:
+        dict of np.ndarray: 'zero_crossing_rate', 'half_life' and 'hurst' (with spread).
+    """
+    stats = {
+        'zero_crossing_rate':   rolling_zero_crossing_rate(distance, window),
+        'half_life':            rolling_half_life(distance, window),
+    }
+    if spread is not None:
+        stats['hurst'] = rolling_hurst(spread, window)
+    return stats
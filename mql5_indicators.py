@@ -0,0 +1,192 @@
+"""
+Python reference implementations of the MQL5 indicators of this repository (PercentReturn.mq5,
+LinearRegression.mq5, Distance.mq5 and ZScore.mq5), computed for whole histories at once, and a
+parity check against the buffers exported from the terminal.
+
+The buffers follow the MQL5 code bar for bar, including its quirks: on the first OnCalculate
+call the historical bars of LinearRegression/Distance copy the buffers from one bar back
+(CopyBuffer at position rates_total - i), while the live bar and every bar that was live once
+(prev_calculated > 0) use the bar itself. `loaded_bars` (rates_total of the first call) tells
+where the history stops; the live values are the ones of the last tick, i.e. the bar close.
+
+    python mql5_indicators.py export.csv --lookback 100 --distance-lookback 20 --zscore-lookback 50
+"""
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import rolling
+
+# default inputs of the indicators
+LOOKBACK_PERIOD = 100           # LinearRegression.mq5
+DISTANCE_LOOKBACK_PERIOD = 20   # Distance.mq5 (passed to its LinearRegression handle)
+ZSCORE_LOOKBACK_PERIOD = 50     # ZScore.mq5
+
+# buffer columns of a terminal export (besides time, close_0 and close_1)
+BUFFERS = ('percent_return_0', 'percent_return_1', 'slope', 'intercept', 'distance', 'zscore')
+
+
+def percent_return(close):
+    """PercentReturn.mq5: (close[i] - close[i-1]) / close[i-1] * 100, and 0 for the first bar."""
+    close = np.asarray(close, dtype=np.float64)
+    out = np.zeros(len(close))
+    out[1:] = (close[1:] - close[:-1]) / close[:-1] * 100.0
+    return out
+
+
+def _live_start(N, loaded_bars):
+    # first bar computed as a live bar: the last bar of the first call and all the later ones
+    return N - 1 if loaded_bars is None else min(loaded_bars, N) - 1
+
+
+def linear_regression(close_0, close_1, lookback=LOOKBACK_PERIOD, loaded_bars=None):
+    """
+    LinearRegression.mq5: fit of the percent returns of the second symbol on those of the first
+    over `lookback` bars. The historical bars i >= lookback are fitted on the window ending at
+    bar i-1, the live bars on the window ending at bar i. Bar 0 is 0, bars 1 to lookback-1 are
+    never written (NaN).
+
+    Returns:
+        dict of np.ndarray: 'slope' and 'intercept'.
+    """
+    x, y = percent_return(close_0), percent_return(close_1)
+    N = len(x)
+    fit_slope, fit_intercept, _, _ = rolling.rolling_regression(x, y, lookback)
+    slope, intercept = np.full(N, np.nan), np.full(N, np.nan)
+    live = _live_start(N, loaded_bars)
+    if N:
+        slope[0], intercept[0] = 0.0, 0.0
+    historical = np.arange(lookback, max(live, lookback))
+    slope[historical], intercept[historical] = fit_slope[historical - 1], fit_intercept[historical - 1]
+    slope[live:], intercept[live:] = fit_slope[live:], fit_intercept[live:]
+    return {'slope': slope, 'intercept': intercept}
+
+
+def distance(close_0, close_1, lookback=DISTANCE_LOOKBACK_PERIOD, loaded_bars=None):
+    """
+    Distance.mq5: signed perpendicular distance of the percent returns from the regression line of
+    LinearRegression.mq5 (same `lookback` and `loaded_bars`). The historical bars take the returns
+    and the line of the previous bar, the live bars their own. Bar 0 is not computed (NaN).
+    """
+    x, y = percent_return(close_0), percent_return(close_1)
+    fit = linear_regression(close_0, close_1, lookback, loaded_bars)
+    N = len(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        own = rolling.perpendicular_distance(x, y, fit['slope'], fit['intercept'])
+    # the perpendicular slope -1/slope of the MQL5 formula is infinite for a flat line
+    own[fit['slope'] == 0] = np.nan
+    out = np.full(N, np.nan)
+    live = _live_start(N, loaded_bars)
+    if live > 1:
+        out[1:live] = own[:live-1]
+    out[max(live, 0):] = own[max(live, 0):]
+    return out
+
+
+def zscore(close_0, close_1, lookback=ZSCORE_LOOKBACK_PERIOD):
+    """ZScore.mq5: z-score of close_0 - close_1 over the last `lookback` bars (population std,
+    0 when the std is 0), from bar `lookback` on (NaN before)."""
+    spread = np.asarray(close_0, dtype=np.float64) - np.asarray(close_1, dtype=np.float64)
+    out = np.full(len(spread), np.nan)
+    if len(spread) <= lookback:
+        return out
+    z = rolling.rolling_distances(spread, spread, lookback, spread=spread, modes=('zscore',))['zscore']
+    out[lookback:] = z[lookback:]
+    return out
+
+
+def reference_buffers(
+        close_0,
+        close_1,
+        lookback = LOOKBACK_PERIOD,
+        distance_lookback = DISTANCE_LOOKBACK_PERIOD,
+        zscore_lookback = ZSCORE_LOOKBACK_PERIOD,
+        loaded_bars = None,
+        ):
+    """All the BUFFERS of the indicators for aligned closes of the two symbols."""
+    fit = linear_regression(close_0, close_1, lookback, loaded_bars)
+    return {
+        'percent_return_0': percent_return(close_0),
+        'percent_return_1': percent_return(close_1),
+        'slope':            fit['slope'],
+        'intercept':        fit['intercept'],
+        'distance':         distance(close_0, close_1, distance_lookback, loaded_bars),
+        'zscore':           zscore(close_0, close_1, zscore_lookback),
+    }
+
+
+def read_terminal_csv(path):
+    """
+    Read a CSV export of the indicator buffers: a `time` column (MT5 format '2024.10.09 10:00' or
+    ISO), `close_0`/`close_1` (the closes the indicators saw) and any of the BUFFERS, with the
+    separator of FileWrite (tab, ';' or ','). Empty values (EMPTY_VALUE) are read as NaN.
+    """
+    export = pd.read_csv(path, sep=None, engine='python')
+    export.columns = [column.strip().lower() for column in export.columns]
+    export['time'] = pd.to_datetime(export['time'].astype(str).str.replace('.', '-', n=2, regex=False))
+    export = export.replace(np.finfo(np.float64).max, np.nan)
+    return export.sort_values('time', kind='stable').reset_index(drop=True)
+
+
+def check_parity(
+        export,
+        lookback = LOOKBACK_PERIOD,
+        distance_lookback = DISTANCE_LOOKBACK_PERIOD,
+        zscore_lookback = ZSCORE_LOOKBACK_PERIOD,
+        loaded_bars = None,
+        rtol = 1e-6,
+        atol = 1e-9,
+        ):
+    """
+    Compare the buffers of a terminal export with the reference implementations.
+
+    Parameters:
+        export (pd.DataFrame or str): Output of read_terminal_csv (or its path).
+        lookback, distance_lookback, zscore_lookback (int): Inputs of the indicators.
+        loaded_bars (int): Bars of the history when the indicators were attached (default: all
+            the exported bars, i.e. only the last one was live).
+        rtol, atol (float): Tolerances of np.isclose.
+
+    Returns:
+        pd.DataFrame: One row per exported buffer: compared bars (both values defined),
+        mismatches, max absolute error and time of the first mismatch.
+    """
+    if isinstance(export, str):
+        export = read_terminal_csv(export)
+    reference = reference_buffers(
+        export['close_0'].to_numpy(), export['close_1'].to_numpy(),
+        lookback, distance_lookback, zscore_lookback, loaded_bars,
+        )
+    rows = []
+    for name in BUFFERS:
+        if name not in export.columns:
+            continue
+        actual = export[name].to_numpy(dtype=np.float64)
+        expected = reference[name]
+        compared = ~(np.isnan(actual) | np.isnan(expected))
+        bad = compared & ~np.isclose(actual, expected, rtol=rtol, atol=atol)
+        rows.append({
+            'buffer':           name,
+            'compared':         int(compared.sum()),
+            'mismatches':       int(bad.sum()),
+            'max_abs_error':    float(np.max(np.abs(actual - expected)[compared])) if compared.any() else np.nan,
+            'first_mismatch':   export['time'].iloc[np.argmax(bad)] if bad.any() else None,
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('export', help='CSV export of the indicator buffers (see read_terminal_csv)')
+    parser.add_argument('--lookback', type=int, default=LOOKBACK_PERIOD)
+    parser.add_argument('--distance-lookback', type=int, default=DISTANCE_LOOKBACK_PERIOD)
+    parser.add_argument('--zscore-lookback', type=int, default=ZSCORE_LOOKBACK_PERIOD)
+    parser.add_argument('--loaded-bars', type=int, default=None)
+    parser.add_argument('--rtol', type=float, default=1e-6)
+    parser.add_argument('--atol', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    report = check_parity(args.export, args.lookback, args.distance_lookback, args.zscore_lookback,
+                          args.loaded_bars, args.rtol, args.atol)
+    print(report.to_string(index=False))
+    sys.exit(1 if report['mismatches'].sum() else 0)
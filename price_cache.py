@@ -0,0 +1,237 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import functions as fns
+
+# columns of the GetPriceData output that are stored; the derived ones (hour, log_return,
+# indicators) are recomputed on load with fns.add_features (as GetPriceData does)
+RAW_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'tick_volume', 'spread', 'real_volume']
+CACHE_DIR = '.price_cache'
+# sources whose bars are not a fixed history: every fetch of a synthetic series is a new random
+# walk, so fetches can't be spliced together and these sources are never cached
+UNCACHED_SOURCES = ('synthetic',)
+
+
+def _cache_path(cache_dir, source, symbol, timeframe):
+    return os.path.join(cache_dir, source, symbol, timeframe)
+
+
+def source_key(source, source_kwargs):
+    """Folder of a source in the cache: the source name, followed by a hash of the source keyword
+    arguments when there are any (e.g. data_dir), so bars of different origins are never merged."""
+    if not source_kwargs:
+        return source
+    digest = hashlib.sha1(json.dumps(source_kwargs, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{source}-{digest[:12]}'
+
+
+def _to_epoch(time):
+    """Convert a datetime (or a datetime column) to int64 nanoseconds, dropping the timezone."""
+    time = pd.to_datetime(time)
+    if isinstance(time, pd.Timestamp):
+        return (time.tz_localize(None) if time.tzinfo else time).value
+    time = pd.Series(time)
+    if time.dt.tz is not None:
+        time = time.dt.tz_localize(None)
+    return time.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def _bar_duration(endTime, timeframe):
+    """Duration of one bar in nanoseconds (None if the timeframe has no fixed length, e.g. W1/MN1)."""
+    try:
+        return _to_epoch(endTime) - _to_epoch(fns.get_start_time(endTime, timeframe, 1))
+    except ValueError:
+        return None
+
+
+def load_cache(cache_dir, source, symbol, timeframe):
+    """
+    Load the cached bars of a symbol as memory-mapped column arrays.
+
+    Returns:
+        columns (dict of np.ndarray or None): 'time' (int64 ns) and the raw price columns.
+        meta (dict): Cache metadata ('covered_until', 'history_start').
+    """
+    path = _cache_path(cache_dir, source, symbol, timeframe)
+    meta_file = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None, {}
+    with open(meta_file) as f:
+        meta = json.load(f)
+    columns = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        for name in meta['columns']
+    }
+    return columns, meta
+
+
+def save_cache(cache_dir, source, symbol, timeframe, columns, meta):
+    path = _cache_path(cache_dir, source, symbol, timeframe)
+    os.makedirs(path, exist_ok=True)
+    for name, values in columns.items():
+        # write to a temporary file first so an interrupted run never leaves a broken column
+        tmp = os.path.join(path, f'{name}.tmp.npy')
+        np.save(tmp, np.ascontiguousarray(values))
+        os.replace(tmp, os.path.join(path, f'{name}.npy'))
+    meta = dict(meta, columns=list(columns))
+    tmp = os.path.join(path, 'meta.tmp.json')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+
+
+def _frame_to_columns(rates):
+    columns = {'time': _to_epoch(rates['time'])}
+    for name in RAW_COLUMNS:
+        if name in rates.columns:
+            columns[name] = rates[name].to_numpy()
+    return columns
+
+
+def _merge(new, old):
+    """Merge two column dicts on time; bars present in both are taken from `new`
+    (the last cached bar may have been fetched while it was still forming)."""
+    if old is None:
+        order = np.argsort(new['time'], kind='stable')
+        return {name: np.asarray(values)[order] for name, values in new.items()}
+    names = [name for name in old if name in new]
+    time = np.concatenate((new['time'], old['time']))
+    # np.unique keeps the first occurrence, i.e. the freshly fetched bar
+    _, first = np.unique(time, return_index=True)
+    return {name: np.concatenate((new[name], old[name]))[first] for name in names}
+
+
+def _fetch(symbol, endTime, timeframe, Nbars, source, source_kwargs):
+    rates = fns.GetPriceData(symbol, endTime, timeframe, Nbars, source=source, **source_kwargs)
+    return _frame_to_columns(rates)
+
+
+def _output(window, features, source, indicators_dict, MA_period, as_arrays, compact):
+    """Return a window of bars (and of the indicator `features`) in the requested format."""
+    if compact:
+        return fns.to_compact(window, fns.COMPACT_COLUMNS + features)
+    if as_arrays:
+        return window
+
+    rates = pd.DataFrame({name: np.asarray(values) for name, values in window.items()})
+    rates['time'] = pd.to_datetime(rates['time'], unit='ns')
+    if source != 'yfinance':
+        rates = fns.add_features(rates.drop(columns=features), indicators_dict, MA_period)
+        # add_features may drop rows, the indicators follow the remaining index
+        for name in features:
+            rates[name] = window[name][rates.index.to_numpy()]
+    return rates
+
+
+def GetPriceDataCached(
+        symbol,
+        endTime = datetime.now(),
+        timeframe = 'M5',
+        Nbars = 1000,
+        source = 'MT5',
+        indicators_dict = {
+            'ATR':      False,
+            'ADX':      False,
+            'RSI':      False,
+        },
+        MA_period = 20,
+        cache_dir = CACHE_DIR,
+        as_arrays = False,
+        compact = False,
+        indicator_periods = None,
+        **source_kwargs,
+        ):
+    """
+    Same as fns.GetPriceData, but the bars are kept in an on-disk columnar cache
+    (one .npy file per column, keyed by source/symbol/timeframe, see source_key). Only the bars
+    that are missing before or after the cached range are downloaded. The UNCACHED_SOURCES
+    (synthetic bars) are fetched directly.
+
+    Parameters:
+        cache_dir (str): Root folder of the cache.
+        as_arrays (bool): If True, return a dict of zero-copy memory-mapped slices
+            ('time' as int64 ns and the raw price columns) instead of a DataFrame.
+        compact (bool): If True, return fns.to_compact of the bars (time and OHLC columns
+            as contiguous float32 arrays).
+        indicator_periods (list of int): If given, add the ATR, ADX, RSI and volatility columns
+            of every period (f'ATR_{period}', ...), computed on the whole cached history by
+            indicators.cached_indicators and stored next to the bars.
+        source_kwargs: Passed to the data source (e.g. data_dir for source='file').
+
+    Returns:
+        pd.DataFrame (or dict of np.ndarray): The last Nbars bars up to endTime.
+    """
+    if source in UNCACHED_SOURCES:
+        window = _fetch(symbol, endTime, timeframe, Nbars, source, source_kwargs)
+        features = []
+        if indicator_periods:
+            import indicators
+            high, low, close = (np.asarray(window[name], dtype=np.float64) for name in ('high', 'low', 'close'))
+            computed, _ = indicators.compute_indicators(high, low, close, indicator_periods)
+            window.update(computed)
+            features = list(computed)
+        return _output(window, features, source, indicators_dict, MA_period, as_arrays, compact)
+
+    store = source_key(source, source_kwargs)
+    end = _to_epoch(endTime)
+    columns, meta = load_cache(cache_dir, store, symbol, timeframe)
+    if columns is not None and len(columns['time']) == 0:
+        columns = None
+
+    if columns is None:
+        new = _fetch(symbol, endTime, timeframe, Nbars, source, source_kwargs)
+        meta = {'covered_until': int(end)}
+        if len(new['time']) < Nbars:
+            meta['history_start'] = int(new['time'][0]) if len(new['time']) else int(end)
+        columns = _merge(new, None)
+        save_cache(cache_dir, store, symbol, timeframe, columns, meta)
+        columns, meta = load_cache(cache_dir, store, symbol, timeframe)
+
+    # fetch the missing tail (bars after the cached range)
+    if end > meta['covered_until']:
+        last = int(columns['time'][-1])
+        bar = _bar_duration(endTime, timeframe)
+        # upper bound of the number of missing bars from the calendar time
+        Ntail = Nbars if bar is None else min(Nbars, int((end - last) // bar) + 1)
+        new = _fetch(symbol, endTime, timeframe, Ntail, source, source_kwargs)
+        if len(new['time']) == Ntail and len(new['time']) and new['time'].min() > last:
+            # the new bars don't reach the cache, drop the old range to keep it contiguous
+            columns = _merge(new, None)
+            meta = {'covered_until': int(end)}
+        else:
+            columns = _merge(new, columns)
+            meta['covered_until'] = int(end)
+        save_cache(cache_dir, store, symbol, timeframe, columns, meta)
+        columns, meta = load_cache(cache_dir, store, symbol, timeframe)
+
+    # fetch the missing head (bars before the cached range)
+    hi = int(np.searchsorted(columns['time'], end, side='right'))
+    if hi < Nbars and 'history_start' not in meta:
+        first = pd.Timestamp(int(columns['time'][0]))
+        # the first cached bar is fetched again, hence the +1
+        Nhead = Nbars - hi + 1
+        if hi == 0:
+            # endTime is before the cached range, also fill the gap up to the first cached bar
+            bar = _bar_duration(endTime, timeframe)
+            Nhead += Nbars if bar is None else int((int(columns['time'][0]) - end) // bar) + 1
+        new = _fetch(symbol, first, timeframe, Nhead, source, source_kwargs)
+        if len(new['time']) < Nhead:
+            meta['history_start'] = int(new['time'][0]) if len(new['time']) else int(first.value)
+        columns = _merge(new, columns)
+        save_cache(cache_dir, store, symbol, timeframe, columns, meta)
+        columns, meta = load_cache(cache_dir, store, symbol, timeframe)
+        hi = int(np.searchsorted(columns['time'], end, side='right'))
+
+    lo = max(hi - Nbars, 0)
+    window = {name: values[lo:hi] for name, values in columns.items()}
+    features = []
+    if indicator_periods:
+        import indicators
+        stored = indicators.cached_indicators(columns, store, symbol, timeframe, indicator_periods,
+                                              cache_dir=cache_dir)
+        window.update({name: values[lo:hi] for name, values in stored.items()})
+        features = list(stored)
+    return _output(window, features, source, indicators_dict, MA_period, as_arrays, compact)
@@ -0,0 +1,289 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import rolling
+from rolling import _jit
+
+# hmmlearn is imported lazily, only when a model has to be fitted or rebuilt
+REGIME_FEATURES = ['distance', 'volatility', 'r2']
+CACHE_DIR = '.regime_cache'
+PARAMS = ['startprob', 'transmat', 'means', 'covars', 'scale_mean', 'scale_std']
+
+
+def regime_features(data, LoopbackBars=20):
+    """
+    Per-bar features of the pair regimes: the distance, the rolling volatility (mean of the rolling
+    standard deviations of both log returns) and the R2 of the rolling regression.
+
+    Parameters:
+        data (pd.DataFrame): Pair data with the columns distance, r2, log_return_0 and log_return_1.
+        LoopbackBars (int): Window of the rolling volatility.
+
+    Returns:
+        np.ndarray: Features, shape (bars, 3), NaN where they are not defined yet.
+    """
+    returns = data[['log_return_0', 'log_return_1']].to_numpy(dtype=np.float64)
+    returns = returns - returns[0]
+    s = rolling._window_sums(returns, LoopbackBars)
+    ss = rolling._window_sums(returns * returns, LoopbackBars)
+    volatility = np.sqrt(np.maximum(ss - s * s / LoopbackBars, 0) / LoopbackBars).mean(axis=1)
+    return np.column_stack((
+        data['distance'].to_numpy(dtype=np.float64),
+        volatility,
+        data['r2'].to_numpy(dtype=np.float64),
+    ))
+
+
+def _build_model(n_states, covariance_type, n_iter, seed, params=None):
+    from hmmlearn.hmm import GaussianHMM
+    model = GaussianHMM(
+        n_components=n_states,
+        covariance_type=covariance_type,
+        n_iter=n_iter,
+        random_state=seed,
+        # with stored parameters nothing is re-initialized (warm start)
+        init_params='' if params is not None else 'stmc',
+        )
+    if params is not None:
+        model.n_features = params['means'].shape[1]
+        model.startprob_ = params['startprob']
+        model.transmat_ = params['transmat']
+        model.means_ = params['means']
+        model.covars_ = params['covars']
+    return model
+
+
+def _model_params(model):
+    # covars_ always returns full matrices, the setter expects the shape of the covariance type
+    covars = model.covars_
+    if model.covariance_type == 'diag':
+        covars = np.diagonal(covars, axis1=1, axis2=2)
+    elif model.covariance_type == 'spherical':
+        covars = np.diagonal(covars, axis1=1, axis2=2).mean(axis=1)
+    elif model.covariance_type == 'tied':
+        covars = covars[0]
+    return {
+        'startprob':    model.startprob_,
+        'transmat':     model.transmat_,
+        'means':        model.means_,
+        'covars':       covars,
+    }
+
+
+def _log_emission(model, X):
+    """Log-likelihood of every row of X under the Gaussian of every state, shape (rows, states)."""
+    from scipy.stats import multivariate_normal
+    return np.column_stack([
+        multivariate_normal.logpdf(X, mean, covar)
+        for mean, covar in zip(model.means_, model.covars_)
+    ]).reshape(len(X), -1)
+
+
+def _sort_states(params, covariance_type):
+    """Relabel the states by increasing mean volatility, so the labels keep their meaning across refits."""
+    order = np.argsort(params['means'][:, REGIME_FEATURES.index('volatility')])
+    params = dict(params)
+    params['startprob'] = params['startprob'][order]
+    params['transmat'] = params['transmat'][order][:, order]
+    params['means'] = params['means'][order]
+    if covariance_type != 'tied':
+        # a tied covariance is shared by all the states
+        params['covars'] = params['covars'][order]
+    return params
+
+
+@_jit
+def _forward_filter(log_emission, startprob, transmat):
+    # normalized forward recursion: P(state at t | bars up to t)
+    N, K = log_emission.shape
+    filtered = np.empty((N, K))
+    prior = startprob.copy()
+    for t in range(N):
+        row = log_emission[t]
+        peak = row.max()
+        total = 0.0
+        for k in range(K):
+            filtered[t, k] = prior[k] * np.exp(row[k] - peak)
+            total += filtered[t, k]
+        for k in range(K):
+            filtered[t, k] /= total
+        for j in range(K):
+            prior[j] = 0.0
+            for k in range(K):
+                prior[j] += filtered[t, k] * transmat[k, j]
+    return filtered
+
+
+def _load_index(cache_dir):
+    path = os.path.join(cache_dir, 'index.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_model(cache_dir, key, params, entry):
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to temporary files first so an interrupted run never leaves a broken model
+    tmp = os.path.join(cache_dir, f'{key}.tmp.npz')
+    np.savez(tmp, **params)
+    os.replace(tmp, os.path.join(cache_dir, f'{key}.npz'))
+    index = _load_index(cache_dir)
+    index[key] = entry
+    tmp = os.path.join(cache_dir, 'index.tmp.json')
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, os.path.join(cache_dir, 'index.json'))
+
+
+def _load_params(cache_dir, key):
+    with np.load(os.path.join(cache_dir, f'{key}.npz')) as params:
+        return {name: params[name] for name in PARAMS}
+
+
+class RegimeModel:
+    """Fitted HMM with the feature scaling it was fitted with (see fit_regimes)."""
+
+    def __init__(self, model, scale_mean, scale_std, key, warm_started):
+        self.model = model
+        self.scale_mean = scale_mean
+        self.scale_std = scale_std
+        self.key = key
+        self.warm_started = warm_started
+
+    def labels(self, features):
+        """Most likely regime sequence (Viterbi), -1 where the features are NaN. The label of a
+        bar depends on the later bars: use it for plots, and filtered_labels to gate trades."""
+        features = np.asarray(features, dtype=np.float64)
+        valid = ~np.isnan(features).any(axis=1)
+        labels = np.full(len(features), -1, dtype=np.int64)
+        if valid.any():
+            labels[valid] = self.model.predict((features[valid] - self.scale_mean) / self.scale_std)
+        return labels
+
+    def filtered_probabilities(self, features):
+        """
+        Probability of every regime at every bar given only the bars up to it (forward pass of
+        the HMM, no look-ahead), NaN where the features are NaN. The model parameters are those
+        of the fitted range: for a strict out-of-sample test, fit on the training bars only.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        valid = ~np.isnan(features).any(axis=1)
+        probabilities = np.full((len(features), self.model.n_components), np.nan)
+        if valid.any():
+            log_emission = _log_emission(self.model, (features[valid] - self.scale_mean) / self.scale_std)
+            probabilities[valid] = _forward_filter(
+                np.ascontiguousarray(log_emission), self.model.startprob_, self.model.transmat_)
+        return probabilities
+
+    def filtered_labels(self, features):
+        """Most likely regime of every bar given the bars up to it (see filtered_probabilities),
+        -1 where the features are NaN. Causal, so it can gate the entries of a backtest."""
+        probabilities = self.filtered_probabilities(features)
+        valid = ~np.isnan(probabilities).any(axis=1)
+        labels = np.full(len(probabilities), -1, dtype=np.int64)
+        labels[valid] = probabilities[valid].argmax(axis=1)
+        return labels
+
+
+def fit_regimes(
+        features,
+        time,
+        name = '',
+        n_states = 3,
+        covariance_type = 'full',
+        n_iter = 100,
+        warm_iter = 10,
+        seed = 0,
+        feature_settings = None,
+        cache_dir = CACHE_DIR,
+        ):
+    """
+    Fit a Gaussian HMM on the regime features, with the fitted models cached on disk.
+
+    A model is keyed by the data range (first/last bar time and number of bars), a fingerprint of
+    the features and the hyperparameters, so re-running a study loads it instead of fitting it.
+    When new bars were appended (same first bar, later last bar), the latest cached model of the
+    same `name`, hyperparameters and feature_settings is used as the starting point and only
+    refined with warm_iter EM iterations (and its feature scaling is kept), instead of a fit from
+    scratch. If the warm-started fit fails, the model is fitted from scratch.
+    The states are sorted by increasing volatility: label 0 is the calmest regime.
+
+    Parameters:
+        features (np.ndarray): Output of regime_features.
+        time (array-like): Bar times, same length as features.
+        name (str): Name of the series (e.g. 'EURUSD_GBPUSD_M5'), models are only warm-started
+            from models of the same name.
+        n_states (int): Number of regimes.
+        covariance_type (str): Covariance type of the HMM ('full', 'diag', 'spherical' or 'tied').
+        n_iter (int): EM iterations of a fit from scratch.
+        warm_iter (int): EM iterations of a warm-started fit.
+        seed (int): Random state of the fit.
+        feature_settings (dict): Settings the features were computed with (e.g. distance mode,
+            hedge model, LoopbackBars): models are only warm-started from the same settings.
+        cache_dir (str): Directory of the cached models.
+
+    Returns:
+        RegimeModel: Use `.filtered_labels(features)` for causal per-bar regime labels and
+        `.labels(features)` for the Viterbi path (plots).
+    """
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    valid = ~np.isnan(features).any(axis=1)
+    time = pd.to_datetime(pd.Series(np.asarray(time))).to_numpy(dtype='datetime64[ns]').view(np.int64)[valid]
+    X = features[valid]
+    if len(X) == 0:
+        raise ValueError("No bar with all the regime features")
+
+    hyperparameters = {
+        'name':             name,
+        'n_states':         n_states,
+        'covariance_type':  covariance_type,
+        'n_iter':           n_iter,
+        'seed':             seed,
+        'features':         REGIME_FEATURES,
+        'feature_settings': feature_settings or {},
+    }
+    entry = {
+        'hyperparameters':  hyperparameters,
+        'start':            int(time[0]),
+        'end':              int(time[-1]),
+        'bars':             len(X),
+        'fingerprint':      hashlib.sha1(X.tobytes()).hexdigest(),
+    }
+    key = hashlib.sha1(json.dumps(entry, sort_keys=True).encode()).hexdigest()[:20]
+
+    index = _load_index(cache_dir)
+    if key in index:
+        params = _load_params(cache_dir, key)
+        model = _build_model(n_states, covariance_type, n_iter, seed, params)
+        return RegimeModel(model, params['scale_mean'], params['scale_std'], key, warm_started=False)
+
+    # latest cached model of the same series, hyperparameters and first bar, fitted before the
+    # last bars were appended
+    previous = [k for k, e in index.items() if e['hyperparameters'] == hyperparameters
+                and e['start'] == entry['start'] and e['end'] < entry['end']
+                and os.path.exists(os.path.join(cache_dir, f'{k}.npz'))]
+    model = None
+    if previous:
+        params = _load_params(cache_dir, max(previous, key=lambda k: index[k]['end']))
+        scale_mean, scale_std = params['scale_mean'], params['scale_std']
+        model = _build_model(n_states, covariance_type, warm_iter, seed, params)
+        try:
+            model.fit((X - scale_mean) / scale_std)
+        except (ValueError, np.linalg.LinAlgError):
+            # e.g. a degenerate covariance after the refit: fit from scratch instead
+            model = None
+    warm_started = model is not None
+    if model is None:
+        scale_mean, scale_std = X.mean(axis=0), X.std(axis=0)
+        scale_std[scale_std == 0] = 1
+        model = _build_model(n_states, covariance_type, n_iter, seed)
+        model.fit((X - scale_mean) / scale_std)
+
+    params = _sort_states(_model_params(model), covariance_type)
+    params['scale_mean'], params['scale_std'] = scale_mean, scale_std
+    _save_model(cache_dir, key, params, entry)
+    model = _build_model(n_states, covariance_type, n_iter, seed, params)
+    return RegimeModel(model, scale_mean, scale_std, key, warm_started=warm_started)
@@ -0,0 +1,171 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import functions as fns
+import price_cache
+
+# length of the timeframes of the MT5 table (ConvertTimeFrametoMT5) in minutes; W1 and MN1 are
+# calendar periods, their value is only an upper bound used to size the base download
+TIMEFRAME_MINUTES = {
+    'M1': 1, 'M2': 2, 'M3': 3, 'M4': 4, 'M5': 5, 'M6': 6, 'M10': 10, 'M12': 12, 'M15': 15,
+    'M20': 20, 'M30': 30, 'H1': 60, 'H2': 120, 'H3': 180, 'H4': 240, 'H6': 360, 'H8': 480,
+    'H12': 720, 'D1': 1440, 'W1': 7 * 1440, 'MN1': 31 * 1440,
+}
+# GetPriceData_MT5 moves the server times back by 2 hours (London time): the MT5 bars start on
+# round server times, so the buckets are computed in server time
+SERVER_SHIFT_HOURS = 2
+
+_MINUTE = 60 * 10**9
+# 1970-01-01 is a Thursday, the W1 bars start on Sunday
+_WEEK_ORIGIN = 3 * 1440 * _MINUTE
+
+SUM_COLUMNS = ('volume', 'tick_volume', 'real_volume')
+
+
+def bar_starts(time, timeframe, shift_hours = SERVER_SHIFT_HOURS):
+    """
+    Start time of the `timeframe` bar holding every time (int64 ns, London time as returned by
+    GetPriceData), with the bar boundaries of the MT5 server (London time + shift_hours).
+    """
+    if timeframe not in TIMEFRAME_MINUTES:
+        raise ValueError(f"Unknown timeframe: {timeframe} (available: {', '.join(TIMEFRAME_MINUTES)})")
+    shift = shift_hours * 60 * _MINUTE
+    server = np.asarray(time, dtype=np.int64) + shift
+    if timeframe == 'MN1':
+        starts = server.astype('datetime64[ns]').astype('datetime64[M]').astype('datetime64[ns]').view(np.int64)
+    elif timeframe == 'W1':
+        length = TIMEFRAME_MINUTES['W1'] * _MINUTE
+        starts = (server - _WEEK_ORIGIN) // length * length + _WEEK_ORIGIN
+    else:
+        length = TIMEFRAME_MINUTES[timeframe] * _MINUTE
+        starts = server // length * length
+    return starts - shift
+
+
+def resample_bars(columns, timeframe, shift_hours = SERVER_SHIFT_HOURS):
+    """
+    Aggregate sorted bars into `timeframe` bars in one vectorized pass (np.ufunc.reduceat over the
+    runs of equal bar starts): first open, highest high, lowest low, last close, summed volumes
+    and the smallest spread. The last bar may be incomplete (still forming, as in MT5).
+
+    Parameters:
+        columns (dict of np.ndarray): 'time' (int64 ns, increasing) and the raw price columns,
+            e.g. price_cache.load_cache or GetPriceDataCached(..., as_arrays=True).
+        timeframe (str): Target timeframe (a key of TIMEFRAME_MINUTES), longer than the bars.
+        shift_hours (int): Hours from the bar times to the server time of the bar boundaries.
+
+    Returns:
+        dict of np.ndarray: 'time' (start of each bar) and the aggregated columns.
+    """
+    time = np.asarray(columns['time'], dtype=np.int64)
+    starts = bar_starts(time, timeframe, shift_hours)
+    first = np.flatnonzero(np.diff(starts, prepend=starts[:1] - 1)) if len(time) else np.empty(0, dtype=np.intp)
+    last = np.append(first[1:], len(time)) - 1
+    out = {'time': starts[first]}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if name == 'time':
+            continue
+        if name == 'open':
+            out[name] = values[first]
+        elif name == 'close':
+            out[name] = values[last]
+        elif len(first) == 0:
+            out[name] = values[:0]
+        elif name == 'high':
+            out[name] = np.maximum.reduceat(values, first)
+        elif name == 'low' or name == 'spread':
+            out[name] = np.minimum.reduceat(values, first)
+        elif name in SUM_COLUMNS:
+            out[name] = np.add.reduceat(values, first)
+    return out
+
+
+def _resample_cached(base, store, symbol, timeframe, base_timeframe, shift_hours, cache_dir):
+    """Resampled bars of the whole cached base history, stored in the price cache under
+    '<timeframe>_from_<base>' of the source folder `store` (price_cache.source_key). When the base
+    history was extended, only the bars from the last stored bar on (which may have been
+    incomplete) are aggregated again."""
+    key = f'{timeframe}_from_{base_timeframe}'
+    base_time = np.asarray(base['time'])
+    cached, meta = price_cache.load_cache(cache_dir, store, symbol, key)
+    if cached is not None and meta.get('shift_hours') == shift_hours and len(cached['time']) \
+            and meta['base_first'] == int(base_time[0]) and meta['base_bars'] <= len(base_time):
+        if meta['base_bars'] == len(base_time) and meta['base_last'] == int(base_time[-1]):
+            return cached
+        # aggregate again from the first base bar of the last stored bar
+        lo = int(np.searchsorted(base_time, cached['time'][-1]))
+        new = resample_bars({name: values[lo:] for name, values in base.items()}, timeframe, shift_hours)
+        columns = {name: np.concatenate((cached[name][:-1], new[name])) for name in new}
+    else:
+        columns = resample_bars(base, timeframe, shift_hours)
+    meta = {
+        'base_first':   int(base_time[0]),
+        'base_last':    int(base_time[-1]),
+        'base_bars':    len(base_time),
+        'shift_hours':  shift_hours,
+    }
+    price_cache.save_cache(cache_dir, store, symbol, key, columns, meta)
+    return price_cache.load_cache(cache_dir, store, symbol, key)[0]
+
+
+def GetPriceDataResampled(
+        symbol,
+        endTime = datetime.now(),
+        timeframe = 'H1',
+        Nbars = 1000,
+        source = 'MT5',
+        base_timeframe = 'M1',
+        indicators_dict = {
+            'ATR':      False,
+            'ADX':      False,
+            'RSI':      False,
+        },
+        MA_period = 20,
+        shift_hours = SERVER_SHIFT_HOURS,
+        cache_dir = price_cache.CACHE_DIR,
+        as_arrays = False,
+        compact = False,
+        **source_kwargs,
+        ):
+    """
+    Same as fns.GetPriceData, but the bars are built from the cached base_timeframe bars
+    (GetPriceDataCached) instead of being downloaded: a multi-timeframe study downloads the M1
+    history once and derives M5/H1/D1/... from it. The resampled bars are cached as well.
+
+    Parameters:
+        base_timeframe (str): Timeframe of the downloaded bars, shorter than `timeframe`.
+        shift_hours (int): Hours from the London times of the bars to the server time of the bar
+            boundaries (see SERVER_SHIFT_HOURS).
+        cache_dir, as_arrays, compact, source_kwargs: As in price_cache.GetPriceDataCached.
+
+    Returns:
+        pd.DataFrame (or dict of np.ndarray): The last Nbars bars up to endTime.
+    """
+    for name in (timeframe, base_timeframe):
+        if name not in TIMEFRAME_MINUTES:
+            raise ValueError(f"Unknown timeframe: {name} (available: {', '.join(TIMEFRAME_MINUTES)})")
+    if TIMEFRAME_MINUTES[base_timeframe] >= TIMEFRAME_MINUTES[timeframe]:
+        raise ValueError(f"The base timeframe {base_timeframe} must be shorter than {timeframe}")
+
+    # every bar holds at most `ratio` base bars, one more bar covers an incomplete first bar
+    ratio = -(-TIMEFRAME_MINUTES[timeframe] // TIMEFRAME_MINUTES[base_timeframe])
+    base = price_cache.GetPriceDataCached(symbol, endTime, base_timeframe, (Nbars + 1) * ratio, source=source,
+                                          cache_dir=cache_dir, as_arrays=True, **source_kwargs)
+    if source in price_cache.UNCACHED_SOURCES:
+        columns = resample_bars(base, timeframe, shift_hours)
+    else:
+        store = price_cache.source_key(source, source_kwargs)
+        base, _ = price_cache.load_cache(cache_dir, store, symbol, base_timeframe)
+        columns = _resample_cached(base, store, symbol, timeframe, base_timeframe, shift_hours, cache_dir)
+
+    hi = int(np.searchsorted(columns['time'], price_cache._to_epoch(endTime), side='right'))
+    window = {name: values[max(hi - Nbars, 0):hi] for name, values in columns.items()}
+    if compact:
+        return fns.to_compact(window)
+    if as_arrays:
+        return window
+
+    rates = pd.DataFrame({name: np.asarray(values) for name, values in window.items()})
+    rates['time'] = pd.to_datetime(rates['time'], unit='ns')
+    return fns.add_features(rates, indicators_dict, MA_period)
@@ -0,0 +1,298 @@
+import numpy as np
+import instrumentation
+
+try:
+    from numba import njit
+    def _jit(func):
+        return njit(cache=True)(func)
+except ImportError:
+    # numba is optional, the kernels still run (slower) as plain python
+    def _jit(func):
+        return func
+
+
+def _window_sums(values, window):
+    """Sum of every window of length `window` ending at index i (NaN for the first window-1 bars).
+    2-D inputs are summed along the first axis (one column per series)."""
+    out = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return out
+    csum = np.cumsum(values, axis=0)
+    csum = np.concatenate((np.zeros((1,) + values.shape[1:]), csum))
+    out[window-1:] = csum[window:] - csum[:-window]
+    return out
+
+
+def _centred_window_sums(values, window, pairs):
+    """
+    Rolling means and centred sums of products of the columns of a stacked (N, K) array, from
+    window sums of prefix sums that restart every `window` rows. Each block of `window` rows is
+    centred on its first row, so the sums only grow over one block and hold the deviations from
+    a nearby value (a window spans two blocks, the part in the previous block is moved to the
+    reference of the last one). On price levels over millions of bars this keeps the error of
+    sum(x^2) - sum(x)^2/n close to the one of a two-pass sum, unlike a single cumulative sum.
+
+    Parameters:
+        values (np.ndarray): (N, K) array of series without NaN.
+        window (int): Number of rows in each window.
+        pairs (list of tuple): Column pairs (j, k) of the centred sums of products.
+
+    Returns:
+        mean (np.ndarray): (N, K) window means.
+        products (np.ndarray): (N, len(pairs)) sums of (v_j - mean_j) * (v_k - mean_k).
+        Both NaN for the first window-1 rows.
+    """
+    N, K = values.shape
+    mean = np.full((N, K), np.nan)
+    products = np.full((N, len(pairs)), np.nan)
+    if N < window:
+        return mean, products
+    blocks = -(-N // window)
+    ref = values[::window].T
+    j, k = np.array(pairs, dtype=np.intp).reshape(-1, 2).T
+    # (term, block, row) layout: the prefix sums of every block run over contiguous memory
+    u = np.zeros((K, blocks, window))
+    u.reshape(K, -1)[:, :N] = values.T
+    u -= ref[:, :, None]
+    u.reshape(K, -1)[:, N:] = 0
+    prefix = np.concatenate((u, u[j] * u[k]))
+    del u
+    np.cumsum(prefix, axis=2, out=prefix)
+    total = prefix[:, :, -1:]
+
+    # the window ending at row r of block b holds the rows 0..r of block b and the last
+    # window-1-r rows of block b-1, whose sums are moved from ref[b-1] to ref[b]
+    m = np.arange(window - 1, -1, -1, dtype=np.float64)
+    d = (ref[:, :-1] - ref[:, 1:])[:, :, None]
+    prev = total[:, :-1] - prefix[:, :-1]
+    sums = prefix[:, 1:] + prev
+    sums[:K] += m * d
+    sums[K:] += d[k] * prev[j] + d[j] * prev[k] + m * d[j] * d[k]
+    sums = np.concatenate((total[:, 0], sums.reshape(len(sums), -1)), axis=1)[:, :N - window + 1]
+
+    s1 = sums[:K]
+    mean[window-1:] = (np.repeat(ref, window, axis=1)[:, window-1:N] + s1 / window).T
+    products[window-1:] = (sums[K:] - s1[j] * s1[k] / window).T
+    return mean, products
+
+
+def _rolling_moments_cumsum(x, y, window):
+    mean, products = _centred_window_sums(np.column_stack((x, y)), window, [(0, 0), (1, 1), (0, 1)])
+    return mean[:, 0], mean[:, 1], products[:, 0], products[:, 1], products[:, 2]
+
+
+@_jit
+def _rolling_moments_welford(x, y, window, resync=64):
+    N = len(x)
+    mx_out = np.full(N, np.nan)
+    my_out = np.full(N, np.nan)
+    sxx_out = np.full(N, np.nan)
+    syy_out = np.full(N, np.nan)
+    sxy_out = np.full(N, np.nan)
+    n = 0
+    mx = 0.0
+    my = 0.0
+    sxx = 0.0
+    syy = 0.0
+    sxy = 0.0
+    for i in range(N):
+        # remove the point that leaves the window
+        if n == window:
+            xo = x[i-window]
+            yo = y[i-window]
+            n -= 1
+            dx = xo - mx
+            dy = yo - my
+            mx -= dx / n
+            my -= dy / n
+            sxx -= dx * (xo - mx)
+            syy -= dy * (yo - my)
+            sxy -= dx * (yo - my)
+        # add the new point
+        n += 1
+        dx = x[i] - mx
+        dy = y[i] - my
+        mx += dx / n
+        my += dy / n
+        sxx += dx * (x[i] - mx)
+        syy += dy * (y[i] - my)
+        sxy += dx * (y[i] - my)
+        # every `resync` windows recompute the moments of the current window with an
+        # exact two-pass sum, so the rounding error of the sliding updates stays bounded
+        if n == window and (i + 1) % (resync * window) == 0:
+            mx = 0.0
+            my = 0.0
+            for j in range(i - window + 1, i + 1):
+                mx += x[j]
+                my += y[j]
+            mx /= window
+            my /= window
+            sxx = 0.0
+            syy = 0.0
+            sxy = 0.0
+            for j in range(i - window + 1, i + 1):
+                sxx += (x[j] - mx) * (x[j] - mx)
+                syy += (y[j] - my) * (y[j] - my)
+                sxy += (x[j] - mx) * (y[j] - my)
+        if n == window:
+            mx_out[i] = mx
+            my_out[i] = my
+            sxx_out[i] = sxx
+            syy_out[i] = syy
+            sxy_out[i] = sxy
+    return mx_out, my_out, sxx_out, syy_out, sxy_out
+
+
+def rolling_moments(x, y, window, stable=False):
+    """
+    Rolling means and centred second moments of two series in a single O(N) pass.
+    The value at index i describes the window x[i-window+1:i+1] (NaN for the first window-1 bars).
+
+    Parameters:
+        x, y (np.ndarray): Input series of equal length (must not contain NaN).
+        window (int): Number of bars in each window.
+        stable (bool): If True, use a Welford-style sliding update (periodically resynchronised
+            with an exact two-pass sum) instead of the blockwise re-centred window sums
+            (_centred_window_sums). Both keep the rounding error bounded on long M1 histories,
+            the window sums are faster without numba.
+
+    Returns:
+        tuple of np.ndarray: mean_x, mean_y, Sxx, Syy, Sxy (sums of centred squares/products).
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    if len(x) != len(y):
+        raise ValueError("x and y must have the same length")
+    if window < 2:
+        raise ValueError("window must be at least 2")
+    if len(x) == 0:
+        empty = np.empty(0)
+        return empty, empty, empty, empty, empty
+    if stable:
+        return _rolling_moments_welford(x, y, window)
+    return _rolling_moments_cumsum(x, y, window)
+
+
+def regression_from_moments(mx, my, sxx, syy, sxy, window):
+    """
+    OLS fit y = slope * x + intercept from the output of `rolling_moments`.
+
+    Returns:
+        tuple of np.ndarray: slope, intercept, r2, resid_std (standard error of the regression).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = sxy / sxx
+        intercept = my - slope * mx
+        r2 = sxy**2 / (sxx * syy)
+        # residual sum of squares, clipped against tiny negative rounding errors
+        ssr = np.maximum(syy - slope * sxy, 0)
+        resid_std = np.sqrt(ssr / (window - 2)) if window > 2 else np.full_like(ssr, np.nan)
+    return slope, intercept, r2, resid_std
+
+
+@instrumentation.instrumented('rolling')
+def rolling_regression(x, y, window, stable=False):
+    """
+    Rolling linear regression of y on x for all windows at once.
+    Equivalent to calling np.polyfit(x[i-window+1:i+1], y[i-window+1:i+1], 1) and
+    np.corrcoef(...)[0, 1]**2 for every i, without re-scanning each window.
+
+    Parameters:
+        x, y (np.ndarray): Input series of equal length (must not contain NaN).
+        window (int): Loopback period of the regression.
+        stable (bool): Use the Welford-style sliding update (see `rolling_moments`).
+
+    Returns:
+        tuple of np.ndarray: slope, intercept, r2, resid_std, each of len(x)
+        with NaN for the first window-1 bars.
+    """
+    moments = rolling_moments(x, y, window, stable=stable)
+    return regression_from_moments(*moments, window)
+
+
+@instrumentation.instrumented('distance')
+def perpendicular_distance(x, y, slope, intercept):
+    """Signed perpendicular distance of the points (x, y) from the lines y = slope * x + intercept
+    (positive above the line)."""
+    return -(slope * x - y + intercept) / np.sqrt(slope**2 + 1)
+
+
+def zero_crossing_rate(values):
+    """Fraction of consecutive (non-NaN) values that change sign."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) < 2:
+        return np.nan
+    return np.sum(np.diff(np.sign(values)) != 0) / (len(values) - 1)
+
+
+DISTANCE_MODES = ('perpendicular', 'vertical', 'zscore')
+
+
+@instrumentation.instrumented('rolling')
+def rolling_distances(
+        x,
+        y,
+        window,
+        spread=None,
+        modes=DISTANCE_MODES,
+        stable=False,
+        ):
+    """
+    Rolling regression of y on x and the distance signals of all the requested modes, computed
+    from one set of window sums (all the sums are taken in a single pass over a stacked array):
+
+        'perpendicular': signed perpendicular distance of (x, y) from the regression line
+        'vertical':      residual y - (slope * x + intercept)
+        'zscore':        rolling z-score of `spread` (as ZScore.mq5: population std over the window)
+
+    Parameters:
+        x, y (np.ndarray): Input series of the regression (must not contain NaN).
+        window (int): Loopback period.
+        spread (np.ndarray): Series of the z-score mode, e.g. close_0 - close_1.
+        modes (tuple of str): Distance modes to compute.
+        stable (bool): Use the Welford-style rolling moments (see `rolling_moments`).
+
+    Returns:
+        dict of np.ndarray: 'slope', 'intercept', 'r2', 'resid_std' and one entry per mode,
+        with NaN for the first window-1 bars.
+    """
+    unknown = set(modes) - set(DISTANCE_MODES)
+    if unknown:
+        raise ValueError(f"Unknown distance modes: {unknown} (available: {DISTANCE_MODES})")
+    if 'zscore' in modes and spread is None:
+        raise ValueError("The zscore mode needs the spread series")
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    with_spread = 'zscore' in modes
+
+    if stable or len(x) == 0:
+        moments = rolling_moments(x, y, window, stable=stable)
+        if with_spread:
+            spread = np.asarray(spread, dtype=np.float64)
+            ms, _, sss, _, _ = rolling_moments(spread, spread, window, stable=stable)
+    else:
+        columns = [x, y]
+        pairs = [(0, 0), (1, 1), (0, 1)]
+        if with_spread:
+            spread = np.asarray(spread, dtype=np.float64)
+            columns.append(spread)
+            pairs.append((2, 2))
+        mean, products = _centred_window_sums(np.column_stack(columns), window, pairs)
+        moments = (mean[:, 0], mean[:, 1], products[:, 0], products[:, 1], products[:, 2])
+        if with_spread:
+            ms, sss = mean[:, 2], products[:, 3]
+
+    slope, intercept, r2, resid_std = regression_from_moments(*moments, window)
+    out = {'slope': slope, 'intercept': intercept, 'r2': r2, 'resid_std': resid_std}
+    if 'perpendicular' in modes:
+        out['perpendicular'] = perpendicular_distance(x, y, slope, intercept)
+    if 'vertical' in modes:
+        out['vertical'] = y - (slope * x + intercept)
+    if with_spread:
+        std = np.sqrt(np.maximum(sss, 0) / window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscore = np.where(std > 0, (spread - ms) / std, 0.0)
+        zscore[np.isnan(std)] = np.nan
+        out['zscore'] = zscore
+    return out
@@ -0,0 +1,109 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import functions as fns
+import rolling
+import alignment
+import mean_reversion
+
+
+def load_universe(
+        symbols,
+        endTime = datetime.now(),
+        timeframe = 'M5',
+        Nbars = 1000,
+        source = 'MT5',
+        **source_kwargs,
+        ):
+    """
+    Get the bars of all symbols and keep only the timestamps that exist for every symbol.
+
+    Returns:
+        time (np.ndarray): Common bar times.
+        close (np.ndarray): Close prices, shape (len(time), len(symbols)).
+    """
+    rates = list(fns.GetPriceDataMulti(symbols, endTime, timeframe, Nbars, source, **source_kwargs).values())
+    aligned = alignment.align_series(rates, columns=['close'], policy='drop')
+    time = aligned['time']
+    close = np.column_stack([aligned[f'close_{k}'] for k in range(len(symbols))])
+    return time, close
+
+
+def scan_pairs(
+        returns,
+        symbols,
+        LoopbackBars = 20,
+        max_bytes = 256 * 2**20,
+        ):
+    """
+    Rolling regression and perpendicular distance for all N*(N-1)/2 pairs of a universe.
+
+    The window sums of every symbol are computed once, only the cross products are
+    computed per pair, in batches of pairs (columns of a 2-D array) so the memory
+    stays below `max_bytes`. For the pair (symbol_0, symbol_1) the returns of symbol_1
+    are regressed on the returns of symbol_0, as in LinearRegression.py.
+
+    Parameters:
+        returns (np.ndarray): Aligned log returns, shape (bars, symbols), without NaN.
+        symbols (list of str): Names of the columns of `returns`.
+        LoopbackBars (int): Window of the rolling regression.
+        max_bytes (int): Memory budget of one batch of pairs.
+
+    Returns:
+        pd.DataFrame: One row per pair, ranked by zero-crossing rate of the distance and mean R2
+        (with the Ornstein-Uhlenbeck half-life of the distance, in bars).
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    T, N = returns.shape
+    W = LoopbackBars
+    I, J = np.triu_indices(N, k=1)
+
+    # centred moments are shift invariant, removing the first row keeps the sums small
+    first = returns[0]
+    shifted = returns - first
+    Sx = rolling._window_sums(shifted, W)
+    Sxx = rolling._window_sums(shifted * shifted, W)
+    mean = Sx / W
+    var = Sxx - Sx * mean
+
+    # about 8 arrays of shape (bars, pairs) are alive in one batch
+    batch = max(1, int(max_bytes // (8 * 8 * T)))
+    valid = slice(W - 1, None)
+    rows = []
+    for start in range(0, len(I), batch):
+        i, j = I[start:start+batch], J[start:start+batch]
+        sxy = rolling._window_sums(shifted[:, i] * shifted[:, j], W) - Sx[:, i] * mean[:, j]
+        slope, intercept, r2, _ = rolling.regression_from_moments(
+            mean[:, i] + first[i], mean[:, j] + first[j], var[:, i], var[:, j], sxy, W)
+        distance = rolling.perpendicular_distance(returns[:, i], returns[:, j], slope, intercept)[valid]
+        crossings = np.sum(np.diff(np.sign(distance), axis=0) != 0, axis=0)
+        zcr = crossings / (len(distance) - 1) if len(distance) > 1 else np.full(len(i), np.nan)
+        r2, slope = r2[valid], slope[valid]
+        rows.append(pd.DataFrame({
+            'symbol_0':             np.asarray(symbols)[i],
+            'symbol_1':             np.asarray(symbols)[j],
+            'zero_crossing_rate':   zcr,
+            'mean_r2':              np.nanmean(r2, axis=0),
+            'mean_correlation':     np.nanmean(np.sign(sxy[valid]) * np.sqrt(r2), axis=0),
+            'mean_slope':           np.nanmean(slope, axis=0),
+            'distance_std':         np.nanstd(distance, axis=0),
+            'half_life':            mean_reversion.half_life(distance),
+        }))
+
+    pairs = pd.concat(rows, ignore_index=True)
+    return pairs.sort_values(['zero_crossing_rate', 'mean_r2'], ascending=False, ignore_index=True)
+
+
+def scan_universe(
+        symbols,
+        endTime = datetime.now(),
+        timeframe = 'M5',
+        Nbars = 1000,
+        LoopbackBars = 20,
+        source = 'MT5',
+        **source_kwargs,
+        ):
+    """Load a universe of symbols, align their bars and rank all pairs (see scan_pairs)."""
+    time, close = load_universe(symbols, endTime, timeframe, Nbars, source, **source_kwargs)
+    returns = np.diff(np.log(close), axis=0)
+    return scan_pairs(returns, symbols, LoopbackBars)
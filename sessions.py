@@ -0,0 +1,86 @@
+import numpy as np
+import alignment
+from resample import SERVER_SHIFT_HOURS
+
+# trading sessions of MeanReversion [Revised].mq5 (IsTimeCond) as [start, end) server hours;
+# a range with start > end wraps around midnight (NewYorkANDAsia: outside 10-15)
+SESSIONS = {
+    'Asia':             (0, 10),
+    'London':           (10, 19),
+    'NewYork':          (15, 24),
+    'AsiaANDLondon':    (0, 19),
+    'LondonANDNewYork': (10, 24),
+    'NewYorkANDAsia':   (15, 10),
+}
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+_HOUR = 3600 * 10**9
+_DAY = 24 * _HOUR
+# 1970-01-01 is a Thursday
+_EPOCH_WEEKDAY = 3
+
+
+def hour_of_week(time, shift_hours = SERVER_SHIFT_HOURS):
+    """Hour of the week (0 = Monday 00:00 server time) of every bar time (datetime64 or int64 ns,
+    London time as returned by GetPriceData), as uint8."""
+    server = alignment._time_values({'time': time}) + shift_hours * _HOUR
+    day = server // _DAY
+    weekday = (day + _EPOCH_WEEKDAY) % 7
+    return (weekday * 24 + (server - day * _DAY) // _HOUR).astype(np.uint8)
+
+
+def hour_range(start, end):
+    """Boolean table of the 24 server hours in [start, end) (wrapping around midnight if start > end)."""
+    hours = np.arange(24)
+    if start <= end:
+        return (hours >= start) & (hours < end)
+    return (hours >= start) | (hours < end)
+
+
+def session_masks(
+        time,
+        sessions = SESSIONS,
+        shift_hours = SERVER_SHIFT_HOURS,
+        ):
+    """
+    Bit-packed masks (np.packbits) of the sessions and weekdays of a series of bars, built once
+    per aligned series: each mask is a lookup of a 168 entry table (hours of the week) and is
+    then stored in N/8 bytes. Combine them with combine_masks.
+
+    Parameters:
+        time (np.ndarray or pd.Series): Bar times (London time, as the `time` column of GetPriceData).
+        sessions (dict): name -> (start, end) server hours, e.g. dict(SESSIONS, Morning=(7, 10)).
+        shift_hours (int): Hours from the bar times to the server time (see resample.SERVER_SHIFT_HOURS).
+
+    Returns:
+        dict of np.ndarray: Packed uint8 mask of every session and weekday (WEEKDAYS), and
+        'length' (number of bars).
+    """
+    week = hour_of_week(time, shift_hours)
+    masks = {'length': len(week)}
+    for name, (start, end) in sessions.items():
+        masks[name] = np.packbits(np.tile(hour_range(start, end), 7)[week])
+    for day, name in enumerate(WEEKDAYS):
+        table = np.zeros(168, dtype=bool)
+        table[day * 24:(day + 1) * 24] = True
+        masks[name] = np.packbits(table[week])
+    return masks
+
+
+def combine_masks(masks, include = None, exclude = ()):
+    """
+    Boolean mask of the bars in any of the `include` sessions (all the bars if None) and in
+    none of the `exclude` sessions or weekdays. The masks are combined on the packed bytes.
+
+    Example: combine_masks(masks, ['London', 'NewYork'], exclude=['Fri']) can be passed as the
+    entryMask of signals.simulate_trades (sliced like the distances).
+    """
+    packed = None
+    if include is not None:
+        packed = np.bitwise_or.reduce([masks[name] for name in include]) if len(include) \
+            else np.zeros_like(masks[WEEKDAYS[0]])
+    for name in exclude:
+        packed = ~masks[name] if packed is None else packed & ~masks[name]
+    if packed is None:
+        return np.ones(masks['length'], dtype=bool)
+    return np.unpackbits(packed, count=masks['length']).astype(bool)
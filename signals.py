@@ -0,0 +1,159 @@
+import numpy as np
+from rolling import _jit
+import instrumentation
+
+
+def _first_true(mask):
+    """Index of the first True value along axis 1 (-1 if there is none)."""
+    first = np.argmax(mask, axis=1)
+    first[~mask.any(axis=1)] = -1
+    return first
+
+
+@_jit
+def _select_entries(candidates, blocked):
+    # walk the candidates in order and skip those that fall inside a previous trade;
+    # the loop only runs once per trade, the per-bar work is done beforehand
+    selected = np.empty(len(candidates), dtype=np.int64)
+    n = 0
+    next_free = -1
+    for i in candidates:
+        if i < next_free:
+            continue
+        selected[n] = i
+        n += 1
+        next_free = i + blocked[i]
+    return selected[:n]
+
+
+@instrumentation.instrumented('signals')
+def simulate_trades(
+        distances,
+        close0,
+        close1,
+        regressionThreshold,
+        distanceThreshold,
+        forwardCounts=5,
+        entryMask=None,
+        ):
+    """
+    Vectorized entry/TP/SL resolver for the distance signal (same rules as the original
+    loop in LinearRegression.py).
+
+    A trade is opened at bar i when |distance| > regressionThreshold and bar i is not part of
+    a previous trade. Within the next forwardCounts-1 bars, the trade hits take profit when the
+    distance moves back towards zero by a factor distanceThreshold, and stop loss when it moves
+    away by the same factor. Whichever happens first decides the trade.
+
+    Parameters:
+        distances (np.ndarray): Distance signal.
+        close0, close1 (np.ndarray): Close prices of both legs, indexed like distances.
+        regressionThreshold (float): Entry threshold on |distance|.
+        distanceThreshold (float): Relative move of the distance for TP/SL.
+        forwardCounts (int): Number of bars scanned after entry (forwardCounts-1 bars are checked).
+        entryMask (np.ndarray): Optional boolean gate indexed like distances, entries are only
+            opened on the True bars (e.g. allowed regimes or sessions).
+
+    Returns:
+        dict of np.ndarray (one entry per resolved trade):
+            'index':     entry bar
+            'direction': +1 (buy first asset, sell second) or -1 (sell first, buy second)
+            'win':       True if TP was hit before SL
+            'holding':   bars from entry to the TP/SL bar
+            'leg0_win', 'leg1_win': outcome of each leg from bar i to bar i+1
+    """
+    d = np.asarray(distances, dtype=np.float64)
+    close0 = np.asarray(close0, dtype=np.float64)
+    close1 = np.asarray(close1, dtype=np.float64)
+    N = len(d) - forwardCounts
+    empty = np.empty(0, dtype=np.int64)
+    if N <= 0 or forwardCounts < 2:
+        return {'index': empty, 'direction': empty, 'win': empty.astype(bool), 'holding': empty,
+                'leg0_win': empty.astype(bool), 'leg1_win': empty.astype(bool)}
+
+    current = d[:N, None]
+    # next forwardCounts-1 distances for every bar, shape (N, forwardCounts-1)
+    nxt = np.lib.stride_tricks.sliding_window_view(d[1:], forwardCounts - 1)[:N]
+
+    positive = current > 0
+    tp_level = current * (1 - distanceThreshold)
+    sl_level = current * (1 + distanceThreshold)
+    conds_tp = np.where(positive, nxt < tp_level, nxt > tp_level)
+    conds_sl = np.where(positive, nxt > sl_level, nxt < sl_level)
+
+    i_TP = _first_true(conds_tp)
+    i_SL = _first_true(conds_sl)
+    condTP = (i_TP >= 0) & ((i_SL < 0) | (i_TP < i_SL))
+    condSL = (i_SL >= 0) & ((i_TP < 0) | (i_SL < i_TP))
+
+    # number of bars (from the entry bar) that are marked as "in trade"
+    blocked = np.ones(N, dtype=np.int64)
+    blocked[condTP] = i_TP[condTP] + 1
+    blocked[condSL] = i_SL[condSL] + 1
+
+    entry = (d[:N] > regressionThreshold) | (d[:N] < -regressionThreshold)
+    if entryMask is not None:
+        entry &= np.asarray(entryMask, dtype=bool)[:N]
+    candidates = np.flatnonzero(entry)
+    entries = _select_entries(candidates, blocked)
+    entries = entries[condTP[entries] | condSL[entries]]
+
+    instrumentation.count('signals_emitted', len(entries))
+    direction = np.sign(d[entries]).astype(np.int64)
+    win = condTP[entries]
+    holding = blocked[entries]
+    move0 = close0[entries + 1] - close0[entries]
+    move1 = close1[entries + 1] - close1[entries]
+    leg0_win = ((direction > 0) & (move0 > 0)) | ((direction < 0) & (move0 < 0))
+    leg1_win = ((direction > 0) & (move1 < 0)) | ((direction < 0) & (move1 > 0))
+
+    return {
+        'index':     entries,
+        'direction': direction,
+        'win':       win,
+        'holding':   holding,
+        'leg0_win':  leg0_win,
+        'leg1_win':  leg1_win,
+    }
+
+
+def find_special_points(
+        distances,
+        close0,
+        close1,
+        regressionThreshold,
+        distanceThreshold,
+        forwardCounts=5,
+        entryMask=None,
+        ):
+    """
+    Find the data points where there is a significant deviation from the regression line.
+    Then find out if the next data point is closer to zero or crosses the zero line or move further away
+    from the regression line.
+
+    Find data points that meet the specified conditions:
+    1. Data point is outside the threshold range.
+    2. The next data point is closer to zero or crosses the zero line.
+
+    Parameters:
+        distances (np.ndarray): Input signal array.
+        close0, close1 (np.ndarray): Close prices of both legs used to count winning/losing legs.
+        regressionThreshold (float): Threshold value for detecting out-of-bound points.
+        distanceThreshold (float): Relative move of the distance for TP/SL.
+        entryMask (np.ndarray): Optional boolean gate of the entries (see simulate_trades).
+
+    Returns:
+        winPoints, lossPoints (list of tuple): (index, current value, next value) of the points.
+        winTrades, lossTrades (int): Number of winning/losing legs of the TP trades.
+    """
+    trades = simulate_trades(distances, close0, close1, regressionThreshold, distanceThreshold, forwardCounts, entryMask)
+    distances = np.asarray(distances)
+    win = trades['win']
+    winPoints = [(i, distances[i], distances[i + 1]) for i in trades['index'][win]]
+    lossPoints = [(i, distances[i], distances[i + 1]) for i in trades['index'][~win]]
+
+    # only the legs of the TP trades are counted
+    legs = np.concatenate((trades['leg0_win'][win], trades['leg1_win'][win]))
+    winTrades = int(legs.sum())
+    lossTrades = int(len(legs) - winTrades)
+    return winPoints, lossPoints, winTrades, lossTrades
@@ -0,0 +1,219 @@
+from collections import deque
+import numpy as np
+from rolling import perpendicular_distance
+import instrumentation
+
+
+class StreamingPairEngine:
+    """
+    Incremental version of the pair pipeline for live bars: one bar pair is added at a time
+    and the rolling regression, distance, z-score and zero-crossing rate are updated in O(1)
+    with fixed-size ring buffers (the streaming counterpart of rolling.py and signals.py).
+
+    The trades reported by `update` are the same as signals.simulate_trades on the full history
+    (distances indexed from the first complete regression window, closes aligned with them),
+    except at the end: the batch simulator opens no trade in the last forwardCounts bars of
+    the history, while the engine reports the trades of these bars as soon as their TP/SL is hit.
+    A trade is only reported once its outcome is known, i.e. up to forwardCounts-1 bars after
+    the entry bar; `signal` gives the raw entry signal of the current bar for live use.
+
+    Parameters:
+        LoopbackBars (int): Window of the regression, the z-score and the zero-crossing rate.
+        regressionThreshold (float): Entry threshold on |distance|.
+        distanceThreshold (float): Relative move of the distance for TP/SL.
+        forwardCounts (int): Bars scanned after entry (see signals.simulate_trades).
+        resync (int): The window sums are recomputed exactly every resync*LoopbackBars bars
+            to bound the rounding error of the sliding updates.
+    """
+
+    def __init__(
+            self,
+            LoopbackBars = 20,
+            regressionThreshold = 0.005,
+            distanceThreshold = 0.9,
+            forwardCounts = 5,
+            resync = 64,
+            ):
+        self.W = LoopbackBars
+        self.regressionThreshold = regressionThreshold
+        self.distanceThreshold = distanceThreshold
+        self.forwardCounts = forwardCounts
+        self.resync = resync
+
+        # ring buffers of the last W returns and distances
+        self._x = np.zeros(self.W)
+        self._y = np.zeros(self.W)
+        self._dist = np.zeros(self.W)
+        self._cross = np.zeros(self.W - 1, dtype=bool)
+        self._n = 0                 # number of returns seen
+        self._nd = 0                # number of distances seen
+        self._mx = self._my = 0.0
+        self._sxx = self._syy = self._sxy = 0.0
+        self._dsum = self._dsum2 = 0.0
+        self._ncross = 0
+
+        self._prev_close = None
+        self._prev_distance = np.nan
+
+        # batch-equivalent trade selection state
+        self._pending = deque()     # candidate entries whose outcome is not known yet
+        self._next_free = 0         # first distance index that is not part of a previous trade
+
+        self.slope = self.intercept = self.r2 = np.nan
+        self.distance = self.zscore = self.zero_crossing_rate = np.nan
+        self.signal = 0
+
+    def _add_return(self, x, y):
+        W = self.W
+        k = self._n % W
+        n = min(self._n, W)
+        if n == W:
+            # remove the point that leaves the window (Welford-style sliding update)
+            xo, yo = self._x[k], self._y[k]
+            n -= 1
+            dx, dy = xo - self._mx, yo - self._my
+            self._mx -= dx / n
+            self._my -= dy / n
+            self._sxx -= dx * (xo - self._mx)
+            self._syy -= dy * (yo - self._my)
+            self._sxy -= dx * (yo - self._my)
+        n += 1
+        dx, dy = x - self._mx, y - self._my
+        self._mx += dx / n
+        self._my += dy / n
+        self._sxx += dx * (x - self._mx)
+        self._syy += dy * (y - self._my)
+        self._sxy += dx * (y - self._my)
+        self._x[k], self._y[k] = x, y
+        self._n += 1
+
+        if self._n % (self.resync * W) == 0:
+            self._mx, self._my = self._x.mean(), self._y.mean()
+            cx, cy = self._x - self._mx, self._y - self._my
+            self._sxx, self._syy, self._sxy = cx @ cx, cy @ cy, cx @ cy
+            self._dsum, self._dsum2 = self._dist.sum(), self._dist @ self._dist
+
+    def _add_distance(self, d):
+        W = self.W
+        k = self._nd % W
+        if self._nd >= W:
+            old = self._dist[k]
+            self._dsum -= old
+            self._dsum2 -= old * old
+        self._dist[k] = d
+        self._dsum += d
+        self._dsum2 += d * d
+
+        if self._nd > 0:
+            j = (self._nd - 1) % (W - 1)
+            if self._nd > W - 1:
+                self._ncross -= self._cross[j]
+            self._cross[j] = np.sign(d) != np.sign(self._prev_distance)
+            self._ncross += self._cross[j]
+        self._nd += 1
+
+        n = min(self._nd, W)
+        if n == W:
+            mean = self._dsum / W
+            std = np.sqrt(max(self._dsum2 / W - mean * mean, 0))
+            self.zscore = (d - mean) / std if std > 0 else 0.0
+            self.zero_crossing_rate = self._ncross / (W - 1)
+
+    def _update_trades(self, i, d, close0, close1):
+        # first TP/SL hit of the pending candidates
+        for c in self._pending:
+            if c['done']:
+                continue
+            offset = i - c['index'] - 1
+            if offset == 0:
+                # the legs are evaluated from the entry bar to the next bar
+                move0, move1 = close0 - c['close0'], close1 - c['close1']
+                direction = c['direction']
+                c['leg0_win'] = bool((direction > 0 and move0 > 0) or (direction < 0 and move0 < 0))
+                c['leg1_win'] = bool((direction > 0 and move1 < 0) or (direction < 0 and move1 > 0))
+            current = c['distance']
+            tp_level = current * (1 - self.distanceThreshold)
+            sl_level = current * (1 + self.distanceThreshold)
+            tp = d < tp_level if current > 0 else d > tp_level
+            sl = d > sl_level if current > 0 else d < sl_level
+            if tp or sl:
+                # both on the same bar is neither a win nor a loss (as in the batch version)
+                c['win'] = None if (tp and sl) else bool(tp)
+                c['blocked'] = 1 if (tp and sl) else offset + 1
+                c['done'] = True
+            elif offset == self.forwardCounts - 2:
+                c['done'] = True
+
+        # select the candidates in order, as signals._select_entries does
+        trades = []
+        while self._pending:
+            c = self._pending[0]
+            if c['index'] < self._next_free:
+                self._pending.popleft()
+                continue
+            if not c['done']:
+                break
+            self._pending.popleft()
+            self._next_free = c['index'] + c['blocked']
+            if c['win'] is not None:
+                trades.append({
+                    'index':        c['index'],
+                    'time':         c['time'],
+                    'direction':    c['direction'],
+                    'win':          c['win'],
+                    'holding':      c['blocked'],
+                    'leg0_win':     c['leg0_win'],
+                    'leg1_win':     c['leg1_win'],
+                })
+        return trades
+
+    @instrumentation.instrumented('stream_update')
+    def update(self, close0, close1, time=None):
+        """
+        Add a new bar pair.
+
+        Parameters:
+            close0, close1 (float): Close prices of the first and second asset.
+            time: Optional bar time, reported with the trades.
+
+        Returns:
+            list of dict: Trades whose outcome became known with this bar (same keys as
+            the rows of signals.simulate_trades, plus 'time' of the entry bar).
+        """
+        if self._prev_close is None:
+            self._prev_close = (close0, close1)
+            return []
+        x = np.log(close0 / self._prev_close[0])
+        y = np.log(close1 / self._prev_close[1])
+        self._prev_close = (close0, close1)
+        self._add_return(x, y)
+        if self._n < self.W:
+            return []
+
+        self.slope = self._sxy / self._sxx if self._sxx != 0 else np.nan
+        self.intercept = self._my - self.slope * self._mx
+        self.r2 = self._sxy**2 / (self._sxx * self._syy) if self._sxx * self._syy != 0 else np.nan
+        d = perpendicular_distance(x, y, self.slope, self.intercept)
+        self.distance = d
+        self._add_distance(d)
+        self._prev_distance = d
+
+        i = self._nd - 1
+        trades = self._update_trades(i, d, close0, close1)
+
+        self.signal = 0
+        if d > self.regressionThreshold or d < -self.regressionThreshold:
+            self.signal = int(np.sign(d))
+            if i >= self._next_free:
+                self._pending.append({
+                    'index':        i,
+                    'time':         time,
+                    'distance':     d,
+                    'direction':    self.signal,
+                    'close0':       close0,
+                    'close1':       close1,
+                    'done':         self.forwardCounts < 2,
+                    'win':          None,
+                    'blocked':      1,
+                })
+        return trades
@@ -0,0 +1,161 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import rolling
+from signals import simulate_trades
+
+# columns of the pair DataFrame (as built in LinearRegression.py) that are shared with the workers
+SHARED_COLUMNS = ['log_return_0', 'log_return_1', 'close_0', 'close_1']
+
+# worker state, set once per process by _init_worker
+_shm = None
+_arrays = None
+_distance_cache = {}
+_entry_masks = {}
+
+
+def _init_worker(shm_name, shape, packed_masks):
+    global _shm, _arrays
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _arrays = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    # the session masks are sent bit-packed and unpacked once per worker
+    _entry_masks.clear()
+    for name, packed in packed_masks.items():
+        _entry_masks[name] = np.unpackbits(packed, count=shape[1]).astype(bool)
+
+
+def _window_distance(LoopbackBars, stable):
+    # tasks are submitted grouped by LoopbackBars, so only the last window is kept
+    key = (LoopbackBars, stable)
+    if key not in _distance_cache:
+        x, y = _arrays[0], _arrays[1]
+        slope, intercept, r2, _ = rolling.rolling_regression(x, y, LoopbackBars, stable=stable)
+        distance = rolling.perpendicular_distance(x, y, slope, intercept)
+        _distance_cache.clear()
+        _distance_cache[key] = (distance, np.nanmean(r2), rolling.zero_crossing_rate(distance))
+    return _distance_cache[key]
+
+
+def _run_task(LoopbackBars, thresholds, forwardCounts, stable):
+    distance, r2, zcr = _window_distance(LoopbackBars, stable)
+    valid = slice(LoopbackBars - 1, None)
+    rows = []
+    for regressionThreshold, distanceThreshold, session in thresholds:
+        trades = simulate_trades(
+            distance[valid], _arrays[2][valid], _arrays[3][valid],
+            regressionThreshold, distanceThreshold, forwardCounts,
+            entryMask=None if session is None else _entry_masks[session][valid],
+            )
+        win = trades['win']
+        legs = np.concatenate((trades['leg0_win'][win], trades['leg1_win'][win]))
+        winPoints, lossPoints = int(win.sum()), int((~win).sum())
+        rows.append({
+            'LoopbackBars':         LoopbackBars,
+            'regressionThreshold':  regressionThreshold,
+            'distanceThreshold':    distanceThreshold,
+            'winPoints':            winPoints,
+            'lossPoints':           lossPoints,
+            'winTrades':            int(legs.sum()),
+            'lossTrades':           int(len(legs) - legs.sum()),
+            'hit_ratio':            winPoints / (winPoints + lossPoints) if winPoints + lossPoints else np.nan,
+            'zero_crossing_rate':   zcr,
+            'mean_r2':              r2,
+        })
+        if session is not None:
+            rows[-1]['session'] = session
+    return rows
+
+
+def run_sweep(
+        data,
+        LoopbackBars,
+        regressionThreshold,
+        distanceThreshold,
+        forwardCounts=5,
+        stable=False,
+        max_workers=None,
+        chunksize=64,
+        output=None,
+        entryMasks=None,
+        ):
+    """
+    Evaluate the strategy on every combination of the parameter grid in a process pool.
+
+    The pair arrays are copied once into shared memory and the workers read them in place,
+    so nothing but the parameters is pickled per task. The rolling regression and the distance
+    are computed once per LoopbackBars value (per worker) and reused for all the thresholds.
+    Unlike LinearRegression.py, the closes are aligned with the distances.
+
+    Parameters:
+        data (pd.DataFrame): Pair data with the columns log_return_0, log_return_1, close_0, close_1
+            (without NaN, e.g. the `data` frame of LinearRegression.py).
+        LoopbackBars, regressionThreshold, distanceThreshold (iterable): Values of the grid.
+        forwardCounts (int): Bars scanned after an entry (see signals.simulate_trades).
+        stable (bool): Use the Welford-style rolling regression.
+        max_workers (int): Number of processes (default: number of cores).
+        chunksize (int): Number of threshold combinations evaluated per task.
+        output (str): Optional .parquet (or .csv) file the result table is written to.
+        entryMasks (dict): Optional name -> boolean mask indexed like `data` (e.g.
+            sessions.combine_masks of a session combination); every mask is one more
+            dimension of the grid. They are sent to the workers bit-packed.
+
+    Returns:
+        pd.DataFrame: One row per parameter combination (and session) with win/loss counts,
+        hit ratio, zero-crossing rate and mean R2.
+    """
+    values = np.ascontiguousarray(data[SHARED_COLUMNS].to_numpy(dtype=np.float64).T)
+    entryMasks = entryMasks or {}
+    packed_masks = {name: np.packbits(np.asarray(mask, dtype=bool)) for name, mask in entryMasks.items()}
+    thresholds = list(itertools.product(regressionThreshold, distanceThreshold, list(entryMasks) or [None]))
+
+    shm = shared_memory.SharedMemory(create=True, size=values.nbytes)
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(shm.name, values.shape, packed_masks),
+                ) as executor:
+            futures = [
+                executor.submit(_run_task, int(window), thresholds[i:i+chunksize], forwardCounts, stable)
+                for window in LoopbackBars
+                for i in range(0, len(thresholds), chunksize)
+            ]
+            rows = [row for future in futures for row in future.result()]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results = pd.DataFrame(rows)
+    if output is not None:
+        if output.endswith('.csv'):
+            results.to_csv(output, index=False)
+        else:
+            results.to_parquet(output, index=False)
+    return results
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+    import functions as fns
+
+    symbol = ['EURUSD', 'GBPUSD']
+    data0 = fns.GetPriceData(symbol[0], datetime(2024, 10, 9, 10), 'M5', 100000, source='synthetic')
+    data1 = fns.GetPriceData(symbol[1], datetime(2024, 10, 9, 10), 'M5', 100000, source='synthetic')
+    data = pd.DataFrame({
+        'log_return_0': data0['log_return'].to_numpy(),
+        'log_return_1': data1['log_return'].to_numpy(),
+        'close_0':      data0['close'].to_numpy(),
+        'close_1':      data1['close'].to_numpy(),
+    }).dropna()
+
+    results = run_sweep(
+        data,
+        LoopbackBars=[10, 20, 50, 100],
+        regressionThreshold=np.linspace(0.0005, 0.005, 10),
+        distanceThreshold=np.linspace(0.1, 0.9, 9),
+        output='sweep.csv',
+        )
+    print(results.sort_values('hit_ratio', ascending=False).head(10))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import backtester
+
+
+def _bars(rows):
+    # rows of (open, high, low, close)
+    return np.array(rows, dtype=np.float64).T
+
+
+def _pair_data(distance):
+    o0, h0, l0, c0 = _bars([
+        (1.0000, 1.0000, 1.0000, 1.0000),
+        (1.0000, 1.0008, 0.9995, 1.0005),
+        (1.0005, 1.0010, 1.0000, 1.0008),
+        (1.0030, 1.0035, 1.0025, 1.0030),   # gap above the TP of the long leg
+        (1.0030, 1.0030, 1.0030, 1.0030),
+        (1.0030, 1.0030, 1.0030, 1.0030),
+    ])
+    o1, h1, l1, c1 = _bars([
+        (2.0000, 2.0000, 2.0000, 2.0000),
+        (2.0000, 2.0004, 1.9995, 2.0002),
+        (2.0005, 2.0015, 2.0000, 2.0010),   # through the SL of the short leg
+        (2.0010, 2.0010, 2.0010, 2.0010),
+        (2.0010, 2.0010, 2.0010, 2.0010),
+        (2.0010, 2.0010, 2.0010, 2.0010),
+    ])
+    return {
+        'distance': np.asarray(distance, dtype=np.float64), 'slope': np.ones(6),
+        'open_0': o0, 'high_0': h0, 'low_0': l0, 'close_0': c0,
+        'open_1': o1, 'high_1': h1, 'low_1': l1, 'close_1': c1,
+    }
+
+
+def test_tp_gap_and_sl_legs():
+    data = _pair_data([0.01, 0, 0, 0, 0, 0])
+    result = backtester.backtest(data, 0.005, SLpoints=100, point=1e-5, rewardToRisk=2.0,
+                                 hedge=False, commission=1e-4, balance=10000.0)
+    trades = result['trades']
+    # one trade: long the first leg, short the second one, opened at the open of bar 1
+    np.testing.assert_array_equal(trades['signal_bar'], [0])
+    np.testing.assert_array_equal(trades['entry_bar'], [1])
+    np.testing.assert_array_equal(trades['direction'], [1])
+    # 1% of 10000 at risk, half per leg at a 0.001 SL distance
+    np.testing.assert_allclose(trades['units'], [[50000, 50000]])
+    # the TP (1.002) is gapped through at the open of bar 3, the SL (2.001) is hit inside bar 2
+    np.testing.assert_array_equal(trades['exit_reason'], [[backtester.EXIT_TP, backtester.EXIT_SL]])
+    np.testing.assert_array_equal(trades['exit_bar'], [[3, 2]])
+    np.testing.assert_allclose(trades['exit_price'], [[1.0030, 2.0010]])
+    np.testing.assert_allclose(trades['pnl'], [[150.0, -50.0]])
+    fees = 1e-4 * 50000 * np.array([1.0000 + 1.0030, 2.0000 + 2.0010])
+    np.testing.assert_allclose(trades['commission'], [fees])
+
+    # the marked-to-market equity ends at the realized PnL
+    np.testing.assert_allclose(result['net_profit'], 100.0 - fees.sum())
+    np.testing.assert_allclose(result['equity'][-1] - 10000.0, trades['pnl'].sum() - trades['commission'].sum())
+    # close of bar 1: +0.0005 on the long leg, -0.0002 on the short leg
+    np.testing.assert_allclose(result['equity'][:2], [10000.0, 10000.0 + 50000 * (0.0005 - 0.0002)])
+    assert result['max_drawdown'] <= 0
+
+
+def test_sl_gap_fills_at_the_open():
+    data = _pair_data([-0.01, 0, 0, 0, 0, 0])
+    data['high_0'][2] = 1.0009
+    # short the first leg: its SL (1.001) is gapped through at the open of bar 3 (1.003)
+    result = backtester.backtest(data, 0.005, SLpoints=100, point=1e-5, hedge=False, maxBars=3)
+    trades = result['trades']
+    np.testing.assert_array_equal(trades['direction'], [-1])
+    assert trades['exit_reason'][0, 0] == backtester.EXIT_SL
+    np.testing.assert_allclose(trades['exit_price'][0, 0], 1.0030)
+    np.testing.assert_allclose(trades['pnl'][0, 0], -50000 * 0.0030)
+    np.testing.assert_allclose(result['net_profit'], trades['pnl'].sum())
+
+
+def test_atr_risk_uses_the_signal_bar():
+    data = _pair_data([0.01, 0, 0, 0, 0, 0])
+    data['ATR_0'] = data['ATR_1'] = np.array([0.0004, 1.0, 1.0, 1.0, 1.0, 1.0])
+    result = backtester.backtest(data, 0.005, riskOption='ATR', ATRMultiplier=2.5, hedge=False)
+    # SL distance 2.5 * 0.0004 = 0.001, as in the constant mode above
+    np.testing.assert_allclose(result['trades']['units'], [[50000, 50000]])
+
+
+def test_unknown_risk_option():
+    with pytest.raises(ValueError):
+        backtester.backtest(_pair_data(np.zeros(6)), 0.005, riskOption='Fixed')
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from kalman import kalman_hedge
+
+
+def _pair(N, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=N) * 1e-3
+    y = 0.8 * x + rng.normal(size=N) * 5e-4
+    return x, y
+
+
+def test_burn_in_bars_are_nan():
+    x, y = _pair(300)
+    x[[5, 40]] = np.nan
+    hedge = kalman_hedge(x, y, warmup=100)
+    # 100 valid bars end at bar 101 with the 2 NaN bars
+    for name in ('slope', 'intercept', 'spread', 'spread_var', 'zscore'):
+        assert np.isnan(hedge[name][:102]).all()
+        assert np.isfinite(np.delete(hedge[name], [5, 40])[102:]).all()
+
+
+def test_no_look_ahead():
+    x, y = _pair(400)
+    full = kalman_hedge(x, y, warmup=100)
+    # the outputs of a bar do not change when the later bars change
+    x2, y2 = x.copy(), y.copy()
+    x2[250:] *= 3
+    y2[250:] = -y2[250:]
+    changed = kalman_hedge(x2, y2, warmup=100)
+    for name in ('slope', 'intercept', 'spread', 'zscore'):
+        np.testing.assert_array_equal(full[name][:250], changed[name][:250])
+
+
+def test_slope_converges():
+    x, y = _pair(3000)
+    hedge = kalman_hedge(x, y, delta=1e-5, warmup=100)
+    assert hedge['slope'][-1] == pytest.approx(0.8, abs=0.05)
+
+
+def test_short_warmup():
+    with pytest.raises(ValueError):
+        kalman_hedge(*_pair(10), warmup=2)
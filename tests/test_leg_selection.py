@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+import leg_selection
+from leg_selection import BOTH_LEGS, LEG_0, LEG_1
+
+
+def _samples(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 3))
+    labels = np.where(X[:, 0] > 0, LEG_0, LEG_1)
+    labels[rng.random(n) < 0.1] = BOTH_LEGS
+    return X, labels
+
+
+@pytest.mark.parametrize('model', leg_selection.LEG_MODELS)
+def test_predict_leg_is_the_probability_of_leg_0(model):
+    X, labels = _samples()
+    classifier = leg_selection.train_leg_selector(X, labels, model=model)
+    proba = leg_selection.predict_leg(classifier, X, batch_size=64)
+    keep = labels != BOTH_LEGS
+    assert np.mean((proba[keep] > 0.5) == (labels[keep] == LEG_0)) > 0.9
+
+
+def test_predict_leg_without_leg_0_labels():
+    X, labels = _samples()
+    labels[labels == LEG_0] = LEG_1
+    classifier = leg_selection.train_leg_selector(X, labels, model='gbm')
+    np.testing.assert_array_equal(leg_selection.predict_leg(classifier, X), 0)
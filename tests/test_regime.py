@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('hmmlearn')
+import regime
+
+
+def _features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    calm = rng.normal([0, 1, 0.5], [0.5, 0.1, 0.1], (n // 2, 3))
+    wild = rng.normal([0, 3, 0.2], [2.0, 0.5, 0.1], (n - n // 2, 3))
+    features = np.concatenate((calm, wild))
+    features[:5] = np.nan
+    return features
+
+
+@pytest.mark.parametrize('covariance_type', ['full', 'diag', 'spherical', 'tied'])
+def test_cached_model_round_trip(tmp_path, covariance_type):
+    features = _features(600)
+    time = pd.date_range('2024-01-01', periods=len(features), freq='5min')
+    kwargs = dict(name='pair', n_states=2, covariance_type=covariance_type, n_iter=20, cache_dir=str(tmp_path))
+
+    fitted = regime.fit_regimes(features, time, **kwargs)
+    cached = regime.fit_regimes(features, time, **kwargs)
+    assert cached.key == fitted.key
+    np.testing.assert_allclose(cached.model.covars_, fitted.model.covars_)
+    np.testing.assert_array_equal(cached.labels(features), fitted.labels(features))
+
+    # appended bars warm-start from the cached model
+    more = np.concatenate((features, _features(100, seed=1)[5:]))
+    warm = regime.fit_regimes(more, pd.date_range('2024-01-01', periods=len(more), freq='5min'), **kwargs)
+    assert warm.warm_started
+    assert set(np.unique(warm.labels(more))) <= {-1, 0, 1}
+
+
+def test_warm_start_over_appended_bars(tmp_path):
+    features = _features(600)
+    more = np.concatenate((features, _features(200, seed=1)[5:]))
+    time = pd.date_range('2024-01-01', periods=len(more), freq='5min')
+    kwargs = dict(name='pair', n_states=2, n_iter=20, feature_settings={'LoopbackBars': 20})
+
+    regime.fit_regimes(features, time[:len(features)], cache_dir=str(tmp_path), **kwargs)
+    warm = regime.fit_regimes(more, time, cache_dir=str(tmp_path), **kwargs)
+    scratch = regime.fit_regimes(more, time, cache_dir=str(tmp_path / 'scratch'), **kwargs)
+    assert warm.warm_started and not scratch.warm_started
+    assert np.mean(warm.filtered_labels(more) == scratch.filtered_labels(more)) > 0.95
+
+
+def test_no_warm_start_from_other_ranges_or_settings(tmp_path):
+    features = _features(600)
+    time = pd.date_range('2024-01-01', periods=len(features), freq='5min')
+    kwargs = dict(name='pair', n_states=2, n_iter=20, cache_dir=str(tmp_path))
+    regime.fit_regimes(features[:500], time[:500], feature_settings={'distanceMode': 'perpendicular'}, **kwargs)
+
+    # other features of the same bars (e.g. another distance mode)
+    other = regime.fit_regimes(features[:500] * 100, time[:500], feature_settings={'distanceMode': 'zscore'}, **kwargs)
+    assert not other.warm_started
+    # same settings but another first bar
+    shifted = regime.fit_regimes(features[100:], time[100:], feature_settings={'distanceMode': 'perpendicular'}, **kwargs)
+    assert not shifted.warm_started
+    appended = regime.fit_regimes(features, time, feature_settings={'distanceMode': 'perpendicular'}, **kwargs)
+    assert appended.warm_started
+
+
+def test_failed_warm_start_falls_back_to_a_fit(tmp_path, monkeypatch):
+    from hmmlearn.hmm import GaussianHMM
+    features = _features(600)
+    time = pd.date_range('2024-01-01', periods=len(features), freq='5min')
+    kwargs = dict(name='pair', n_states=2, n_iter=20, cache_dir=str(tmp_path))
+    regime.fit_regimes(features[:500], time[:500], **kwargs)
+
+    fit = GaussianHMM.fit
+    def failing_warm_fit(self, X, lengths=None):
+        if self.init_params == '':
+            raise ValueError("'covars' must be symmetric, positive-definite")
+        return fit(self, X, lengths)
+    monkeypatch.setattr(GaussianHMM, 'fit', failing_warm_fit)
+
+    model = regime.fit_regimes(features, time, **kwargs)
+    assert not model.warm_started
+    assert set(np.unique(model.labels(features))) <= {-1, 0, 1}
+
+
+def test_filtered_labels_are_causal(tmp_path):
+    features = _features(600)
+    time = pd.date_range('2024-01-01', periods=len(features), freq='5min')
+    model = regime.fit_regimes(features, time, n_states=2, n_iter=20, cache_dir=str(tmp_path))
+
+    full = model.filtered_labels(features)
+    for end in (50, 300, 450):
+        np.testing.assert_array_equal(model.filtered_labels(features[:end]), full[:end])
+    assert (full[:5] == -1).all()
+    probabilities = model.filtered_probabilities(features)
+    np.testing.assert_allclose(probabilities[5:].sum(axis=1), 1)
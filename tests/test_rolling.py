@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import rolling
+
+
+def _two_pass(x, y, window):
+    xs = np.lib.stride_tricks.sliding_window_view(x, window)
+    ys = np.lib.stride_tricks.sliding_window_view(y, window)
+    dx = xs - xs.mean(axis=1, keepdims=True)
+    dy = ys - ys.mean(axis=1, keepdims=True)
+    return (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+
+
+@pytest.mark.parametrize('N, window', [(1, 3), (5, 5), (7, 3), (103, 10), (41, 40)])
+def test_window_sums_match_two_pass(N, window):
+    rng = np.random.default_rng(N)
+    x = 5 + rng.normal(size=N)
+    y = 2 * x + rng.normal(size=N)
+    slope = rolling.rolling_regression(x, y, window)[0]
+    assert np.isnan(slope[:window-1]).all()
+    np.testing.assert_allclose(slope[window-1:], _two_pass(x, y, window) if N >= window else [], rtol=1e-10)
+
+
+def test_price_levels_keep_precision():
+    # regression on price levels (not returns) over a long history
+    rng = np.random.default_rng(1)
+    N, window = 300_000, 20
+    x = 1.1 * np.exp(np.cumsum(rng.normal(0, 1e-4, N)))
+    y = 0.6 * x + 1.3 * np.exp(np.cumsum(rng.normal(0, 1e-4, N)))
+    expected = _two_pass(x, y, window)
+    for slope in (rolling.rolling_regression(x, y, window)[0],
+                  rolling.rolling_distances(x, y, window, modes=('vertical',))['slope']):
+        error = np.abs(slope[window-1:] - expected) / np.abs(expected)
+        assert np.median(error) < 1e-12
+        assert error.max() < 1e-6
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from signals import find_special_points, simulate_trades
+
+
+def _loop_special_points(distances, data, regressionThreshold, distanceThreshold, forwardCounts=5):
+    # original nested loop of LinearRegression.py, kept as the reference of the vectorized version
+    winPoints = []
+    lossPoints = []
+    winTrades = 0
+    lossTrades = 0
+    inTrade = [False] * len(distances)
+
+    def compare(next_dist, factor, mode):
+        if mode=='TP':
+            return next_dist < current_dist * (1-factor) if current_dist > 0 else next_dist > current_dist * (1-factor)
+        elif mode=='SL':
+            return next_dist > current_dist * (1+factor) if current_dist > 0 else next_dist < current_dist * (1+factor)
+
+    for i in range(len(distances) - forwardCounts):
+        if (distances[i] > regressionThreshold or distances[i] < -regressionThreshold) and not inTrade[i]:
+            inTrade[i] = True
+            current_dist = distances[i]
+            next_dists = [distances[i+j] for j in range(1, forwardCounts)]
+            conds_tp = [compare(next_dist, distanceThreshold, 'TP') for next_dist in next_dists]
+            conds_sl = [compare(next_dist, distanceThreshold, 'SL') for next_dist in next_dists]
+            i_TP = next((i for i, x in enumerate(conds_tp) if x), None)
+            i_SL = next((i for i, x in enumerate(conds_sl) if x), None)
+
+            condTP = False
+            condSL = False
+            if i_TP is None and i_SL is None:
+                continue
+            elif i_SL is None:
+                condTP = True
+            elif i_TP is None:
+                condSL = True
+            else:
+                condTP = True if i_TP < i_SL else False
+                condSL = True if i_SL < i_TP else False
+
+            if condTP:
+                winPoints.append((i, distances[i], distances[i + 1]))
+                inTrade[i:i + i_TP + 1] = [True] * (i_TP + 1)
+                if distances[i] > 0:
+                    if data['close_0'].iloc[i+1] > data['close_0'].iloc[i]:
+                        winTrades += 1
+                    else:
+                        lossTrades += 1
+                    if data['close_1'].iloc[i+1] < data['close_1'].iloc[i]:
+                        winTrades += 1
+                    else:
+                        lossTrades += 1
+                if distances[i] < 0:
+                    if data['close_0'].iloc[i+1] < data['close_0'].iloc[i]:
+                        winTrades += 1
+                    else:
+                        lossTrades += 1
+                    if data['close_1'].iloc[i+1] > data['close_1'].iloc[i]:
+                        winTrades += 1
+                    else:
+                        lossTrades += 1
+            elif condSL:
+                lossPoints.append((i, distances[i], distances[i + 1]))
+                inTrade[i:i + i_SL + 1] = [True] * (i_SL + 1)
+
+    return winPoints, lossPoints, winTrades, lossTrades
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_find_special_points_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    N = int(rng.integers(0, 300))
+    distances = rng.normal(size=N) * rng.uniform(0.1, 2)
+    # rounded closes produce ties (flat legs count as losses in both versions)
+    data = pd.DataFrame({
+        'close_0': np.round(1 + rng.normal(size=N).cumsum() * 0.01, 2),
+        'close_1': np.round(1 + rng.normal(size=N).cumsum() * 0.01, 2),
+    })
+    regressionThreshold = rng.uniform(0, 1.5)
+    distanceThreshold = rng.uniform(0, 1)
+    forwardCounts = int(rng.integers(2, 8))
+
+    expected = _loop_special_points(distances, data, regressionThreshold, distanceThreshold, forwardCounts)
+    actual = find_special_points(distances, data['close_0'].to_numpy(), data['close_1'].to_numpy(),
+                                 regressionThreshold, distanceThreshold, forwardCounts)
+    assert actual[0] == expected[0]
+    assert actual[1] == expected[1]
+    assert actual[2:] == expected[2:]
+
+
+def test_trades_do_not_overlap():
+    rng = np.random.default_rng(1)
+    distances = rng.normal(size=500)
+    close = 1 + rng.normal(size=500).cumsum() * 0.01
+
+    trades = simulate_trades(distances, close, close, 0.5, 0.3)
+    assert np.all(np.abs(distances[trades['index']]) > 0.5)
+    # every entry starts after the end of the previous trade
+    assert np.all(trades['index'][1:] >= (trades['index'] + trades['holding'])[:-1])
+
+
+def test_entry_mask_only_removes_entries():
+    rng = np.random.default_rng(1)
+    distances = rng.normal(size=500)
+    close = 1 + rng.normal(size=500).cumsum() * 0.01
+    entryMask = rng.random(500) < 0.5
+
+    trades = simulate_trades(distances, close, close, 0.5, 0.3, entryMask=entryMask)
+    assert entryMask[trades['index']].all()
+    assert np.all(np.abs(distances[trades['index']]) > 0.5)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import rolling
+from signals import simulate_trades
+from streaming import StreamingPairEngine
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_streaming_trades_match_batch(seed):
+    rng = np.random.default_rng(seed)
+    N, W, forwardCounts = 1500, int(rng.integers(5, 40)), int(rng.integers(2, 8))
+    common = rng.normal(0, 1e-3, N)
+    close0 = np.exp(np.cumsum(common + rng.normal(0, 5e-4, N)))
+    close1 = np.exp(np.cumsum(0.8 * common + rng.normal(0, 5e-4, N)))
+    regressionThreshold, distanceThreshold = rng.uniform(1e-4, 1e-3), rng.uniform(0.1, 1)
+
+    engine = StreamingPairEngine(W, regressionThreshold, distanceThreshold, forwardCounts)
+    streamed = [trade for c0, c1 in zip(close0, close1) for trade in engine.update(c0, c1)]
+
+    # batch distances from the first complete regression window, closes aligned with them
+    x, y = np.diff(np.log(close0)), np.diff(np.log(close1))
+    distances = rolling.rolling_distances(x, y, W, modes=('perpendicular',))['perpendicular'][W-1:]
+    batch = simulate_trades(distances, close0[W:], close1[W:], regressionThreshold, distanceThreshold, forwardCounts)
+
+    # the batch simulator has no entries in the last forwardCounts bars, the engine does
+    streamed = [trade for trade in streamed if trade['index'] < len(distances) - forwardCounts]
+    assert len(streamed) == len(batch['index'])
+    for name in ('index', 'direction', 'win', 'holding', 'leg0_win', 'leg1_win'):
+        np.testing.assert_array_equal([trade[name] for trade in streamed], batch[name])
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from backtester import EXIT_TP, EXIT_SL
+from ticks import merge_ticks, tick_backtest
+
+SECOND = 1_000_000_000
+
+
+def _stream(times, bids, splits):
+    times = np.array(times, dtype=np.int64)
+    bids = np.array(bids, dtype=np.float64)
+    return [{'time': t, 'bid': b, 'ask': b + 0.5}
+            for t, b in zip(np.split(times, splits), np.split(bids, splits))]
+
+
+def _merge(ticks0, ticks1):
+    chunks = list(merge_ticks(ticks0, ticks1))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+@pytest.mark.parametrize('splits0, splits1', [([], []), ([2], [1]), ([1, 3], [2]), ([3], [1, 2])])
+def test_merge_ticks_with_equal_times(splits0, splits1):
+    # the first tick of symbol 0 (before symbol 1 has quoted) is dropped, and at the equal
+    # times 2 and 3 the tick of symbol 0 comes first
+    ticks0 = _stream([1, 2, 3, 5], [10, 11, 12, 13], splits0)
+    ticks1 = _stream([2, 3, 4, 6], [20, 21, 22, 23], splits1)
+
+    merged = _merge(ticks0, ticks1)
+    np.testing.assert_array_equal(merged['time'], [2, 3, 3, 4, 5, 6])
+    np.testing.assert_array_equal(merged['bid_0'], [11, 12, 12, 12, 13, 13])
+    np.testing.assert_array_equal(merged['bid_1'], [20, 20, 21, 22, 22, 23])
+    np.testing.assert_array_equal(merged['ask_0'], merged['bid_0'] + 0.5)
+    np.testing.assert_array_equal(merged['ask_1'], merged['bid_1'] + 0.5)
+
+
+def _ticks(rows, split):
+    # rows of (seconds, bid_0, bid_1), with a spread of 0.0002 on both symbols
+    time, bid0, bid1 = np.array(rows, dtype=np.float64).T
+    chunk = {'time': (time * SECOND).astype(np.int64), 'bid_0': bid0, 'ask_0': bid0 + 0.0002,
+             'bid_1': bid1, 'ask_1': bid1 + 0.0002}
+    return [{name: values[:split] for name, values in chunk.items()},
+            {name: values[split:] for name, values in chunk.items()}]
+
+
+@pytest.mark.parametrize('split', [3, 5])
+def test_tick_backtest_one_trade(split):
+    ticks = _ticks([
+        (0,   1.000, 2.000),        # closes of the 4 bars of the first regression window
+        (60,  1.001, 2.003),
+        (120, 1.003, 2.002),
+        (180, 1.002, 2.006),        # distance -0.0002: sell the first asset, buy the second one
+        (240, 1.000, 2.000),        # entry: short at the bid 1.0, long at the ask 2.0002
+        (250, 0.9976, 2.000),       # ask 0.9978 beyond the TP 0.998 of the short leg
+        (260, 0.9976, 1.999),       # bid below the SL 1.9992 of the long leg
+    ], split)
+    result = tick_backtest(ticks, timeframe_seconds=60, LoopbackBars=3, regressionThreshold=1e-4,
+                           SLpoints=100, point=1e-5, rewardToRisk=2.0, hedge=False, balance=10000.0)
+    trades = result['trades']
+
+    assert result['ticks'] == 7
+    assert result['bars'] == 4
+    np.testing.assert_array_equal(trades['entry_time'], [240 * SECOND])
+    np.testing.assert_array_equal(trades['direction'], [-1])
+    np.testing.assert_allclose(trades['units'], [[50000, 50000]])
+    np.testing.assert_allclose(trades['entry_price'], [[1.0, 2.0002]])
+    np.testing.assert_array_equal(trades['exit_time'], [[250 * SECOND, 260 * SECOND]])
+    np.testing.assert_array_equal(trades['exit_reason'], [[EXIT_TP, EXIT_SL]])
+    np.testing.assert_allclose(trades['exit_price'], [[0.9978, 1.999]])
+    np.testing.assert_allclose(trades['pnl'], [[110, -60]])
+    np.testing.assert_allclose(result['balance'], [10050])
+
+
+def test_unknown_tick_risk_option():
+    with pytest.raises(ValueError):
+        tick_backtest([], riskOption='ATR')
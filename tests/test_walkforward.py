@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtester
+import rolling
+from walkforward import PRICE_COLUMNS, walk_forward
+
+
+def _pair_data(N, seed=0):
+    rng = np.random.default_rng(seed)
+    common = rng.normal(size=N) * 1e-3
+    data = {}
+    for k in range(2):
+        returns = common + rng.normal(size=N) * 5e-4
+        close = 1.0 + k + np.exp(np.cumsum(returns))
+        open_ = np.concatenate(([close[0]], close[:-1]))
+        wick = np.abs(rng.normal(size=N)) * 3e-4
+        data[f'open_{k}'] = open_
+        data[f'high_{k}'] = np.maximum(open_, close) + wick
+        data[f'low_{k}'] = np.minimum(open_, close) - wick
+        data[f'close_{k}'] = close
+        data[f'log_return_{k}'] = np.log(close / open_)
+    return pd.DataFrame(data).iloc[1:]
+
+
+def test_stitched_equity_matches_the_folds():
+    data = _pair_data(800)
+    balance = 10000.0
+    kwargs = {'SLpoints': 50, 'spread': 1e-5, 'maxBars': 20}
+    folds, equity = walk_forward(data, [5, 10], [0.0005, 0.001, 0.002], trainBars=300, testBars=100,
+                                 balance=balance, max_workers=2, **kwargs)
+
+    # the equity covers exactly the test folds, the last one being cut at the end of the data
+    assert folds['test_start'].tolist() == [300, 400, 500, 600, 700]
+    assert folds['test_end'].tolist() == [400, 500, 600, 700, 799]
+    np.testing.assert_array_equal(equity.index, data.index[300:])
+    assert folds['test_trades'].sum() > 0
+
+    x = data['log_return_0'].to_numpy()
+    y = data['log_return_1'].to_numpy()
+    current = balance
+    for fold in folds.itertuples():
+        # the test fold alone, with the parameters chosen on its train fold, from the balance at its start
+        stats = rolling.rolling_distances(x, y, fold.LoopbackBars, modes=('perpendicular',))
+        test = slice(fold.test_start, fold.test_end)
+        fold_data = {name: data[name].to_numpy()[test] for name in PRICE_COLUMNS}
+        fold_data['distance'] = stats['perpendicular'][test]
+        fold_data['slope'] = stats['slope'][test]
+        result = backtester.backtest(fold_data, fold.regressionThreshold, balance=current, **kwargs)
+
+        np.testing.assert_allclose(equity.iloc[fold.test_start - 300:fold.test_end - 300], result['equity'])
+        np.testing.assert_allclose(current * (1 + fold.test_return), result['equity'][-1])
+        current = result['equity'][-1]
+    assert equity.iloc[-1] == pytest.approx(balance * np.prod(1 + folds['test_return']))
+
+
+def test_unknown_objective():
+    with pytest.raises(ValueError):
+        walk_forward(_pair_data(100), [5], [0.001], objective='sharpe')
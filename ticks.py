@@ -0,0 +1,279 @@
+import numpy as np
+import pandas as pd
+from backtester import position_units, EXIT_TP, EXIT_SL, EXIT_TIME
+from streaming import StreamingPairEngine
+
+TICK_RISK_OPTIONS = ('Constant', 'Regression')
+
+
+def _tick_time(values, unit):
+    """Tick times as int64 nanoseconds, from epoch numbers in `unit` or datetimes/strings."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iuf':
+        return (values * pd.Timedelta(1, unit=unit).value).astype(np.int64)
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def read_ticks(
+        path,
+        chunksize = 1_000_000,
+        time_column = 'time_msc',
+        unit = 'ms',
+        ):
+    """
+    Stream the bid/ask ticks of a file in chunks, so a long tick history is never loaded at once.
+
+    Supported files:
+        .parquet        read by row groups/batches (pyarrow)
+        .npy            structured array with time/bid/ask fields, memory-mapped
+        .csv (also compressed: .csv.gz, .csv.bz2, .csv.xz, .csv.zip) read in chunks
+
+    Parameters:
+        path (str): Tick file, sorted by time (e.g. an export of MT5 copy_ticks_range).
+        chunksize (int): Ticks per chunk.
+        time_column (str): Column with the tick time, epoch numbers in `unit` or datetimes.
+        unit (str): Unit of numeric times ('ms' for MT5 time_msc, 's' for MT5 time).
+
+    Yields:
+        dict of np.ndarray: 'time' (int64 ns), 'bid', 'ask' (float64).
+    """
+    columns = [time_column, 'bid', 'ask']
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        batches = (batch.to_pandas() for batch in
+                   pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns))
+    elif path.endswith('.npy'):
+        ticks = np.load(path, mmap_mode='r')
+        batches = (ticks[start:start+chunksize] for start in range(0, len(ticks), chunksize))
+    else:
+        batches = pd.read_csv(path, usecols=columns, chunksize=chunksize, compression='infer')
+
+    for batch in batches:
+        yield {
+            'time': _tick_time(batch[time_column], unit),
+            'bid':  np.asarray(batch['bid'], dtype=np.float64),
+            'ask':  np.asarray(batch['ask'], dtype=np.float64),
+        }
+
+
+def merge_ticks(ticks0, ticks1):
+    """
+    Merge two tick streams by time (two-pointer merge on chunks). Every merged tick carries the
+    last bid/ask of both symbols (as of that tick); the ticks before both symbols have quoted
+    are dropped. On equal times the tick of the first symbol comes first.
+    Only the current chunk of each stream is held in memory.
+
+    Parameters:
+        ticks0, ticks1 (iterables): Chunks of read_ticks for the two symbols.
+
+    Yields:
+        dict of np.ndarray: 'time', 'bid_0', 'ask_0', 'bid_1', 'ask_1'.
+    """
+    streams = [iter(ticks0), iter(ticks1)]
+    buffers = [None, None]
+    done = [False, False]
+    last = [np.array([np.nan, np.nan]), np.array([np.nan, np.nan])]
+
+    while True:
+        for k in range(2):
+            while not done[k] and (buffers[k] is None or len(buffers[k]['time']) == 0):
+                buffers[k] = next(streams[k], None)
+                done[k] = buffers[k] is None
+        alive = [k for k in range(2) if buffers[k] is not None and len(buffers[k]['time'])]
+        if not alive:
+            return
+
+        # everything up to the last time of the buffer that ends first can be merged safely
+        bound = min(buffers[k]['time'][-1] for k in range(2) if not done[k]) \
+            if not all(done) else np.iinfo(np.int64).max
+        taken = []
+        for k in range(2):
+            if k not in alive:
+                taken.append({'time': np.empty(0, dtype=np.int64), 'bid': np.empty(0), 'ask': np.empty(0)})
+                continue
+            n = np.searchsorted(buffers[k]['time'], bound, side='right')
+            taken.append({name: values[:n] for name, values in buffers[k].items()})
+            buffers[k] = {name: values[n:] for name, values in buffers[k].items()}
+
+        time = np.concatenate((taken[0]['time'], taken[1]['time']))
+        # the two sorted runs are merged in linear time by the stable sort (timsort)
+        order = np.argsort(time, kind='stable')
+        is1 = order >= len(taken[0]['time'])
+        merged = {'time': time[order]}
+        for k, mask in enumerate((~is1, is1)):
+            # position of the last tick of symbol k at or before every merged tick (0 = carried)
+            pos = np.cumsum(mask)
+            for j, name in enumerate(('bid', 'ask')):
+                values = np.concatenate((last[k][j:j+1], taken[k][name]))
+                merged[f'{name}_{k}'] = values[pos]
+                last[k][j] = values[-1]
+
+        started = ~(np.isnan(merged['bid_0']) | np.isnan(merged['bid_1']))
+        if not started.all():
+            merged = {name: values[started] for name, values in merged.items()}
+        if len(merged['time']):
+            yield merged
+
+
+def _first_exit(side, bid, ask, sl, tp):
+    """First tick where the SL or TP of a leg is hit (longs exit at the bid, shorts at the ask)."""
+    price = bid if side > 0 else ask
+    hit_sl = price <= sl if side > 0 else price >= sl
+    hit_tp = price >= tp if side > 0 else price <= tp
+    hit = hit_sl | hit_tp
+    if not hit.any():
+        return None, None, None
+    k = int(np.argmax(hit))
+    return k, price[k], EXIT_SL if hit_sl[k] else EXIT_TP
+
+
+def tick_backtest(
+        ticks,
+        timeframe_seconds = 300,
+        LoopbackBars = 20,
+        regressionThreshold = 0.005,
+        riskOption = 'Constant',
+        riskPercentage = 1.0,
+        rewardToRisk = 2.0,
+        SLpoints = 100,
+        RegressionMultiplier = 1.0,
+        point = 1e-5,
+        commission = 0.0,
+        balance = 10000.0,
+        hedge = True,
+        entrySign = 1,
+        ):
+    """
+    Tick-level backtest of the pair strategy in bounded memory, like the EA in the strategy tester:
+    the merged ticks are grouped into bars of timeframe_seconds, every completed bar (bid closes)
+    updates a StreamingPairEngine, and on the first tick of a new bar both legs are opened at the
+    ask/bid when the distance of the completed bar is above the threshold and no position is open.
+    The SL/TP of each leg (see backtester.backtest, without the ATR option) are checked on every tick
+    and filled at the tick price. Only the current chunk of ticks is in memory.
+
+    Parameters:
+        ticks (iterable): Merged tick chunks, see merge_ticks.
+        timeframe_seconds (int): Bar size used by the signal.
+        point (float or pair): Point size of each symbol.
+        Other parameters: see backtester.backtest.
+
+    Returns:
+        dict: 'trades' (ledger of per-trade arrays, leg values have shape (trades, 2), times in
+        int64 ns), 'balance' (after each trade), 'ticks' and 'bars' (counts).
+    """
+    if riskOption not in TICK_RISK_OPTIONS:
+        raise ValueError(f"Unknown risk option: {riskOption} (available: {TICK_RISK_OPTIONS})")
+    point = (point, point) if np.ndim(point) == 0 else tuple(point)
+    bar_ns = int(timeframe_seconds * 1e9)
+    engine = StreamingPairEngine(LoopbackBars, regressionThreshold)
+
+    ledger = {name: [] for name in ['entry_time', 'exit_time', 'direction', 'units', 'entry_price',
+                                    'exit_price', 'exit_reason', 'pnl', 'commission']}
+    balances = []
+    realized = balance
+    position = None
+    last_bar = None
+    last_close = None
+    n_ticks = n_bars = 0
+
+    def close_position(position):
+        nonlocal realized
+        sides = np.array(position['sides'])
+        pnl = sides * position['units'] * (position['exit_price'] - position['entry_price'])
+        fees = commission * position['units'] * (position['entry_price'] + position['exit_price'])
+        realized += pnl.sum() - fees.sum()
+        for name in ('entry_time', 'direction', 'units', 'entry_price', 'exit_time', 'exit_price', 'exit_reason'):
+            ledger[name].append(position[name])
+        ledger['pnl'].append(pnl)
+        ledger['commission'].append(fees)
+        balances.append(realized)
+
+    for chunk in ticks:
+        time = chunk['time']
+        n = len(time)
+        n_ticks += n
+        bid = (chunk['bid_0'], chunk['bid_1'])
+        ask = (chunk['ask_0'], chunk['ask_1'])
+        bar = time // bar_ns
+        # first tick of every new bar in the chunk
+        starts = np.flatnonzero(np.diff(bar, prepend=bar[0] if last_bar is None else last_bar))
+
+        cursor = 0
+        for s in list(starts) + [n]:
+            # SL/TP of the open legs on the ticks of the current bar
+            if position is not None and cursor < s:
+                for k in range(2):
+                    if position['exit_reason'][k] is not None:
+                        continue
+                    hit, price, reason = _first_exit(position['sides'][k], bid[k][cursor:s], ask[k][cursor:s],
+                                                     position['sl'][k], position['tp'][k])
+                    if hit is not None:
+                        position['exit_time'][k] = time[cursor + hit]
+                        position['exit_price'][k] = price
+                        position['exit_reason'][k] = reason
+                if all(reason is not None for reason in position['exit_reason']):
+                    close_position(position)
+                    position = None
+            if s == n:
+                break
+
+            # bar completed: its close is the previous tick
+            close = (bid[0][s-1], bid[1][s-1]) if s > 0 else last_close
+            if close is not None:
+                engine.update(close[0], close[1])
+                n_bars += 1
+            cursor = s
+            if position is not None or engine.signal == 0:
+                continue
+
+            # open both legs on the first tick of the new bar
+            direction = entrySign * engine.signal
+            sides = (direction, -direction)
+            entry = np.array([ask[k][s] if sides[k] > 0 else bid[k][s] for k in range(2)])
+            if riskOption == 'Constant':
+                sl_dist = np.array([SLpoints * point[0], SLpoints * point[1]])
+            else:
+                sl_dist = RegressionMultiplier * abs(engine.distance) * entry
+            if not np.all(sl_dist > 0) or not np.isfinite(engine.slope) or realized <= 0:
+                continue
+            position = {
+                'entry_time':   time[s],
+                'direction':    direction,
+                'sides':        sides,
+                'units':        position_units(realized, riskPercentage, sl_dist, entry, engine.slope, hedge),
+                'entry_price':  entry,
+                'sl':           entry - np.array(sides) * sl_dist,
+                'tp':           entry + np.array(sides) * rewardToRisk * sl_dist,
+                'exit_time':    np.zeros(2, dtype=np.int64),
+                'exit_price':   np.zeros(2),
+                'exit_reason':  [None, None],
+            }
+            cursor = s + 1
+
+        last_bar = bar[-1]
+        last_close = (bid[0][-1], bid[1][-1])
+        last_tick = (time[-1], ask[0][-1], ask[1][-1])
+
+    if position is not None:
+        # the legs still open are closed on the last tick
+        for k in range(2):
+            if position['exit_reason'][k] is None:
+                position['exit_time'][k] = last_tick[0]
+                position['exit_price'][k] = last_close[k] if position['sides'][k] > 0 else last_tick[1 + k]
+                position['exit_reason'][k] = EXIT_TIME
+        close_position(position)
+
+    trades = {}
+    for name, values in ledger.items():
+        if name in ('entry_time', 'direction'):
+            trades[name] = np.array(values, dtype=np.int64)
+        elif name in ('exit_time', 'exit_reason'):
+            trades[name] = np.array(values, dtype=np.int64).reshape(-1, 2)
+        else:
+            trades[name] = np.array(values, dtype=np.float64).reshape(-1, 2)
+    return {
+        'trades':   trades,
+        'balance':  np.array(balances),
+        'ticks':    n_ticks,
+        'bars':     n_bars,
+    }
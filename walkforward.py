@@ -0,0 +1,198 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import rolling
+import backtester
+
+# price columns of the pair DataFrame (as built in LinearRegression.py) shared with the workers
+PRICE_COLUMNS = [f'{name}_{k}' for k in range(2) for name in ('open', 'high', 'low', 'close')]
+
+# score of a backtest result on a train fold (higher is better)
+OBJECTIVES = {
+    'net_profit':       lambda result: result['net_profit'],
+    'profit_drawdown':  lambda result: result['net_profit'] / max(-result['max_drawdown'], 1e-12),
+}
+
+# worker state, set once per process by _init_worker
+_shm = None
+_arrays = None
+_windows = None
+_columns = None
+
+
+def _init_worker(shm_name, shape, windows, columns):
+    global _shm, _arrays, _windows, _columns
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _arrays = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _windows = windows
+    _columns = columns
+
+
+def _backtest_columns(backtest_kwargs):
+    """Columns of the pair data read by backtester.backtest besides the prices: ATR_k for
+    riskOption='ATR' and the per-bar spreads when `spread` is a column name."""
+    columns = []
+    if backtest_kwargs.get('riskOption') == 'ATR':
+        columns += ['ATR_0', 'ATR_1']
+    if isinstance(backtest_kwargs.get('spread'), str):
+        columns += [f"{backtest_kwargs['spread']}_{k}" for k in range(2)]
+    return columns
+
+
+def _fold_data(w, start, stop):
+    """Views of the shared columns and of the distance/slope of the w-th window on the bars [start, stop)."""
+    data = {name: _arrays[k, start:stop] for k, name in enumerate(_columns)}
+    offset = len(_columns) + 2 * w
+    data['distance'] = _arrays[offset, start:stop]
+    data['slope'] = _arrays[offset + 1, start:stop]
+    return data
+
+
+def _run_fold(fold, train, test, regressionThreshold, objective, backtest_kwargs):
+    # the rolling statistics of every window are shared: only the thresholds are looped per window
+    best = None
+    for w, window in enumerate(_windows):
+        data = _fold_data(w, *train)
+        for threshold in regressionThreshold:
+            score = OBJECTIVES[objective](backtester.backtest(data, threshold, balance=1.0, **backtest_kwargs))
+            if best is None or score > best[0]:
+                best = (score, w, window, threshold)
+    score, w, window, threshold = best
+
+    result = backtester.backtest(_fold_data(w, *test), threshold, balance=1.0, **backtest_kwargs)
+    summary = {
+        'fold':                 fold,
+        'train_start':          train[0],
+        'train_end':            train[1],
+        'test_start':           test[0],
+        'test_end':             test[1],
+        'LoopbackBars':         window,
+        'regressionThreshold':  threshold,
+        'train_score':          score,
+        'test_return':          result['net_profit'],
+        'test_max_drawdown':    result['max_drawdown'],
+        'test_trades':          len(result['trades']['entry_bar']),
+    }
+    return summary, result['equity']
+
+
+def walk_forward(
+        data,
+        LoopbackBars,
+        regressionThreshold,
+        trainBars = 5000,
+        testBars = 1000,
+        distanceMode = 'perpendicular',
+        objective = 'net_profit',
+        balance = 10000.0,
+        max_workers = None,
+        **backtest_kwargs,
+        ):
+    """
+    Walk-forward optimization: the history is split into rolling folds of trainBars bars followed
+    by testBars bars (the folds move by testBars). On each train fold the parameter grid is
+    backtested (backtester.backtest) and the best combination by `objective` is backtested on
+    the following test fold. The test folds are stitched into one out-of-sample equity curve.
+
+    The rolling regression and distance only use past bars, so they are computed once per
+    LoopbackBars on the whole history and shared by all folds and thresholds. The folds run in
+    a process pool and read the arrays in place from shared memory.
+
+    Parameters:
+        data (pd.DataFrame): Pair data with the columns log_return_k and open_k/high_k/low_k/close_k
+            for k = 0, 1 (without NaN, e.g. the `data` frame of LinearRegression.py), and ATR_k
+            with riskOption='ATR' or the spread columns when `spread` is a column name.
+        LoopbackBars, regressionThreshold (iterable): Values of the grid.
+        trainBars, testBars (int): Length of the train and test folds.
+        distanceMode (str): 'perpendicular', 'vertical' or 'zscore' (see rolling.rolling_distances).
+        objective (str): Name of the train score, see OBJECTIVES.
+        balance (float): Initial balance of the stitched equity curve.
+        max_workers (int): Number of processes (default: number of cores).
+        **backtest_kwargs: Risk and cost parameters of backtester.backtest.
+
+    Returns:
+        folds (pd.DataFrame): Parameters chosen on every train fold and their test results
+            (test_return is relative to the balance at the start of the fold).
+        equity (pd.Series): Stitched out-of-sample equity, indexed like `data`.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective} (available: {list(OBJECTIVES)})")
+    windows = [int(window) for window in LoopbackBars]
+    regressionThreshold = list(regressionThreshold)
+    N = len(data)
+    columns = PRICE_COLUMNS + _backtest_columns(backtest_kwargs)
+    missing = [name for name in columns if name not in data.columns]
+    if missing:
+        raise ValueError(f"The backtest options need the columns {missing}, which are not in `data`")
+
+    x = data['log_return_0'].to_numpy(dtype=np.float64)
+    y = data['log_return_1'].to_numpy(dtype=np.float64)
+    spread = (data['close_0'] - data['close_1']).to_numpy(dtype=np.float64)
+    shape = (len(columns) + 2 * len(windows), N)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        arrays = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        arrays[:len(columns)] = data[columns].to_numpy(dtype=np.float64).T
+        for w, window in enumerate(windows):
+            stats = rolling.rolling_distances(x, y, window, spread=spread, modes=(distanceMode,))
+            arrays[len(columns) + 2 * w] = stats[distanceMode]
+            arrays[len(columns) + 2 * w + 1] = stats['slope']
+        del arrays
+
+        folds = []
+        start = 0
+        while start + trainBars < N:
+            train = (start, start + trainBars)
+            test = (start + trainBars, min(start + trainBars + testBars, N))
+            folds.append((train, test))
+            start += testBars
+
+        with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(shm.name, shape, windows, columns),
+                ) as executor:
+            futures = [
+                executor.submit(_run_fold, fold, train, test, regressionThreshold, objective, backtest_kwargs)
+                for fold, (train, test) in enumerate(folds)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # each test fold starts from a balance of 1: the sizing is proportional to the balance, so the
+    # folds are chained by scaling each curve with the balance at the end of the previous fold
+    equity = np.full(N, np.nan)
+    current = balance
+    for summary, fold_equity in results:
+        equity[summary['test_start']:summary['test_end']] = current * fold_equity
+        current *= fold_equity[-1]
+
+    folds = pd.DataFrame([summary for summary, _ in results])
+    return folds, pd.Series(equity, index=data.index, name='equity').dropna()
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+    import functions as fns
+
+    symbol = ['EURUSD', 'GBPUSD']
+    data0 = fns.GetPriceData(symbol[0], datetime(2024, 10, 9, 10), 'M5', 50000, source='synthetic')
+    data1 = fns.GetPriceData(symbol[1], datetime(2024, 10, 9, 10), 'M5', 50000, source='synthetic')
+    data = pd.DataFrame({
+        f'{column}_{k}': rates[column].to_numpy()
+        for k, rates in enumerate((data0, data1))
+        for column in ('open', 'high', 'low', 'close', 'log_return')
+    }).dropna()
+
+    folds, equity = walk_forward(
+        data,
+        LoopbackBars=[10, 20, 50],
+        regressionThreshold=np.linspace(0.0005, 0.005, 10),
+        spread=2e-5,
+        maxBars=50,
+        )
+    print(folds)
+    print(equity.iloc[[0, -1]])